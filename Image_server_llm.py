@@ -1,6 +1,5 @@
 import os
 import json
-import requests
 import base64
 import logging
 from pathlib import Path
@@ -10,6 +9,13 @@ import datetime
 import traceback
 import sys
 from dotenv import load_dotenv
+from ollama_client import OllamaClient, OLLAMA_STREAM
+from keyword_matcher import extract_keywords
+from categories import SUPABASE_CATEGORIES as CATEGORIES, supabase_category_matcher as category_matcher
+from file_scanner import FileManifest, IncrementalScanner
+from content_index import ContentHashIndex
+from supabase_writer import BufferedUpsertWriter, ArchiveIndex
+from results_log import ResultsLog
 
 # Load environment variables from .env file if present
 load_dotenv()
@@ -24,190 +30,96 @@ if not NETWORK_PATH or not SUPABASE_URL or not SUPABASE_KEY:
     print("❌ Missing required environment variables. Please set NETWORK_PATH, SUPABASE_URL, and SUPABASE_KEY in your environment or .env file.")
     sys.exit(1)
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Initialize pooled Ollama client (backends from OLLAMA_BACKENDS)
+ollama_client = OllamaClient()
 
-CATEGORIES = {
-    "exterior_warehouse": ["warehouse exterior", "trucks",  "car", "parking", "tree", "building",  "warehouse", "parking lot",  "building", "tree", "clear sky", "sidewalk", "space", "glass door", "car", "entrance", "outdoor",  "clear", "warehouse building", "solar panel", "sky", "roof", "exterior", "flat roof", "open space", "birds eye view", "outside", "commercial building", "eye", "open", "view", "large", "storage facility", "space", "flat", "concrete surface", "loading dock", "shipping area", "receiving area", "exterior", "concrete floors", "metal beams", "industrial exterior", "warehouse facade", "vehicles", "distribution center exterior", "logistics facility exterior", "truck loading", "delivery bay", "warehouse compound"],
-    
-    "interior_warehouse": ["warehouse interior", "industrial area", "metal", "sheets", "high ceiling", "metal sheets", "aisle", "concrete floor", "unit",  "units","shelving",  "lights", "shelving units", "metal walls", "warehouse",  "industrial interior", "pallet jack", "interior", "metal walls",  "logistics", "distribution", "supply chain", "shelves", "storage unit", "warehouse shelves", "storage", "forklift", "forklifts", "cardboard boxes", "inventory", "pallets", "boxes", "stockroom", "fulfillment", "distribution center", "high-bay racking", "ceiling", "conveyor system", "bulk storage", "cross-docking", "material handling", "shelving units", "pallet racks", "staging area", "warehouse aisles", "storage shelves", "storage", "warehouse floor", "fork lift"],
-    
-    "interior_office": ["office interior", "office", "workspace", "modern office", "basketball", "hoop", "stylish office", "elegant office", "sophisticated office", "chairs", "desk", "chair", "table", "office furniture", "office supplies", "office equipment", "cabinet","recreation room", "game room", "pool table", "billiard table", "recreation area", "storage", "shelving", "blind shade", "floor lamp", "glass window", "windows", "blinds", "lobby", "reception", "reception area", "waiting area", "dining table", "entrance", "brand", "interior", "carpet", "modern", "computer", "tv", "workspace", "stylish", "elegant", "white walls", "sophisticated", "staircase", "wood", "wood flooring", "stairs", "furniture"],
-    
-    "conference_room": ["conference room", "meeting room", "boardroom", "video conference", "conference table", "office meeting", "presentation room", "projector", "screen", "TV", "whiteboard", "seating", "chairs", "desk", "long table", "glass walls", "interior office", "office meeting space", "corporate meeting", "roundtable", "monitor", "remote meeting", "speakerphone", "teleconference", "zoom meeting", "business meeting", "formal seating", "presentation screen", "conference setup", "office chairs", "team meeting"],
-    
-    "parking_lot": ["parking lot", "parking", "parking area", "parking space", "cars", "vehicles", "parking lines", "outdoor parking", "parking facility", "car park", "parking garage", "vehicle parking", "parking spots", "parking structure", "pavement"],
-    
-    "unis": ["unis", "logistics solutions", "supply chain optimization", "global logistics", "transportation", "shipping", "truck", "trailer", "container", "cargo", "transport logistics", "logistics company", "freight", "delivery", "logistics services"],
-    
-    "breakroom": ["breakroom", "break room", "kitchen", "refrigerator", "sink", "coffee area", "lunch room", "employee kitchen", "cafeteria", "dining area", "microwave", "coffee machine", "kitchen appliances", "eating area", "staff kitchen", "break area"],
-    
-    "office_gym": ["office gym", "gym","workout room",  "fitness facility", "gym equipment", "treadmill", "elliptical", "weight room", "strength training", "cardio equipment", "exercise machines", "fitness studio", "workout area","gymnasium", "athletic facility"],
-    
-    "bathroom": ["bathroom", "restroom", "washroom", "toilet", "lavatory", "public restroom", "employee restroom", "facilities", "WC", "powder room", "men's room", "women's room", "unisex bathroom"],
-    
-    "company": ["corporate", "business", "startup", "enterprise", "organization", "firm", "management", "industry experts"],
-    
-    "e-commerce": ["online shopping", "e-commerce", "retail", "dropshipping", "marketplace", "digital store", "checkout", "cart", "customer orders"],
-    
-    "support": ["customer service", "helpdesk", "technical support", "assistance", "troubleshooting", "service center"],
-    
-    "resources": ["training", "learning materials", "guides", "knowledge base", "industry insights", "best practices"],
-    
-    "tracking_technology_platform": ["tracking", "gps", "rfid", "iot sensors", "analytics", "real-time monitoring", "asset tracking"],
-    
-    "marketing": ["advertising", "logo", "signage", "work", "blazer", "blonde", "blonde hair", "white jacket" , "woman", "high heels", "red dress", "sunglasses", "cube work", "sign", "sticker" ,"toy fork lift", "toy", "model", "toy forklift", "toy model", " remote control toy car", "lego truck", "miniature", "scale model", "polo shirt", "branded apparel", "promotional item",  "branded", "shirt", "black polo shirt", "black shirt", "embroidered","embroidered text", "logo on shirt", "polo", "cube work shirt", "t-shirt", "promotion", "branding", "social media", "marketing campaign", "seo", "content marketing", "email marketing"],
-    
-    "warehousing": ["logistics hub", "inventory management"],
-    
-    "item_com": ["item.com", "e-commerce solutions", "supply chain automation", "digital commerce"],
-}
+supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 def get_image_description(image_path: str) -> Optional[str]:
     """Get AI-generated description using llama3.2-vision with a focus on concise, comma-separated keywords"""
-    max_retries = 3
+    max_retries = 3  # Attempts are spread across backends by the client
     base_timeout = 300  # Increased timeout for larger images
+    max_keywords = 35
 
-    for attempt in range(max_retries):
-        try:
-            print(f"📤 Reading image file: {image_path}")
-            with open(image_path, "rb") as image_file:
-                image_data = image_file.read()
-                print(f"📊 Image size: {len(image_data) / (1024*1024):.2f} MB")
-                base64_image = base64.b64encode(image_data).decode('utf-8')
-            
-            payload = {
-                "model": "llava",
-                "prompt": """Provide a list of keywords from the image, formatted as: keyword1, keyword2, keyword3, etc.
+    try:
+        print(f"📤 Reading image file: {image_path}")
+        with open(image_path, "rb") as image_file:
+            image_data = image_file.read()
+            print(f"📊 Image size: {len(image_data) / (1024*1024):.2f} MB")
+            base64_image = base64.b64encode(image_data).decode('utf-8')
+        
+        payload = {
+            "model": "llava",
+            "prompt": """Provide a list of keywords from the image, formatted as: keyword1, keyword2, keyword3, etc.
     Focus on the most prominent elements, limiting to 35 words. No introductory text, bullet points, or narrative.
     Be specific about location type: specify if it's interior or exterior for warehouses and offices.
     Be specific about object size: if the forklift is miniature/toy or full-size.
     Include any visible text, logos, or branding.""",
-                "stream": False,
-                "images": [base64_image]
-            }
+            "stream": OLLAMA_STREAM,
+            "images": [base64_image]
+        }
 
-            print("🔄 Sending request to Ollama server...")
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json=payload,
-                timeout=base_timeout
-            )
-            
-            if response.status_code == 200:
-                description = response.json().get('response', '').strip()
-                print(f"🔎 Raw model output: {description}")
+        print("🔄 Sending request to Ollama server...")
+        if OLLAMA_STREAM:
+            # Stop the generation as soon as the keyword limit is reached
+            response = ollama_client.generate_stream(payload, timeout=base_timeout, max_attempts=max_retries, max_keywords=max_keywords)
+        else:
+            response = ollama_client.generate(payload, timeout=base_timeout, max_attempts=max_retries)
+        
+        if response is not None:
+            description = response.get('response', '').strip()
+            print(f"🔎 Raw model output: {description}")
+            if response.get('time_to_first_token') is not None:
+                print(f"⏱️  Time to first token: {response['time_to_first_token']:.2f}s")
+            if response.get('stopped_early'):
+                print(f"✂️  Stopped generation after {max_keywords} keywords")
 
-                # Post-process to ensure format and limit
-                keywords = [kw.strip() for kw in description.split(',') if kw.strip()]
-                
-                # Limit to 35 keywords as specified
-                keywords = keywords[:35]
-                
-                return ', '.join(keywords)
+            # Post-process to ensure format and limit
+            keywords = [kw.strip() for kw in description.split(',') if kw.strip()]
             
-            else:
-                print(f"❌ Error: HTTP {response.status_code} - {response.text}")
+            # Limit to 35 keywords as specified
+            keywords = keywords[:max_keywords]
+            
+            return ', '.join(keywords)
 
-        except requests.exceptions.Timeout:
-            print(f"⚠️ Timeout occurred on attempt {attempt + 1}/{max_retries}")
-            if attempt < max_retries - 1:
-                print("Retrying...")
-        
-        except Exception as e:
-            print(f"❌ Description error on attempt {attempt + 1}/{max_retries}: {str(e)}")
-            print(f"Error details: {traceback.format_exc()}")
-            if attempt < max_retries - 1:
-                print("Retrying...")
+    except Exception as e:
+        print(f"❌ Description error: {str(e)}")
+        print(f"Error details: {traceback.format_exc()}")
 
     print("❌ Failed to get description after multiple attempts")
     return None
 
-def categorize_image(description: str) -> Tuple[str, Dict[str, int]]:
+def categorize_image(description: str, verbose: bool = True) -> Tuple[str, Dict[str, int]]:
     """
     Categorize image based on description keywords
     Returns the category and a dictionary of match scores for debugging
     """
     if not description:
-        print("⚠️ Warning: Empty description provided to categorizer")
+        if verbose:
+            print("⚠️ Warning: Empty description provided to categorizer")
         return "interior_warehouse", {"empty_description": 1}
     
-    # Process description keywords - improved to handle various formats
-    description = description.lower()
     # Handle both comma-separated and space-separated keywords
-    description_keywords = set()
-    
-    # First try comma splitting
-    if ',' in description:
-        for kw in description.split(','):
-            kw = kw.strip()
-            if kw:
-                description_keywords.add(kw)
-                # Also add individual words for better matching
-                for word in kw.split():
-                    if len(word) > 2:  # Skip very short words
-                        description_keywords.add(word)
-    else:
-        # If no commas, just use word splitting
-        for word in description.split():
-            if len(word) > 2:  # Skip very short words
-                description_keywords.add(word)
-    
-    print(f"🔍 Extracted keywords: {', '.join(description_keywords)}")
+    description_keywords = extract_keywords(description)
+    if verbose:
+        print(f"🔍 Extracted keywords: {', '.join(description_keywords)}")
     
-    # Track match scores for each category
-    match_scores = {}
-    
-    for category, keywords in CATEGORIES.items():
-        # Process keywords in order, giving priority to longer/more specific keywords
-        sorted_keywords = sorted(keywords, key=len, reverse=True)
-        score = 0
-        matches = []
-        matched_keywords = set()  # Track what we've already matched
-        
-        for cat_keyword in sorted_keywords:
-            # Check if this keyword is already covered by a longer keyword we matched
-            already_covered = any(cat_keyword in longer_kw for longer_kw in matched_keywords)
-            
-            if not already_covered:
-                # Check if category keyword is a direct match
-                if cat_keyword in description_keywords:
-                    score += 2
-                    matches.append(cat_keyword)
-                    matched_keywords.add(cat_keyword)
-                else:
-                    # Check if category keyword appears within any description keyword
-                    for desc_keyword in description_keywords:
-                        if cat_keyword in desc_keyword:
-                            score += 1
-                            matches.append(f"{cat_keyword}(in {desc_keyword})")
-                            matched_keywords.add(cat_keyword)
-                            break
-        
-        # Special priority for UNIS category when "unis" is detected
-        if category == "unis" and "unis" in description_keywords:
-            score += 5  # Extra bonus for UNIS detection
-            matches.append("unis_priority_bonus")
-        
-        # Special bonus for toy/miniature terms in marketing category
-        if category == "marketing":
-            toy_miniature_terms = ['toy', 'miniature', 'model', 'scale model', 'toy model', 'miniature model', 'toy car', 'toy truck', 'toy forklift', 'remote control', 'lego']
-            for term in toy_miniature_terms:
-                if term in description_keywords:
-                    score += 4  # Add 4 points for each toy/miniature term
-                    matches.append(f"toy_miniature_bonus({term})")
-        
-        if score > 0:
-            match_scores[category] = score
-            print(f"  - Category '{category}' score: {score}, matches: {', '.join(matches)}")
+    # Score all categories in one pass over the compiled keyword table
+    match_scores, match_details = category_matcher.score(description_keywords, explain=verbose)
+    if verbose:
+        for category, score in match_scores.items():
+            print(f"  - Category '{category}' score: {score}, matches: {', '.join(match_details[category])}")
     
     # Find highest scoring category
     if match_scores:
-        best_category = max(match_scores.items(), key=lambda x: x[1])[0]
-        print(f"✅ Best category match: {best_category} with score {match_scores[best_category]}")
+        best_category = category_matcher.best_category(match_scores)
+        if verbose:
+            print(f"✅ Best category match: {best_category} with score {match_scores[best_category]}")
         return best_category, match_scores
     
     # Default category with explanation
-    print("⚠️ No category matches found in description")
+    if verbose:
+        print("⚠️ No category matches found in description")
     return "interior_warehouse", {"no_matches": 0}
 
 def get_xmp_data(image_path: str) -> dict:
@@ -267,7 +179,7 @@ def get_xmp_data(image_path: str) -> dict:
         print(f"Error getting XMP data: {e}")
         return {}
 
-def generate_clean_filename(category: str, description: str, xmp_data: dict, existing_files: set, original_extension: str = '.jpg', directory_path: str = None) -> str:
+def generate_clean_filename(category: str, description: str, xmp_data: dict, existing_files, original_extension: str = '.jpg', directory_path: str = None) -> str:
     """
     Generate a clean filename based on category, street, city, state, and zip code.
     If a file with the same name exists (in database or directory), append a number.
@@ -303,6 +215,10 @@ def generate_clean_filename(category: str, description: str, xmp_data: dict, exi
     filename = f"{base_filename}{original_extension}"
     counter = 1
     
+    # Look up the likely candidates in the database with one query instead of one per name
+    if hasattr(existing_files, 'prefetch'):
+        existing_files.prefetch([filename] + [f"{base_filename}_{n}{original_extension}" for n in range(1, 20)])
+    
     print(f"🔍 Checking filename availability for base: {base_filename}")
     
     while True:
@@ -409,12 +325,11 @@ def process_images_in_folder(folder_path: str):
         folder = Path(folder_path)
         print(f"\n📂 Processing folder: {folder}")
         
-        # Collect all image files (only JPG, JPEG, PNG - LLaVA supported formats)
+        # Collect new or changed image files (only JPG, JPEG, PNG - LLaVA supported formats);
+        # files recorded in the scan manifest as processed or skipped are not listed again
         image_extensions = {'.jpg', '.jpeg', '.png', '.cr2', '.dng'}
-        image_files = [
-            f for f in folder.rglob('*')
-            if f.is_file() and f.suffix.lower() in image_extensions
-        ]
+        manifest = FileManifest()
+        image_files = IncrementalScanner(manifest, image_extensions).scan(str(folder))
         
         total_files = len(image_files)
         processed_count = 0
@@ -425,27 +340,45 @@ def process_images_in_folder(folder_path: str):
         print(f"Total images found: {total_files}")
         print(f"Starting processing...\n")
         
-        results = []
+        # Results of images that made it into Supabase are appended to NDJSON
+        output_file = folder / 'processed_images.ndjson'
+        results_log = ResultsLog(output_file)
         
-        # Fetch already processed images from Supabase
-        archived_images = supabase.table('images').select('image_file').execute()
-        archived_image_files = {record['image_file'] for record in archived_images.data}
-        print(f"🗄️ Found {len(archived_image_files)} already processed images in database")
+        # Names already in Supabase are looked up per candidate filename, not loaded up front
+        archived_image_files = ArchiveIndex(supabase)
+        # Rows are written in batched upserts as processing goes
+        writer = BufferedUpsertWriter(supabase)
+        queued = []  # (row, original path, current path, content hash) waiting for the batch write
+        
+        # Content hash -> image_file index kept locally next to the scan manifest
+        content_index = ContentHashIndex()
 
         for image_path in image_files:
             processed_count += 1
             print(f"\n🖼️  Processing image {processed_count}/{total_files}")
             print(f"File: {image_path.name}")
             
-            # Check if image is already processed
-            if is_already_processed(image_path.name):
-                print(f"⏭️  Skipping already processed image: {image_path.name}")
-                skipped_count += 1
-                continue
-            
             # Skip DNG and CR2 files
             if image_path.suffix.lower() in ['.dng', '.cr2']:
                 print(f"⏭️  Skipping RAW file: {image_path.name}")
+                manifest.mark(str(image_path), 'skipped')
+                skipped_count += 1
+                continue
+            
+            # Skip byte-identical copies of images that are already stored
+            content_hash = content_index.hash(str(image_path))
+            if content_hash:
+                existing = content_index.claim(content_hash, str(image_path))
+                if existing:
+                    print(f"⏭️  Skipping duplicate content (same SHA-256 as {existing})")
+                    manifest.mark(str(image_path), 'skipped', content_hash)
+                    skipped_count += 1
+                    continue
+            
+            # Legacy fallback for images processed before content hashes were recorded
+            if is_already_processed(image_path.name):
+                print(f"⏭️  Skipping already processed image: {image_path.name}")
+                manifest.mark(str(image_path), 'skipped', content_hash)
                 skipped_count += 1
                 continue
                 
@@ -477,8 +410,10 @@ def process_images_in_folder(folder_path: str):
                 
                 # Rename the physical file
                 new_file_path = image_path.parent / new_filename
+                current_path = image_path
                 try:
                     image_path.rename(new_file_path)
+                    current_path = new_file_path
                     print(f"✅ Renamed file to: {new_filename}")
                     # Update the network path to reflect the new filename
                     relative_path = str(new_file_path.relative_to(Path(NETWORK_PATH)))
@@ -505,27 +440,23 @@ def process_images_in_folder(folder_path: str):
                         'processing_info': {
                             'has_description': bool(description),
                             'description_length': len(description.split(',')) if description else 0,
-                            'original_filename': image_path.name
+                            'original_filename': image_path.name,
+                            'content_sha256': content_hash
                         },
                         'category_matches': match_scores
                     }
                 }
 
-                # Upload to Supabase
-                print("☁️  Uploading to Supabase...")
-                result = supabase.table('images').insert(image_data).execute()
-                
-                if result.data:
-                    image_data['id'] = result.data[0].get('id')
-                    results.append(image_data)
-                    print("✅ Successfully processed and uploaded")
-                else:
-                    print("❌ Failed to upload to Supabase")
-                    failed_count += 1
+                # Queue for the next batched upsert to Supabase
+                print("☁️  Queued for Supabase upload")
+                writer.add(image_data)
+                queued.append((image_data, image_path, current_path, content_hash))
+                print("✅ Successfully processed")
 
             except Exception as e:
                 print(f"❌ Error: {str(e)}")
                 logging.error(traceback.format_exc())
+                manifest.mark(str(image_path), 'failed')
                 failed_count += 1
                 continue
             
@@ -539,39 +470,56 @@ def process_images_in_folder(folder_path: str):
             print(f"Success Rate: {(success_count/processed_count)*100:.1f}%" if processed_count > 0 else "N/A")
             print("-" * 50)
 
-        # Save results to JSON
-        if results:
-            output_file = folder / 'processed_images.json'
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
-            print(f"\n💾 Results saved to: {output_file}")
+        # Write the remaining rows, then record which images made it into Supabase
+        writer.close()
+        failed_rows = {id(row) for row in writer.failed}
+        for row, original_path, current_path, content_hash in queued:
+            if id(row) in failed_rows:
+                if content_hash:
+                    content_index.release(content_hash)
+                # No row was written for the new name: put the file back under its original name
+                if current_path != original_path:
+                    try:
+                        current_path.rename(original_path)
+                        current_path = original_path
+                        archived_image_files.discard(row['image_file'])
+                        print(f"↩️  Renamed back to {original_path.name} (not written to Supabase)")
+                    except Exception as e:
+                        print(f"⚠️ Could not rename {current_path.name} back to {original_path.name}: {e}")
+                manifest.mark(str(current_path), 'failed')
+                failed_count += 1
+                continue
+            if content_hash:
+                content_index.record(content_hash, row['image_file'])
+            # Remember the file (under its new name) so later scans skip it
+            manifest.rename(str(original_path), str(current_path), 'processed', content_hash, hash_content=True)
+            results_log.append(row)
+        print(f"🗄️ Supabase: {writer.written} rows written, {len(writer.failed)} failed, "
+              f"{archived_image_files.queries} filename lookups")
+
+        results_log.close()
+        stored_count = results_log.written
+        if stored_count:
+            print(f"\n💾 {stored_count} results appended to: {output_file}")
+        manifest.close()
+        content_index.close()
             
         # Final summary
         print(f"\n🎯 Final Results:")
         print(f"Total Images: {total_files}")
-        print(f"Successfully Processed: {len(results)}")
+        print(f"Successfully Processed: {stored_count}")
         print(f"Skipped: {skipped_count}")
         print(f"Failed: {failed_count}")
         if total_files > 0:
-            print(f"Overall Success Rate: {(len(results)/total_files)*100:.1f}%")
+            print(f"Overall Success Rate: {(stored_count/total_files)*100:.1f}%")
 
     except Exception as e:
         print(f"❌ Error during processing: {str(e)}")
         logging.error(traceback.format_exc())
 
 def test_ollama_connection() -> bool:
-    """Check if the Ollama server is running and accessible"""
-    try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
-        if response.status_code == 200:
-            print("✅ Ollama server is running")
-            return True
-        else:
-            print(f"❌ Unexpected response status: {response.status_code}")
-            return False
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Ollama server connection error: {str(e)}")
-        return False
+    """Check that at least one configured Ollama backend is running and accessible"""
+    return ollama_client.check_health()
 
 def validate_categories() -> None:
     """Validate that categories don't have overlapping keywords that could cause confusion"""
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+# Configuration: bounds for the number of LLaVA requests allowed in flight at once
+OLLAMA_MIN_CONCURRENCY = int(os.getenv("OLLAMA_MIN_CONCURRENCY", "1"))
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "8"))
+OLLAMA_INITIAL_CONCURRENCY = float(os.getenv("OLLAMA_INITIAL_CONCURRENCY", "2"))
+# Requests slower than this count as congestion, well before the 300 s request timeout is hit
+OLLAMA_LATENCY_TARGET = float(os.getenv("OLLAMA_LATENCY_TARGET", "120"))
+
+
+class AIMDLimiter:
+    """
+    Additive-increase / multiplicative-decrease limit on concurrent requests.
+    Each fast success raises the limit by 1/limit (about +1 per full window of requests);
+    a timeout or a request slower than the latency target halves it.
+    """
+
+    def __init__(self, initial_limit: float = OLLAMA_INITIAL_CONCURRENCY, min_limit: int = OLLAMA_MIN_CONCURRENCY,
+                 max_limit: int = OLLAMA_MAX_CONCURRENCY, latency_target: float = OLLAMA_LATENCY_TARGET,
+                 backoff: float = 0.5, throughput_window: float = 300):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.throughput_window = throughput_window
+
+        self.in_flight = 0
+        self.timeouts = 0
+        self._last_decrease = 0.0
+        self._completions = deque()  # Completion timestamps for throughput
+        self._started = time.time()
+        self._cond = threading.Condition()
+
+    def acquire(self) -> float:
+        """Block until a slot is free under the current limit; returns the start time"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            return time.time()
+
+    def release(self, started_at: float, timed_out: bool = False, succeeded: bool = True) -> None:
+        """Record the outcome of a request and adjust the limit"""
+        now = time.time()
+        latency = now - started_at
+        with self._cond:
+            self.in_flight -= 1
+
+            if timed_out or latency > self.latency_target:
+                if timed_out:
+                    self.timeouts += 1
+                # Only back off once per congestion event: requests that started
+                # before the last decrease already saw the old, higher limit
+                if started_at >= self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+            elif succeeded:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+            if succeeded and not timed_out:
+                self._completions.append(now)
+            self._cond.notify_all()
+
+    def throughput(self) -> float:
+        """Successful requests per minute over the recent window"""
+        now = time.time()
+        with self._cond:
+            while self._completions and now - self._completions[0] > self.throughput_window:
+                self._completions.popleft()
+            elapsed = min(self.throughput_window, now - self._started)
+            if elapsed <= 0:
+                return 0.0
+            return len(self._completions) * 60.0 / elapsed
+
+    def stats(self) -> Dict:
+        """Snapshot of the controller state for progress output"""
+        with self._cond:
+            limit, in_flight, timeouts = self.limit, self.in_flight, self.timeouts
+        return {
+            'limit': limit,
+            'in_flight': in_flight,
+            'timeouts': timeouts,
+            'throughput_per_min': self.throughput()
+        }
@@ -1,5 +1,4 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
-import boto3
+from flask import Flask, render_template, request, jsonify, redirect, url_for, g, has_request_context
 import os
 from datetime import datetime
 from dotenv import load_dotenv
@@ -7,8 +6,11 @@ import json
 from botocore.exceptions import ClientError
 from typing import List, Dict, Optional
 from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import time
 import threading
+from metadata_store import open_metadata_store, s3_style_metadata
+from s3_access import create_s3_client, s3_metrics, CircuitBreaker, is_outage
 
 # Load environment variables
 load_dotenv()
@@ -39,24 +41,117 @@ def set_cached(key, value, ttl_seconds=300):
             current_time = time.time()
             _cache.clear()  # Simple cleanup for now
 
+# Last successful S3 result per cache key, kept past the TTL so an S3 outage can be served from it
+_last_good = {}
+LAST_GOOD_MAX_ENTRIES = 500
+
+def remember_good(key, value):
+    with _cache_lock:
+        _last_good.pop(key, None)
+        _last_good[key] = value
+        if len(_last_good) > LAST_GOOD_MAX_ENTRIES:
+            del _last_good[next(iter(_last_good))]
+
+def last_good(key):
+    with _cache_lock:
+        return _last_good.get(key)
+
+_fetch_state = threading.local()
+
+def mark_stale():
+    """Flag the current response as built from last known good data instead of live S3"""
+    if has_request_context():
+        g.s3_stale = True
+    else:
+        # Fetch pool thread: run_before_deadline passes the flag back to the request
+        _fetch_state.stale = True
+
+@app.after_request
+def add_stale_header(response):
+    if g.get('s3_stale'):
+        response.headers['X-Data-Stale'] = 'true'
+    return response
+
 # S3 Configuration
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_REGION = os.getenv("AWS_REGION", "us-west-1")
 
-# Initialize S3 client with timeout
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION,
-    config=boto3.session.Config(
-        connect_timeout=30,
-        read_timeout=30,
-        retries={'max_attempts': 2}
-    )
-)
+# Initialize S3 client (shared factory: pool size, call metrics, and short timeouts with
+# few retries so a request fails within its budget and the circuit breaker can open)
+s3_client = create_s3_client('dashboard')
+
+# Fail fast while S3 is down and probe for recovery in the background
+s3_breaker = CircuitBreaker(probe=lambda: s3_client.head_bucket(Bucket=S3_BUCKET_NAME))
+
+# Time budget per dashboard request, kept under gunicorn's 30 s worker timeout (gunicorn.conf.py);
+# a request can ask for less with ?budget=<seconds>
+REQUEST_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS", "20"))
+# Concurrent S3 fetches per process (the S3 client pools S3_MAX_POOL_CONNECTIONS connections)
+DASHBOARD_FETCH_WORKERS = int(os.getenv("DASHBOARD_FETCH_WORKERS", "8"))
+
+_fetch_pool = ThreadPoolExecutor(max_workers=DASHBOARD_FETCH_WORKERS, thread_name_prefix='dashboard-fetch')
+
+# Result of a task that had not finished when the request's time budget ran out
+DEADLINE_MISSED = object()
+
+def request_deadline() -> float:
+    budget = request.args.get('budget', REQUEST_BUDGET_SECONDS, type=float)
+    return time.monotonic() + min(max(budget, 0.0), REQUEST_BUDGET_SECONDS)
+
+def run_before_deadline(tasks: List, deadline: float, max_in_flight: int = DASHBOARD_FETCH_WORKERS) -> List:
+    """
+    Run zero-argument tasks concurrently and return their results in order, with
+    DEADLINE_MISSED for those not finished by the deadline. At most max_in_flight tasks of
+    a request are in the shared pool at once; the next is submitted as one finishes, so a
+    request never queues more work than it can use. Tasks still running at the deadline
+    finish and fill the cache for the continuation request.
+    """
+    def run(task):
+        _fetch_state.stale = False
+        result = task()
+        return result, _fetch_state.stale
+
+    results = [DEADLINE_MISSED] * len(tasks)
+    in_flight = {}  # future -> task index
+    next_task = 0
+    while True:
+        while next_task < len(tasks) and len(in_flight) < max_in_flight and time.monotonic() < deadline:
+            in_flight[_fetch_pool.submit(run, tasks[next_task])] = next_task
+            next_task += 1
+        if not in_flight:
+            break
+        done, _ = wait(in_flight, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            result, stale = future.result()
+            if stale:
+                mark_stale()
+            results[in_flight.pop(future)] = result
+    # Still queued behind other requests' leftovers: not worth starting any more
+    for future in in_flight:
+        future.cancel()
+    return results
+
+# Optional: read image metadata from the pipeline's metadata store instead of one head_object per image
+# Opened on first use in each process: gunicorn preloads the app in the master and forks the
+# workers, and a SQLite connection must not be carried across fork()
+_metadata_store = None
+_metadata_store_pid = None
+_metadata_store_lock = threading.Lock()
+
+def get_metadata_store():
+    """This process's metadata store, or None when METADATA_STORE is not set or it could not be opened"""
+    global _metadata_store, _metadata_store_pid
+    if not os.getenv("METADATA_STORE"):
+        return None
+    with _metadata_store_lock:
+        if _metadata_store_pid != os.getpid():
+            _metadata_store = open_metadata_store()
+            _metadata_store_pid = os.getpid()
+        return _metadata_store
 
 # Cache for expensive operations
 @lru_cache(maxsize=32)
@@ -73,55 +168,88 @@ def list_s3_objects(prefix: str = "", max_keys: int = 1000) -> List[Dict]:
         return cached_result
     
     try:
-        response = s3_client.list_objects_v2(
+        response = s3_breaker.call(
+            s3_client.list_objects_v2,
             Bucket=S3_BUCKET_NAME,
             Prefix=prefix,
             MaxKeys=max_keys
         )
         
         objects = []
+        stored = {}
+        metadata_store = get_metadata_store()
+        if metadata_store is not None and 'Contents' in response:
+            try:
+                stored = metadata_store.get_by_keys([obj['Key'] for obj in response['Contents']])
+            except Exception as e:
+                print(f"Error reading metadata store: {e}")
         if 'Contents' in response:
             for obj in response['Contents']:
                 # Get object metadata (re-enabled for better address info)
-                try:
-                    head_response = s3_client.head_object(
-                        Bucket=S3_BUCKET_NAME,
-                        Key=obj['Key']
-                    )
-                    metadata = head_response.get('Metadata', {})
-                except:
-                    metadata = {}
-                
-                # Generate presigned URL for viewing (expires in 1 hour)
-                try:
-                    presigned_url = s3_client.generate_presigned_url(
-                        'get_object',
-                        Params={'Bucket': S3_BUCKET_NAME, 'Key': obj['Key']},
-                        ExpiresIn=3600
-                    )
-                except:
-                    presigned_url = None
+                if obj['Key'] in stored:
+                    metadata = s3_style_metadata(stored[obj['Key']])
+                else:
+                    try:
+                        head_response = s3_breaker.call(
+                            s3_client.head_object,
+                            Bucket=S3_BUCKET_NAME,
+                            Key=obj['Key']
+                        )
+                        metadata = head_response.get('Metadata', {})
+                    except ClientError as e:
+                        # Missing or unreadable key; an outage (or open breaker) falls back to the stale listing
+                        if is_outage(e):
+                            raise
+                        metadata = {}
                 
                 objects.append({
                     'key': obj['Key'],
                     'size': obj['Size'],
                     'last_modified': obj['LastModified'].isoformat(),
                     'metadata': metadata,
-                    'presigned_url': presigned_url,
+                    'presigned_url': get_presigned_url(obj['Key']),
                     'filename': obj['Key'].split('/')[-1]
                 })
         
         # Cache the result
         set_cached(cache_key, objects, ttl_seconds=600)
+        remember_good(cache_key, objects)
         return objects
     except Exception as e:
         print(f"Error listing S3 objects: {e}")
-        return []
+        return stale_s3_objects(cache_key, prefix, max_keys)
+
+def get_presigned_url(key: str) -> Optional[str]:
+    """Presigned URL for viewing (expires in 1 hour); signed locally, so it works during an S3 outage"""
+    try:
+        return s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': S3_BUCKET_NAME, 'Key': key},
+            ExpiresIn=3600
+        )
+    except:
+        return None
 
-@lru_cache(maxsize=16)
-def cached_get_location_folders() -> List[str]:
-    """Cached version of get_location_folders"""
-    return get_location_folders()
+def stale_s3_objects(cache_key: str, prefix: str, max_keys: int) -> List[Dict]:
+    """Last listing S3 returned for this prefix, else the catalog's rows for it, flagged as stale"""
+    objects = last_good(cache_key)
+    metadata_store = get_metadata_store()
+    if objects is None and metadata_store is not None:
+        try:
+            objects = [{
+                'key': row['s3_key'],
+                'size': 0,  # Not recorded in the catalog
+                'last_modified': str(row.get('uploaded_at') or ''),
+                'metadata': s3_style_metadata(row),
+                'filename': row['s3_key'].split('/')[-1]
+            } for row in metadata_store.list_prefix(prefix, max_keys)]
+        except Exception as e:
+            print(f"Error reading metadata store: {e}")
+    if objects is None:
+        return []
+    mark_stale()
+    # Old presigned URLs may have expired
+    return [dict(obj, presigned_url=get_presigned_url(obj['key'])) for obj in objects]
 
 def get_location_folders() -> List[str]:
     """Get all location folders from S3, sorted alphabetically by state"""
@@ -132,7 +260,8 @@ def get_location_folders() -> List[str]:
         return cached_result
     
     try:
-        response = s3_client.list_objects_v2(
+        response = s3_breaker.call(
+            s3_client.list_objects_v2,
             Bucket=S3_BUCKET_NAME,
             Prefix="images/",
             Delimiter='/'
@@ -145,32 +274,46 @@ def get_location_folders() -> List[str]:
                 if folder_name:
                     folders.append(folder_name)
         
-        # Sort by state (last part of the folder name)
-        def extract_state(folder_name):
-            parts = folder_name.split('_')
-            if len(parts) >= 3:
-                return parts[-1]  # Last part is the state
-            return folder_name  # Fallback to full name if can't parse
-        
-        # Sort folders by state, then by full name for locations in same state
-        sorted_folders = sorted(folders, key=lambda x: (extract_state(x), x))
+        sorted_folders = sort_location_folders(folders)
         
         # Cache the result
         set_cached(cache_key, sorted_folders, ttl_seconds=900)
+        remember_good(cache_key, sorted_folders)
         return sorted_folders
     except Exception as e:
         print(f"Error getting location folders: {e}")
-        return []
+        folders = last_good(cache_key)
+        metadata_store = get_metadata_store()
+        if folders is None and metadata_store is not None:
+            try:
+                folders = sort_location_folders(metadata_store.location_folders())
+            except Exception as e:
+                print(f"Error reading metadata store: {e}")
+        if folders is None:
+            return []
+        mark_stale()
+        return folders
 
-@lru_cache(maxsize=32)
-def cached_get_categories_in_location(location_folder: str) -> List[str]:
-    """Cached version of get_categories_in_location"""
-    return get_categories_in_location(location_folder)
+def sort_location_folders(folders: List[str]) -> List[str]:
+    """Sort folders by state (last part of the folder name), then by full name for locations in same state"""
+    def extract_state(folder_name):
+        parts = folder_name.split('_')
+        if len(parts) >= 3:
+            return parts[-1]  # Last part is the state
+        return folder_name  # Fallback to full name if can't parse
+    
+    return sorted(folders, key=lambda x: (extract_state(x), x))
 
 def get_categories_in_location(location_folder: str) -> List[str]:
     """Get all categories within a location folder"""
+    cache_key = f"categories_{location_folder}"
+    cached_result = get_cached(cache_key, ttl_seconds=900)
+    if cached_result:
+        return cached_result
+    
     try:
-        response = s3_client.list_objects_v2(
+        response = s3_breaker.call(
+            s3_client.list_objects_v2,
             Bucket=S3_BUCKET_NAME,
             Prefix=f"images/{location_folder}/",
             Delimiter='/'
@@ -183,10 +326,23 @@ def get_categories_in_location(location_folder: str) -> List[str]:
                 if category_name:
                     categories.append(category_name)
         
-        return sorted(categories)
+        categories = sorted(categories)
+        set_cached(cache_key, categories, ttl_seconds=900)
+        remember_good(cache_key, categories)
+        return categories
     except Exception as e:
         print(f"Error getting categories: {e}")
-        return []
+        categories = last_good(cache_key)
+        metadata_store = get_metadata_store()
+        if categories is None and metadata_store is not None:
+            try:
+                categories = metadata_store.categories(location_folder)
+            except Exception as e:
+                print(f"Error reading metadata store: {e}")
+        if categories is None:
+            return []
+        mark_stale()
+        return categories
 
 def get_location_details_from_metadata(location_folder: str) -> Dict:
     """Get location details from metadata of images in this location"""
@@ -294,19 +450,44 @@ def get_location_details_from_metadata(location_folder: str) -> Dict:
 def index():
     """Main dashboard page"""
     try:
+        deadline = request_deadline()
+        cursor = request.args.get('cursor', 0, type=int)
+        
         # Get ALL location folders (no limit)
-        location_folders = cached_get_location_folders()
+        location_folders = run_before_deadline([get_location_folders], deadline)[0]
+        if location_folders is DEADLINE_MISSED:
+            location_folders = []
+            next_cursor = cursor
+        else:
+            next_cursor = None
+        
+        # Only calculate stats for first 5 locations to avoid timeout; location details
+        # for this page's folders (from the cursor on) are fetched alongside
+        sample = location_folders[:5]
+        pending = location_folders[cursor:]
+        results = run_before_deadline(
+            [lambda location=location: list_s3_objects(f"images/{location}/", max_keys=50) for location in sample] +
+            [lambda location=location: get_location_details_from_metadata(location) for location in pending],
+            deadline
+        )
+        sample_results = [objects for objects in results[:len(sample)] if objects is not DEADLINE_MISSED]
         
         # Get basic stats without loading all images
-        total_objects = 0
-        total_size = 0
+        total_objects = sum(len(objects) for objects in sample_results)
+        total_size = sum(obj['size'] for objects in sample_results for obj in objects)
+        
+        # Estimate total objects based on the sampled locations
+        if sample_results and len(location_folders) > len(sample_results):
+            avg_objects_per_location = total_objects / len(sample_results)
+            total_objects = int(avg_objects_per_location * len(location_folders))
         
-        # Get location details with metadata (load all folders but limit metadata search)
+        # Location details in order, up to the first one the budget did not cover
         location_details = []
-        for location in location_folders:  # No limit - show all folders
-            # Get location details from metadata (optimized search)
-            location_info = get_location_details_from_metadata(location)
-            
+        for offset, location_info in enumerate(results[len(sample):]):
+            if location_info is DEADLINE_MISSED:
+                next_cursor = cursor + offset
+                break
+            location = pending[offset]
             location_details.append({
                 'folder': location,
                 'street': location_info['street'],
@@ -315,24 +496,15 @@ def index():
                 'zipcode': location_info['zipcode'],
                 'location': location_info['location']
             })
-            
-            # Only calculate stats for first 5 locations to avoid timeout
-            if len(location_details) <= 5:
-                objects = list_s3_objects(f"images/{location}/", max_keys=50)
-                total_objects += len(objects)
-                total_size += sum(obj['size'] for obj in objects)
-        
-        # Estimate total objects based on first 5 locations
-        if len(location_folders) > 5:
-            avg_objects_per_location = total_objects / 5
-            estimated_total = int(avg_objects_per_location * len(location_folders))
-            total_objects = estimated_total
         
         return render_template('index.html', 
                              location_folders=location_folders,
                              location_details=location_details,
                              total_objects=total_objects,
-                             total_size=total_size)
+                             total_size=total_size,
+                             stale=g.get('s3_stale', False),
+                             partial=next_cursor is not None or len(sample_results) < len(sample),
+                             next_cursor=next_cursor)
     except Exception as e:
         return render_template('error.html', error=str(e))
 
@@ -343,7 +515,7 @@ def location_view(location_folder):
         print(f"Loading location view for: {location_folder}")
         
         # Get categories quickly (cached)
-        categories = cached_get_categories_in_location(location_folder)
+        categories = get_categories_in_location(location_folder)
         print(f"Found {len(categories)} categories: {categories}")
         
         # Get location details from metadata (cached)
@@ -431,22 +603,46 @@ def api_objects():
 def api_stats():
     """API endpoint to get basic stats"""
     try:
-        location_folders = get_location_folders()
+        deadline = request_deadline()
+        cursor = request.args.get('cursor', 0, type=int)
+        location_folders = run_before_deadline([get_location_folders], deadline)[0]
         
         stats = {
-            'total_locations': len(location_folders),
+            'total_locations': 0,
             'total_objects': 0,
             'total_size': 0,
-            'locations': []
+            'locations': [],
+            'partial': False,
+            'next_cursor': None
         }
-        
-        for location in location_folders:
-            categories = get_categories_in_location(location)
+        if location_folders is DEADLINE_MISSED:
+            stats.update(partial=True, next_cursor=cursor)
+            stats['stale'] = g.get('s3_stale', False)
+            return jsonify(stats)
+        stats['total_locations'] = len(location_folders)
+        
+        # Categories of every remaining location, then every category's objects, concurrently
+        pending = location_folders[cursor:]
+        location_categories = run_before_deadline(
+            [lambda location=location: get_categories_in_location(location) for location in pending], deadline
+        )
+        listings = [(location, category) for location, categories in zip(pending, location_categories)
+                    if categories is not DEADLINE_MISSED for category in categories]
+        listed = dict(zip(listings, run_before_deadline(
+            [lambda location=location, category=category: list_s3_objects(f"images/{location}/{category}/", max_keys=100)
+             for location, category in listings], deadline
+        )))
+        
+        # Totals cover the locations in this response; a continuation (?cursor=next_cursor) returns the rest
+        for offset, (location, categories) in enumerate(zip(pending, location_categories)):
+            if categories is DEADLINE_MISSED or any(listed[(location, category)] is DEADLINE_MISSED for category in categories):
+                stats.update(partial=True, next_cursor=cursor + offset)
+                break
             location_objects = 0
             location_size = 0
             
             for category in categories:
-                objects = list_s3_objects(f"images/{location}/{category}/", max_keys=100)
+                objects = listed[(location, category)]
                 location_objects += len(objects)
                 location_size += sum(obj['size'] for obj in objects)
             
@@ -460,10 +656,21 @@ def api_stats():
             stats['total_objects'] += location_objects
             stats['total_size'] += location_size
         
+        stats['stale'] = g.get('s3_stale', False)
         return jsonify(stats)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/s3_metrics')
+def api_s3_metrics():
+    """API endpoint with per-operation S3 call counts and latency histograms"""
+    return jsonify(s3_metrics.snapshot())
+
+@app.route('/api/s3_health')
+def api_s3_health():
+    """API endpoint with the S3 circuit breaker state"""
+    return jsonify(s3_breaker.snapshot())
+
 @app.route('/api/location/<location_folder>/images')
 def api_location_images(location_folder):
     """API endpoint to get all images in a location with pagination"""
@@ -493,7 +700,8 @@ def api_location_images(location_folder):
             'page': page,
             'total_pages': total_pages,
             'total_objects': total_objects,
-            'per_page': per_page
+            'per_page': per_page,
+            'stale': g.get('s3_stale', False)
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -502,7 +710,7 @@ def api_location_images(location_folder):
 def api_location_categories(location_folder):
     """API endpoint to get category data for a location"""
     try:
-        categories = cached_get_categories_in_location(location_folder)
+        categories = get_categories_in_location(location_folder)
         
         category_data = []
         for category in categories:
@@ -519,7 +727,8 @@ def api_location_categories(location_folder):
         
         return jsonify({
             'location_folder': location_folder,
-            'categories': category_data
+            'categories': category_data,
+            'stale': g.get('s3_stale', False)
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -546,7 +755,8 @@ def api_category_images(location_folder, category):
             'total_pages': total_pages,
             'total_objects': total_objects,
             'per_page': per_page,
-            'has_more': page < total_pages
+            'has_more': page < total_pages,
+            'stale': g.get('s3_stale', False)
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
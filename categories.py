@@ -0,0 +1,107 @@
+# Category keyword tables of both pipelines and their compiled matchers. No environment checks
+# or clients are created on import, so tools like recategorize.py can use them on their own.
+from keyword_matcher import CategoryMatcher
+
+# S3 pipeline (s3.py)
+CATEGORIES = {
+    "exterior_warehouse": ["warehouse exterior", "trucks",  "car", "parking", "tree", "building",  "warehouse", "parking lot",  "building", "tree", "clear sky", "sidewalk", "space", "glass door", "car", "entrance", "outdoor",  "clear", "warehouse building", "solar panel", "sky", "roof", "exterior", "flat roof", "open space", "birds eye view", "outside", "commercial building", "eye", "open", "view", "large", "storage facility", "space", "flat", "concrete surface", "loading dock", "shipping area", "receiving area", "exterior", "concrete floors", "metal beams", "industrial exterior", "warehouse facade", "vehicles", "distribution center exterior", "logistics facility exterior", "truck loading", "delivery bay", "warehouse compound"],
+    
+    "interior_warehouse": ["warehouse interior", "empty space", "empty", "pallet racking", "yellow equipment", "industrial area", "metal", "sheets", "high ceiling", "metal sheets", "aisle", "concrete floor", "unit",  "units","shelving",  "lights", "shelving units", "metal walls", "warehouse",  "industrial interior", "pallet jack", "interior", "metal walls",  "logistics", "distribution", "supply chain", "shelves", "storage unit", "warehouse shelves", "storage", "forklift", "forklifts", "cardboard boxes", "inventory", "pallets", "boxes", "stockroom", "fulfillment", "distribution center", "high-bay racking", "ceiling", "conveyor system", "bulk storage", "cross-docking", "material handling", "shelving units", "pallet racks", "staging area", "warehouse aisles", "storage shelves", "storage", "warehouse floor", "fork lift"],
+    
+    "interior_office": ["office interior", "cafe" , "tables", "green wall", "white ceiling", "office space", "blinds", "room", "office", "workspace", "modern office", "basketball", "hoop", "stylish office", "elegant office", "sophisticated office", "chairs", "desk", "chair", "table", "office furniture", "office supplies", "office equipment", "cabinet","recreation room", "game room", "pool table", "billiard table", "recreation area", "storage", "shelving", "blind shade", "floor lamp", "glass window", "windows", "blinds", "lobby", "reception", "reception area", "waiting area", "dining table", "entrance", "brand", "interior", "carpet", "modern", "computer", "tv", "workspace", "stylish", "elegant", "white walls", "sophisticated", "staircase", "wood", "wood flooring", "stairs", "furniture"],
+    
+    # "conference_room": ["conference room", "meeting room", "boardroom", "video conference", "conference table", "office meeting", "presentation room", "projector", "screen", "TV", "whiteboard", "seating", "chairs", "desk", "long table", "glass walls", "interior office", "office meeting space", "corporate meeting", "roundtable", "monitor", "remote meeting", "speakerphone", "teleconference", "zoom meeting", "business meeting", "formal seating", "presentation screen", "conference setup", "office chairs", "team meeting"],
+    
+    "parking_lot": ["parking lot", "parking", "parking area", "parking space", "cars", "vehicles", "parking lines", "outdoor parking", "parking facility", "car park", "parking garage", "vehicle parking", "parking spots", "parking structure", "pavement"],
+    
+    # "unis": ["unis", "logistics solutions", "supply chain optimization", "global logistics", "transportation", "shipping", "truck", "trailer", "container", "cargo", "transport logistics", "logistics company", "freight", "delivery", "logistics services"],
+    
+    "breakroom": ["breakroom", "break room", "kitchen", "commercial kitchen", "office break room", "break", "refrigerator", "sink", "coffee area", "lunch room", "employee kitchen", "cafeteria", "dining area", "microwave", "coffee machine", "kitchen appliances", "eating area", "staff kitchen", "break area"],
+    
+    "office_gym": ["office gym", "gym","workout room",  "fitness facility", "gym equipment", "treadmill", "elliptical", "weight room", "strength training", "cardio equipment", "exercise machines", "fitness studio", "workout area","gymnasium", "athletic facility"],
+    
+    "bathroom": ["bathroom", "restroom", "washroom", "toilet", "lavatory", "public restroom", "employee restroom", "facilities", "WC", "powder room", "men's room", "women's room", "unisex bathroom"],
+    
+    "company": ["corporate", "business", "startup", "enterprise", "organization", "firm", "management", "industry experts"],
+    
+    "e-commerce": ["online shopping", "e-commerce", "retail", "dropshipping", "marketplace", "digital store", "checkout", "cart", "customer orders"],
+    
+    "support": ["customer service", "helpdesk", "technical support", "assistance", "troubleshooting", "service center"],
+    
+    "resources": ["training", "learning materials", "guides", "knowledge base", "industry insights", "best practices"],
+    
+    "tracking_technology_platform": ["tracking", "gps", "rfid", "iot sensors", "analytics", "real-time monitoring", "asset tracking"],
+    
+    "marketing": ["advertising", "two women", "fashionable attire",  "logo", "signage", "work", "blazer", "blonde", "blonde hair", "white jacket" , "woman", " black pants", "attire", "dress", "streetwear", "high heels", "red dress", "sunglasses", "cube work", "sign", "sticker" ,"toy fork lift", "toy", "model", "toy forklift", "toy model", " remote control toy car", "lego truck", "miniature", "scale model", "polo shirt", "branded apparel", "promotional item",  "branded", "shirt", "black polo shirt", "black shirt", "embroidered","embroidered text", "logo on shirt", "polo", "cube work shirt", "t-shirt", "promotion", "branding", "social media", "marketing campaign", "seo", "content marketing", "email marketing"],
+    
+    "warehousing": ["logistics hub", "inventory management"],
+    
+    "item_com": ["item.com", "e-commerce solutions", "supply chain automation", "digital commerce"],
+}
+
+# Bonus points on top of keyword matches: (category, terms, points per term, match label)
+CATEGORY_BONUS_RULES = [
+    # Special priority for UNIS category when "unis" is detected
+    ("unis", ("unis",), 5, "unis_priority_bonus"),
+    # Special bonus for toy/miniature terms in marketing category
+    ("marketing", ('toy', 'miniature', 'model', 'scale model', 'toy model', 'miniature model', 'toy car', 'toy truck', 'toy forklift', 'remote control', 'lego'), 4, "toy_miniature_bonus({term})"),
+    # Special bonus for refrigerator/fridge terms in breakroom category
+    ("breakroom", ('refrigerator', 'fridge', 'freezer', 'cooler', 'refrigerated'), 3, "fridge_bonus({term})"),
+]
+
+# Compile the category table once: keyword automaton, specificity order and bonus rules
+category_matcher = CategoryMatcher(CATEGORIES, CATEGORY_BONUS_RULES)
+
+
+# Supabase pipeline (Image_server_llm.py)
+SUPABASE_CATEGORIES = {
+    "exterior_warehouse": ["warehouse exterior", "trucks",  "car", "parking", "tree", "building",  "warehouse", "parking lot",  "building", "tree", "clear sky", "sidewalk", "space", "glass door", "car", "entrance", "outdoor",  "clear", "warehouse building", "solar panel", "sky", "roof", "exterior", "flat roof", "open space", "birds eye view", "outside", "commercial building", "eye", "open", "view", "large", "storage facility", "space", "flat", "concrete surface", "loading dock", "shipping area", "receiving area", "exterior", "concrete floors", "metal beams", "industrial exterior", "warehouse facade", "vehicles", "distribution center exterior", "logistics facility exterior", "truck loading", "delivery bay", "warehouse compound"],
+    
+    "interior_warehouse": ["warehouse interior", "industrial area", "metal", "sheets", "high ceiling", "metal sheets", "aisle", "concrete floor", "unit",  "units","shelving",  "lights", "shelving units", "metal walls", "warehouse",  "industrial interior", "pallet jack", "interior", "metal walls",  "logistics", "distribution", "supply chain", "shelves", "storage unit", "warehouse shelves", "storage", "forklift", "forklifts", "cardboard boxes", "inventory", "pallets", "boxes", "stockroom", "fulfillment", "distribution center", "high-bay racking", "ceiling", "conveyor system", "bulk storage", "cross-docking", "material handling", "shelving units", "pallet racks", "staging area", "warehouse aisles", "storage shelves", "storage", "warehouse floor", "fork lift"],
+    
+    "interior_office": ["office interior", "office", "workspace", "modern office", "basketball", "hoop", "stylish office", "elegant office", "sophisticated office", "chairs", "desk", "chair", "table", "office furniture", "office supplies", "office equipment", "cabinet","recreation room", "game room", "pool table", "billiard table", "recreation area", "storage", "shelving", "blind shade", "floor lamp", "glass window", "windows", "blinds", "lobby", "reception", "reception area", "waiting area", "dining table", "entrance", "brand", "interior", "carpet", "modern", "computer", "tv", "workspace", "stylish", "elegant", "white walls", "sophisticated", "staircase", "wood", "wood flooring", "stairs", "furniture"],
+    
+    "conference_room": ["conference room", "meeting room", "boardroom", "video conference", "conference table", "office meeting", "presentation room", "projector", "screen", "TV", "whiteboard", "seating", "chairs", "desk", "long table", "glass walls", "interior office", "office meeting space", "corporate meeting", "roundtable", "monitor", "remote meeting", "speakerphone", "teleconference", "zoom meeting", "business meeting", "formal seating", "presentation screen", "conference setup", "office chairs", "team meeting"],
+    
+    "parking_lot": ["parking lot", "parking", "parking area", "parking space", "cars", "vehicles", "parking lines", "outdoor parking", "parking facility", "car park", "parking garage", "vehicle parking", "parking spots", "parking structure", "pavement"],
+    
+    "unis": ["unis", "logistics solutions", "supply chain optimization", "global logistics", "transportation", "shipping", "truck", "trailer", "container", "cargo", "transport logistics", "logistics company", "freight", "delivery", "logistics services"],
+    
+    "breakroom": ["breakroom", "break room", "kitchen", "refrigerator", "sink", "coffee area", "lunch room", "employee kitchen", "cafeteria", "dining area", "microwave", "coffee machine", "kitchen appliances", "eating area", "staff kitchen", "break area"],
+    
+    "office_gym": ["office gym", "gym","workout room",  "fitness facility", "gym equipment", "treadmill", "elliptical", "weight room", "strength training", "cardio equipment", "exercise machines", "fitness studio", "workout area","gymnasium", "athletic facility"],
+    
+    "bathroom": ["bathroom", "restroom", "washroom", "toilet", "lavatory", "public restroom", "employee restroom", "facilities", "WC", "powder room", "men's room", "women's room", "unisex bathroom"],
+    
+    "company": ["corporate", "business", "startup", "enterprise", "organization", "firm", "management", "industry experts"],
+    
+    "e-commerce": ["online shopping", "e-commerce", "retail", "dropshipping", "marketplace", "digital store", "checkout", "cart", "customer orders"],
+    
+    "support": ["customer service", "helpdesk", "technical support", "assistance", "troubleshooting", "service center"],
+    
+    "resources": ["training", "learning materials", "guides", "knowledge base", "industry insights", "best practices"],
+    
+    "tracking_technology_platform": ["tracking", "gps", "rfid", "iot sensors", "analytics", "real-time monitoring", "asset tracking"],
+    
+    "marketing": ["advertising", "logo", "signage", "work", "blazer", "blonde", "blonde hair", "white jacket" , "woman", "high heels", "red dress", "sunglasses", "cube work", "sign", "sticker" ,"toy fork lift", "toy", "model", "toy forklift", "toy model", " remote control toy car", "lego truck", "miniature", "scale model", "polo shirt", "branded apparel", "promotional item",  "branded", "shirt", "black polo shirt", "black shirt", "embroidered","embroidered text", "logo on shirt", "polo", "cube work shirt", "t-shirt", "promotion", "branding", "social media", "marketing campaign", "seo", "content marketing", "email marketing"],
+    
+    "warehousing": ["logistics hub", "inventory management"],
+    
+    "item_com": ["item.com", "e-commerce solutions", "supply chain automation", "digital commerce"],
+}
+
+# Bonus points on top of keyword matches: (category, terms, points per term, match label)
+SUPABASE_CATEGORY_BONUS_RULES = [
+    # Special priority for UNIS category when "unis" is detected
+    ("unis", ("unis",), 5, "unis_priority_bonus"),
+    # Special bonus for toy/miniature terms in marketing category
+    ("marketing", ('toy', 'miniature', 'model', 'scale model', 'toy model', 'miniature model', 'toy car', 'toy truck', 'toy forklift', 'remote control', 'lego'), 4, "toy_miniature_bonus({term})"),
+]
+
+# Compile the category table once: keyword automaton, specificity order and bonus rules
+supabase_category_matcher = CategoryMatcher(SUPABASE_CATEGORIES, SUPABASE_CATEGORY_BONUS_RULES)
+
+
+def category_matcher_for(source: str) -> CategoryMatcher:
+    """Matcher of the pipeline whose records come from source ('supabase', or 's3'/'json')"""
+    return supabase_category_matcher if source == 'supabase' else category_matcher
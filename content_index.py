@@ -0,0 +1,113 @@
+import sqlite3
+import datetime
+import threading
+from typing import Dict, Optional
+
+from botocore.exceptions import ClientError
+
+from file_scanner import SCAN_MANIFEST_PATH, hash_file
+
+# S3 prefix of the hash index: one empty marker object per content hash,
+# with the key of the stored image in its metadata
+CONTENT_INDEX_PREFIX = "content-index/"
+HASH_METADATA_KEY = "content-sha256"
+
+
+class ContentHashIndex:
+    """
+    Content hash -> stored image, used to skip byte-identical files before any LLaVA
+    or upload work. Lookups hit a local SQLite table first (next to the scan manifest)
+    and, when an S3 client is given, fall back to a HEAD on content-index/<hash>,
+    so other machines' uploads are recognised too.
+    """
+
+    def __init__(self, db_path: str = SCAN_MANIFEST_PATH, s3_client=None, bucket: str = None,
+                 prefix: str = CONTENT_INDEX_PREFIX):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS content_hashes (
+                content_hash TEXT PRIMARY KEY,
+                stored_as TEXT NOT NULL,
+                recorded_at TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self._session: Dict[str, str] = {}  # Hashes claimed by files earlier in this run
+
+    def hash(self, path: str) -> Optional[str]:
+        """Streaming SHA-256 of a file, or None if it cannot be read"""
+        try:
+            return hash_file(path)
+        except OSError as e:
+            print(f"⚠️ Could not hash {path}: {e}")
+            return None
+
+    def lookup(self, content_hash: str) -> Optional[str]:
+        """Where identical content is already stored (S3 key, file name or local path), if anywhere"""
+        if content_hash in self._session:
+            return self._session[content_hash]
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT stored_as FROM content_hashes WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        if row:
+            return row[0]
+
+        if self.s3_client is not None:
+            try:
+                head = self.s3_client.head_object(Bucket=self.bucket, Key=f"{self.prefix}{content_hash}")
+            except ClientError as e:
+                if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+                    print(f"⚠️ Content index lookup failed for {content_hash[:12]}: {e}")
+                return None
+            stored_as = head.get('Metadata', {}).get('s3-key')
+            if stored_as:
+                self._record_local(content_hash, stored_as)
+                return stored_as
+        return None
+
+    def claim(self, content_hash: str, path: str) -> Optional[str]:
+        """
+        Check a file's hash and reserve it for this run.
+        Returns where the content is already stored (a duplicate), or None if the file is new.
+        """
+        existing = self.lookup(content_hash)
+        if existing is None:
+            self._session[content_hash] = path
+        return existing
+
+    def record(self, content_hash: str, stored_as: str) -> None:
+        """Remember where content was stored, locally and (with S3) as a marker object"""
+        self._record_local(content_hash, stored_as)
+        self._session[content_hash] = stored_as
+        if self.s3_client is not None:
+            try:
+                self.s3_client.put_object(
+                    Bucket=self.bucket,
+                    Key=f"{self.prefix}{content_hash}",
+                    Body=b'',
+                    Metadata={'s3-key': stored_as}
+                )
+            except ClientError as e:
+                print(f"⚠️ Could not write content index marker for {stored_as}: {e}")
+
+    def release(self, content_hash: str) -> None:
+        """Drop a run reservation whose upload did not happen"""
+        self._session.pop(content_hash, None)
+
+    def _record_local(self, content_hash: str, stored_as: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO content_hashes (content_hash, stored_as, recorded_at) VALUES (?, ?, ?)",
+                (content_hash, stored_as, datetime.datetime.now().isoformat())
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
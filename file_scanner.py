@@ -0,0 +1,234 @@
+import os
+import sqlite3
+import hashlib
+import datetime
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+# Local manifest of files already seen on the network share (delete it to force a full rescan)
+SCAN_MANIFEST_PATH = os.getenv("SCAN_MANIFEST_PATH", "scan_manifest.sqlite")
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "16"))
+
+# Files in these states are not returned again unless their size or mtime changes
+FINAL_STATES = ('processed', 'skipped', 'converted')
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def list_directory(directory: str, extensions: Set[str]) -> Tuple[List[Tuple[str, int, int]], List[str]]:
+    """List one directory: (matching files as (path, size, mtime_ns), subdirectories)"""
+    files, subdirs = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+                        # On Windows shares the stat comes with the directory listing
+                        stat = entry.stat()
+                        files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+                except OSError as e:
+                    print(f"⚠️ Could not read {entry.path}: {e}")
+    except OSError as e:
+        print(f"⚠️ Could not list {directory}: {e}")
+    return files, subdirs
+
+
+def walk_files(root: str, extensions: Iterable[str], max_workers: int = SCAN_WORKERS) -> List[Tuple[str, int, int]]:
+    """
+    Recursively list files with the given extensions, listing directories concurrently.
+    On a network share each listing is a round trip, so listing many directories in
+    parallel hides most of the latency.
+    """
+    extensions = {ext.lower() for ext in extensions}
+    found = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(list_directory, root, extensions)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                found.extend(files)
+                for subdir in subdirs:
+                    pending.add(executor.submit(list_directory, subdir, extensions))
+    return found
+
+
+class FileManifest:
+    """
+    SQLite record of every file the pipeline has handled: path, size, mtime,
+    content hash and processing state. Kept on the local disk, not on the share.
+    """
+
+    def __init__(self, path: str = SCAN_MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT,
+                state TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def entries_under(self, root: str) -> Dict[str, Tuple[int, int, Optional[str], str]]:
+        """path -> (size, mtime_ns, content_hash, state) for all recorded files below root"""
+        prefix = os.path.join(root, '')
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns, content_hash, state FROM files WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix)
+            ).fetchall()
+        return {row[0]: (row[1], row[2], row[3], row[4]) for row in rows}
+
+    def entries_for(self, paths: Iterable[str]) -> Dict[str, Tuple[int, int, Optional[str], str]]:
+        """path -> (size, mtime_ns, content_hash, state) for the given paths that are recorded"""
+        entries = {}
+        with self._lock:
+            for path in paths:
+                row = self._conn.execute(
+                    "SELECT size, mtime_ns, content_hash, state FROM files WHERE path = ?", (str(path),)
+                ).fetchone()
+                if row:
+                    entries[str(path)] = row
+        return entries
+
+    def mark(self, path: str, state: str, content_hash: Optional[str] = None, hash_content: bool = False) -> None:
+        """
+        Record the current size/mtime of a file along with its processing state.
+        With hash_content the file is read to store its content hash, which lets later
+        scans recognise a file that was only touched.
+        """
+        try:
+            stat = os.stat(path)
+            if hash_content and content_hash is None:
+                content_hash = hash_file(path)
+        except OSError as e:
+            print(f"⚠️ Could not record {path} in scan manifest: {e}")
+            return
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO files (path, size, mtime_ns, content_hash, state, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(path) DO UPDATE SET size=excluded.size, mtime_ns=excluded.mtime_ns,
+                   content_hash=COALESCE(excluded.content_hash, files.content_hash),
+                   state=excluded.state, updated_at=excluded.updated_at""",
+                (str(path), stat.st_size, stat.st_mtime_ns, content_hash, state, datetime.datetime.now().isoformat())
+            )
+            self._conn.commit()
+
+    def rename(self, old_path: str, new_path: str, state: str, content_hash: Optional[str] = None,
+               hash_content: bool = False) -> None:
+        """Move a record to the file's new name (keeping its content hash) and set its state"""
+        with self._lock:
+            row = self._conn.execute("SELECT content_hash FROM files WHERE path = ?", (str(old_path),)).fetchone()
+            self._conn.execute("DELETE FROM files WHERE path = ?", (str(old_path),))
+            self._conn.commit()
+        self.mark(new_path, state, content_hash or (row[0] if row else None), hash_content)
+
+    def touch(self, updates: List[Tuple[str, int, int]]) -> None:
+        """Store new size/mtime for files whose content turned out to be unchanged"""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE files SET size = ?, mtime_ns = ?, updated_at = ? WHERE path = ?",
+                [(size, mtime_ns, datetime.datetime.now().isoformat(), path) for path, size, mtime_ns in updates]
+            )
+            self._conn.commit()
+
+    def forget(self, paths: Iterable[str]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class IncrementalScanner:
+    """
+    Returns only the files that need work: not in the manifest, changed since they
+    were recorded, or recorded in a non-final state (e.g. failed). A file whose mtime
+    changed but whose content hash still matches is treated as unchanged.
+    """
+
+    def __init__(self, manifest: FileManifest, extensions: Iterable[str], max_workers: int = SCAN_WORKERS):
+        self.manifest = manifest
+        self.extensions = set(extensions)
+        self.max_workers = max_workers
+
+    def scan(self, root: str) -> List[Path]:
+        started = datetime.datetime.now()
+        root = os.path.abspath(root)
+        files = walk_files(root, self.extensions, self.max_workers)
+        known = self.manifest.entries_under(root)
+
+        changed, unchanged = self._classify(files, known)
+        seen = {path for path, _, _ in files}
+        vanished = [path for path in known if path not in seen]
+        if vanished:
+            self.manifest.forget(vanished)
+
+        elapsed = (datetime.datetime.now() - started).total_seconds()
+        print(f"🗂️  Scanned {len(files)} files in {elapsed:.1f}s: {len(changed)} new or changed, "
+              f"{unchanged} unchanged, {len(vanished)} removed from manifest")
+        return [Path(path) for path in sorted(changed)]
+
+    def filter(self, files: List[Tuple[str, int, int]]) -> List[Path]:
+        """Of the given (path, size, mtime_ns) files, the ones that still need work"""
+        known = self.manifest.entries_for([path for path, _, _ in files])
+        changed, _ = self._classify(files, known)
+        return [Path(path) for path in sorted(changed)]
+
+    def _classify(self, files: List[Tuple[str, int, int]],
+                  known: Dict[str, Tuple[int, int, Optional[str], str]]) -> Tuple[List[str], int]:
+        """Split files into those needing work and a count of unchanged ones"""
+        changed = []
+        touched = []
+        unchanged = 0
+        for path, size, mtime_ns in files:
+            entry = known.get(path)
+            if entry is None:
+                changed.append(path)
+                continue
+            known_size, known_mtime, content_hash, state = entry
+            if state not in FINAL_STATES:
+                changed.append(path)
+            elif known_size == size and known_mtime == mtime_ns:
+                unchanged += 1
+            elif content_hash and known_size == size and self._same_content(path, content_hash):
+                touched.append((path, size, mtime_ns))
+                unchanged += 1
+            else:
+                changed.append(path)
+
+        if touched:
+            self.manifest.touch(touched)
+        return changed, unchanged
+
+    @staticmethod
+    def _same_content(path: str, content_hash: str) -> bool:
+        try:
+            return hash_file(path) == content_hash
+        except OSError:
+            return False
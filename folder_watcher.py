@@ -0,0 +1,207 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from dotenv import load_dotenv
+
+from file_scanner import SCAN_WORKERS, list_directory
+
+try:
+    # Native change notifications (inotify on Linux, ReadDirectoryChangesW on Windows)
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+    FileSystemEventHandler = object
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+# A file is handed over once its size and mtime have not changed for this many seconds
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "15"))
+# How often directories are checked for changes when polling
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "30"))
+# With native events, a poll still runs this often to catch events a network share dropped
+WATCH_SAFETY_POLL_INTERVAL = float(os.getenv("WATCH_SAFETY_POLL_INTERVAL", "600"))
+# Set to false to always poll (e.g. for SMB mounts that do not deliver events)
+WATCH_USE_EVENTS = os.getenv("WATCH_USE_EVENTS", "true").lower() in ("1", "true", "yes")
+
+FileInfo = Tuple[str, int, int]  # (path, size, mtime_ns)
+
+
+class DirectoryPoller:
+    """
+    Finds new files by checking directory mtimes instead of listing the whole tree.
+    Creating, renaming or deleting a file updates its directory's mtime, so each poll
+    is one stat per directory plus a listing of only the directories that changed.
+    """
+
+    def __init__(self, root: str, extensions: Iterable[str], max_workers: int = SCAN_WORKERS):
+        self.root = os.path.abspath(root)
+        self.extensions = {ext.lower() for ext in extensions}
+        self.max_workers = max_workers
+        self._directories: Dict[str, int] = {}  # directory -> mtime_ns when last listed
+        self._listings: Dict[str, Dict[str, Tuple[int, int]]] = {}  # directory -> {path: (size, mtime_ns)}
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            self._list_tree([self.root], executor)
+        file_count = sum(len(listing) for listing in self._listings.values())
+        print(f"👀 Watching {len(self._directories)} directories ({file_count} files) under {self.root} "
+              f"- indexed in {time.time() - started:.1f}s")
+
+    def _list_tree(self, directories: List[str], executor: ThreadPoolExecutor) -> List[FileInfo]:
+        """(Re)list directories and any new subdirectories; returns files not seen before"""
+        new_files = []
+        while directories:
+            results = list(executor.map(self._list_directory, directories))
+            directories = []
+            for directory, listing, subdirs in results:
+                if listing is None:
+                    continue
+                previous = self._listings.get(directory, {})
+                for path, (size, mtime_ns) in listing.items():
+                    if previous.get(path) != (size, mtime_ns):
+                        new_files.append((path, size, mtime_ns))
+                self._listings[directory] = listing
+                directories.extend(subdir for subdir in subdirs if subdir not in self._directories)
+        return new_files
+
+    def _list_directory(self, directory: str):
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            self._directories.pop(directory, None)
+            self._listings.pop(directory, None)
+            return directory, None, []
+        files, subdirs = list_directory(directory, self.extensions)
+        self._directories[directory] = mtime_ns
+        return directory, {path: (size, mtime) for path, size, mtime in files}, subdirs
+
+    def _changed(self, directory: str) -> bool:
+        try:
+            return os.stat(directory).st_mtime_ns != self._directories.get(directory)
+        except OSError:
+            return True  # Gone - relisting drops it
+
+    def poll(self) -> List[FileInfo]:
+        """Files created or replaced since the previous poll"""
+        directories = list(self._directories)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            changed = [d for d, is_changed in zip(directories, executor.map(self._changed, directories)) if is_changed]
+            return self._list_tree(changed, executor) if changed else []
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher: 'FolderWatcher'):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.note(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.note(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.note(event.dest_path)
+
+
+class FolderWatcher:
+    """
+    Long-running watch over a folder tree that hands new image files to a callback in batches.
+
+    Uses native file system events when watchdog is installed and falls back to
+    directory-mtime polling otherwise. Files still being copied are held back until
+    their size and mtime have been stable for the debounce period.
+    """
+
+    def __init__(self, root: str, extensions: Iterable[str], debounce: float = WATCH_DEBOUNCE,
+                 poll_interval: float = WATCH_POLL_INTERVAL, use_events: bool = WATCH_USE_EVENTS):
+        self.root = os.path.abspath(root)
+        self.extensions = {ext.lower() for ext in extensions}
+        self.debounce = debounce
+        self.use_events = use_events and WATCHDOG_AVAILABLE
+        self.poll_interval = WATCH_SAFETY_POLL_INTERVAL if self.use_events else poll_interval
+        self._pending: Dict[str, Tuple[int, int, float]] = {}  # path -> (size, mtime_ns, last change)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # Index the tree now, so files arriving while a catch-up run is in progress are not missed
+        self.poller = DirectoryPoller(self.root, self.extensions)
+
+    def note(self, path: str) -> None:
+        """Register a created or modified file; it is handed over once it stops changing"""
+        if os.path.splitext(path)[1].lower() not in self.extensions:
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        self._note(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    def _note(self, path: str, size: int, mtime_ns: int) -> None:
+        with self._lock:
+            previous = self._pending.get(path)
+            if previous is None or previous[:2] != (size, mtime_ns):
+                self._pending[path] = (size, mtime_ns, time.time())
+
+    def _ready(self) -> List[FileInfo]:
+        """Pending files whose size and mtime have been stable for the debounce period"""
+        now = time.time()
+        ready = []
+        with self._lock:
+            candidates = [(path, entry) for path, entry in self._pending.items() if now - entry[2] >= self.debounce]
+        for path, (size, mtime_ns, _) in candidates:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                with self._lock:
+                    self._pending.pop(path, None)  # Deleted or renamed before it settled
+                continue
+            if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+                with self._lock:
+                    self._pending.pop(path, None)
+                ready.append((path, size, mtime_ns))
+            else:
+                self._note(path, stat.st_size, stat.st_mtime_ns)
+        return ready
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self, on_batch: Callable[[List[FileInfo]], None], tick: float = 1.0) -> None:
+        """Block until stop() (or Ctrl+C), calling on_batch with each group of settled files"""
+        observer = None
+        if self.use_events:
+            observer = Observer()
+            observer.schedule(_EventHandler(self), self.root, recursive=True)
+            observer.start()
+            print(f"👀 Using native file system events (safety poll every {self.poll_interval:.0f}s)")
+        else:
+            reason = "WATCH_USE_EVENTS=false" if WATCHDOG_AVAILABLE else "watchdog not installed"
+            print(f"👀 Polling directories every {self.poll_interval:.0f}s ({reason})")
+
+        next_poll = time.time() + self.poll_interval
+        try:
+            while not self._stop.is_set():
+                if time.time() >= next_poll:
+                    for path, size, mtime_ns in self.poller.poll():
+                        self._note(path, size, mtime_ns)
+                    next_poll = time.time() + self.poll_interval
+
+                ready = self._ready()
+                if ready:
+                    on_batch(ready)
+                self._stop.wait(tick)
+        except KeyboardInterrupt:
+            print("\n🛑 Watch mode stopped")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
@@ -0,0 +1,108 @@
+import os
+import json
+import datetime
+import threading
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+# Append-only log of per-image stage completions, used to resume interrupted runs
+INGEST_JOURNAL_PATH = os.getenv("INGEST_JOURNAL_PATH", "ingest_journal.jsonl")
+
+# Stages in the order an image goes through them
+STAGES = ['described', 'categorized', 'uploaded', 'renamed', 'recorded']
+
+
+class IngestJournal:
+    """
+    One JSON line per completed stage, keyed by content hash (file names change on rename).
+    Every line is fsynced before the next step starts, so after a crash the journal says
+    how far each image got: a restart reuses the stored description and category, skips
+    the upload if it happened, and recovers result rows for images that were renamed but
+    never written to the results file. A torn last line from a crash mid-write is ignored.
+    """
+
+    def __init__(self, path: str = INGEST_JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        self._load()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        valid_length = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Torn write from a crash
+                valid_length += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('hash') and record.get('stage') in STAGES:
+                    self._apply(record)
+        # Cut off a torn last line so new records start on a line of their own
+        if valid_length < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_length)
+
+    def _apply(self, record: Dict) -> None:
+        entry = self._entries.setdefault(record['hash'], {'stage': None})
+        previous = entry['stage']
+        entry.update(record)
+        if previous and STAGES.index(previous) > STAGES.index(record['stage']):
+            entry['stage'] = previous
+
+    def complete(self, content_hash: str, stage: str, **data) -> None:
+        """Durably record that an image finished a stage, with whatever later stages need"""
+        record = {'hash': content_hash, 'stage': stage, 'at': datetime.datetime.now().isoformat(), **data}
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._apply(record)
+
+    def resume(self, content_hash: str) -> Optional[Dict]:
+        """Progress of an image interrupted before its local rename, or None"""
+        entry = self._entries.get(content_hash)
+        if entry and STAGES.index(entry['stage']) < STAGES.index('renamed'):
+            return dict(entry)
+        return None
+
+    def has(self, content_hash: str, stage: str) -> bool:
+        entry = self._entries.get(content_hash)
+        return bool(entry) and STAGES.index(entry['stage']) >= STAGES.index(stage)
+
+    def renamed_hashes(self) -> List[str]:
+        """Images stored and renamed whose results are not recorded yet"""
+        return [h for h, entry in self._entries.items() if entry['stage'] == 'renamed']
+
+    def unrecorded_results(self) -> List[Dict]:
+        """Result rows of images that were stored and renamed but never written to the results file"""
+        return [entry['result'] for entry in self._entries.values()
+                if entry['stage'] == 'renamed' and entry.get('result')]
+
+    def compact(self) -> None:
+        """Rewrite the journal with one line per unfinished image, dropping recorded ones"""
+        with self._lock:
+            self._entries = {h: e for h, e in self._entries.items() if e['stage'] != 'recorded'}
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for entry in self._entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(temp_path, self.path)
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,232 @@
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# A bonus rule adds `points` to `category` for every term found verbatim among the description keywords.
+# The label is a format string for the match list, e.g. "fridge_bonus({term})".
+BonusRule = Tuple[str, Tuple[str, ...], int, str]
+
+
+def extract_keywords(description: str) -> Set[str]:
+    """
+    Split a description into the keyword set used for categorization:
+    comma-separated phrases plus their individual words longer than 2 characters
+    """
+    description = description.lower()
+    description_keywords = set()
+
+    # First try comma splitting
+    if ',' in description:
+        for kw in description.split(','):
+            kw = kw.strip()
+            if kw:
+                description_keywords.add(kw)
+                # Also add individual words for better matching
+                for word in kw.split():
+                    if len(word) > 2:  # Skip very short words
+                        description_keywords.add(word)
+    else:
+        # If no commas, just use word splitting
+        for word in description.split():
+            if len(word) > 2:  # Skip very short words
+                description_keywords.add(word)
+
+    return description_keywords
+
+
+class CategoryMatcher:
+    """
+    A CATEGORIES table compiled once for fast scoring.
+
+    All category keywords go into a single Aho-Corasick automaton, so finding every
+    keyword contained in every description keyword is one pass over the description.
+    Per category, keywords are pre-sorted longest first (the same specificity order the
+    original scan used) and each keyword knows which longer keywords of that category
+    contain it. A keyword only scores if none of its containers matched, which gives the
+    same result as the original "already covered by a longer match" check.
+
+    Scoring rules (unchanged): exact keyword match +2, keyword inside a description
+    keyword +1, plus any bonus rules.
+    """
+
+    def __init__(self, categories: Dict[str, List[str]], bonus_rules: Iterable[BonusRule] = (),
+                 scan_cache_size: int = 100000):
+        self.scan_cache_size = scan_cache_size
+        self._scan_cache: Dict[str, Tuple[int, ...]] = {}
+        self.category_names = list(categories.keys())
+        self.keywords: List[str] = []
+        self.keyword_ids: Dict[str, int] = {}
+
+        # Per category: keyword ids in specificity order, and for each position the
+        # earlier positions whose keyword contains this one
+        self.category_order: List[List[int]] = []
+        self.category_containers: List[List[Tuple[int, ...]]] = []
+        # keyword id -> [(category index, position)]
+        self.postings: Dict[int, List[Tuple[int, int]]] = {}
+
+        for category_index, category in enumerate(self.category_names):
+            ordered = []
+            seen = set()
+            for keyword in sorted(categories[category], key=len, reverse=True):
+                if keyword in seen:
+                    continue  # A repeated keyword is always covered by its first occurrence
+                seen.add(keyword)
+                ordered.append(self._keyword_id(keyword))
+
+            containers = []
+            for position, keyword_id in enumerate(ordered):
+                keyword = self.keywords[keyword_id]
+                containers.append(tuple(
+                    earlier for earlier in range(position)
+                    if keyword in self.keywords[ordered[earlier]]
+                ))
+                self.postings.setdefault(keyword_id, []).append((category_index, position))
+
+            self.category_order.append(ordered)
+            self.category_containers.append(containers)
+
+        # Bonus rules only apply to categories present in the table
+        self.bonus_rules: Dict[int, List[Tuple[Tuple[str, ...], int, str]]] = {}
+        for category, terms, points, label in bonus_rules:
+            if category in categories:
+                category_index = self.category_names.index(category)
+                self.bonus_rules.setdefault(category_index, []).append((tuple(terms), points, label))
+
+        self._build_automaton()
+
+    def _keyword_id(self, keyword: str) -> int:
+        keyword_id = self.keyword_ids.get(keyword)
+        if keyword_id is None:
+            keyword_id = len(self.keywords)
+            self.keywords.append(keyword)
+            self.keyword_ids[keyword] = keyword_id
+        return keyword_id
+
+    def _build_automaton(self) -> None:
+        """Build the Aho-Corasick goto/fail/output tables over all keywords"""
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+
+        for keyword_id, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                    self._goto[state][char] = next_state
+                state = next_state
+            self._output[state] = self._output[state] + (keyword_id,)
+
+        # Breadth-first pass to set failure links and merge outputs along them
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def _scan(self, text: str) -> Tuple[int, ...]:
+        """Ids of all keywords occurring anywhere in text (memoized - model vocabulary repeats a lot)"""
+        found = self._scan_cache.get(text)
+        if found is None:
+            if len(self._scan_cache) >= self.scan_cache_size:
+                self._scan_cache.clear()
+            found = self._scan_cache[text] = tuple(self._run_automaton(text))
+        return found
+
+    def _run_automaton(self, text: str) -> Set[int]:
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+    def find_keywords(self, description_keywords: Iterable[str]) -> Tuple[Dict[int, str], Set[int]]:
+        """
+        Locate category keywords in the description keywords.
+        Returns (keyword id -> first description keyword containing it, ids matched exactly).
+        """
+        hits: Dict[int, str] = {}
+        exact: Set[int] = set()
+        for desc_keyword in description_keywords:
+            keyword_id = self.keyword_ids.get(desc_keyword)
+            if keyword_id is not None:
+                exact.add(keyword_id)
+            for found_id in self._scan(desc_keyword):
+                if found_id not in hits:
+                    hits[found_id] = desc_keyword
+        return hits, exact
+
+    def score(self, description_keywords: Set[str], explain: bool = False) -> Tuple[Dict[str, int], Dict[str, List[str]]]:
+        """
+        Score every category against a set of description keywords.
+        Returns (category -> score for categories scoring above 0, category -> match labels).
+        Match labels are only built when explain is True.
+        """
+        hits, exact = self.find_keywords(description_keywords)
+
+        hit_positions: Dict[int, List[int]] = {}
+        for keyword_id in hits:
+            for category_index, position in self.postings.get(keyword_id, ()):
+                hit_positions.setdefault(category_index, []).append(position)
+
+        match_scores: Dict[str, int] = {}
+        match_details: Dict[str, List[str]] = {}
+
+        for category_index, category in enumerate(self.category_names):
+            score = 0
+            matches = []
+
+            positions = hit_positions.get(category_index)
+            if positions:
+                positions.sort()
+                hit_set = set(positions)
+                order = self.category_order[category_index]
+                containers = self.category_containers[category_index]
+                for position in positions:
+                    # Skip keywords already covered by a longer keyword of this category
+                    if any(container in hit_set for container in containers[position]):
+                        continue
+                    keyword_id = order[position]
+                    if keyword_id in exact:
+                        score += 2
+                        if explain:
+                            matches.append(self.keywords[keyword_id])
+                    else:
+                        score += 1
+                        if explain:
+                            matches.append(f"{self.keywords[keyword_id]}(in {hits[keyword_id]})")
+
+            for terms, points, label in self.bonus_rules.get(category_index, ()):
+                for term in terms:
+                    if term in description_keywords:
+                        score += points
+                        if explain:
+                            matches.append(label.format(term=term))
+
+            if score > 0:
+                match_scores[category] = score
+                if explain:
+                    match_details[category] = matches
+
+        return match_scores, match_details
+
+    def best_category(self, match_scores: Dict[str, int]) -> Optional[str]:
+        """Highest scoring category, ties going to the category listed first"""
+        if not match_scores:
+            return None
+        return max(match_scores.items(), key=lambda x: x[1])[0]
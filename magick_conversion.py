@@ -1,10 +1,150 @@
+import io
 import os
+import sys
+import time
+import argparse
 import subprocess
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# ImageMagick and ExifTool executables
+MAGICK_PATH = os.getenv("MAGICK_PATH", r"C:\Program Files\ImageMagick-7.1.1-Q16-HDRI\magick.exe")
+EXIFTOOL_PATH = r"./exiftool/exiftool.exe"
+
+RAW_EXTENSIONS = {'.dng', '.cr2'}
+# Embedded previews narrower than this are thumbnails, not usable replacements for the RAW decode
+MIN_PREVIEW_WIDTH = int(os.getenv("MIN_PREVIEW_WIDTH", "1600"))
+
+def converted_path(raw_path: Path) -> Path:
+    """Output path for a RAW file: <stem>_converted.jpg next to the source"""
+    return raw_path.with_suffix('.jpg').with_stem(f"{raw_path.stem}_converted")
+
+def copy_metadata(raw_path: Path, jpg_path: Path) -> bool:
+    """Copy the XMP location tags (and orientation/capture date) from the RAW file to the JPEG"""
+    cmd = [
+        EXIFTOOL_PATH, '-overwrite_original', '-tagsFromFile', str(raw_path),
+        '-XMP:all', '-EXIF:Orientation', '-EXIF:DateTimeOriginal', str(jpg_path)
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"⚠️ Could not copy metadata to {jpg_path.name}: {result.stderr.strip()}")
+        return False
+    return True
+
+def extract_preview(raw_path: Path, jpg_path: Path) -> bool:
+    """
+    Write the camera-embedded full-size JPEG (JpgFromRaw, else PreviewImage) to jpg_path.
+    Returns False when the file has no preview at least MIN_PREVIEW_WIDTH pixels wide.
+    """
+    for tag in ('JpgFromRaw', 'PreviewImage'):
+        result = subprocess.run([EXIFTOOL_PATH, '-b', f'-{tag}', str(raw_path)], capture_output=True)
+        data = result.stdout
+        if result.returncode != 0 or not data.startswith(b'\xff\xd8'):
+            continue
+        try:
+            with Image.open(io.BytesIO(data)) as preview:
+                width = max(preview.size)
+        except Exception:
+            continue
+        if width < MIN_PREVIEW_WIDTH:
+            continue
+
+        with open(jpg_path, 'wb') as f:
+            f.write(data)
+        copy_metadata(raw_path, jpg_path)
+        return True
+    return False
+
+def magick_decode(raw_path: Path, jpg_path: Path) -> bool:
+    """Full RAW decode with ImageMagick (slow - only used when there is no usable preview)"""
+    if not os.path.exists(MAGICK_PATH):
+        print("❌ ImageMagick not found!")
+        return False
+    cmd = [MAGICK_PATH, str(raw_path), '-quality', '95', str(jpg_path)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode == 0 and jpg_path.exists():
+        copy_metadata(raw_path, jpg_path)
+        return True
+    print(f"❌ Conversion failed: {result.stderr}")
+    return False
+
+def convert_raw_file(raw_path: Path) -> Optional[Path]:
+    """
+    Convert a CR2/DNG file to <stem>_converted.jpg, using the embedded preview when
+    there is a full-size one and ImageMagick otherwise. Returns the JPEG path, or None.
+    """
+    raw_path = Path(raw_path)
+    jpg_path = converted_path(raw_path)
+    try:
+        if extract_preview(raw_path, jpg_path):
+            print(f"⚡ Extracted embedded preview: {raw_path.name} → {jpg_path.name}")
+            return jpg_path
+        print(f"🐢 No full-size preview in {raw_path.name}, decoding with ImageMagick...")
+        if magick_decode(raw_path, jpg_path):
+            print(f"✅ Decoded: {raw_path.name} → {jpg_path.name}")
+            return jpg_path
+    except Exception as e:
+        print(f"❌ Error converting {raw_path.name}: {e}")
+    return None
+
+def is_up_to_date(raw_path: Path) -> bool:
+    """True when the converted JPEG exists and is newer than its RAW source"""
+    jpg_path = converted_path(Path(raw_path))
+    try:
+        return jpg_path.stat().st_mtime >= Path(raw_path).stat().st_mtime
+    except OSError:
+        return False
+
+def _timed_conversion(raw_path: str) -> Tuple[str, Optional[str], float]:
+    """Worker entry point: (raw path, JPEG path or None, seconds)"""
+    started = time.time()
+    jpg_path = convert_raw_file(Path(raw_path))
+    return raw_path, str(jpg_path) if jpg_path else None, time.time() - started
+
+def convert_raw_files(raw_files: List[Path], max_workers: Optional[int] = None) -> Dict[Path, Optional[Path]]:
+    """
+    Convert RAW files on a thread pool, one ExifTool/ImageMagick job per core. The work runs in
+    those subprocesses, so threads are enough, and unlike a process pool nothing is re-imported
+    (Windows starts worker processes by re-importing the main module, e.g. all of s3.py's setup).
+    Returns RAW path -> converted JPEG path (None for failures) and prints per-file
+    timing and overall throughput.
+    """
+    if not raw_files:
+        return {}
+    max_workers = max_workers or os.cpu_count() or 1
+    total_mb = sum(Path(f).stat().st_size for f in raw_files) / (1024*1024)
+    print(f"🔄 Converting {len(raw_files)} RAW files ({total_mb:.0f} MB) with {max_workers} workers...")
+
+    results: Dict[Path, Optional[Path]] = {}
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='raw-convert') as executor:
+        futures = [executor.submit(_timed_conversion, str(f)) for f in raw_files]
+        for done, future in enumerate(as_completed(futures), 1):
+            raw_path, jpg_path, seconds = future.result()
+            results[Path(raw_path)] = Path(jpg_path) if jpg_path else None
+            status = f"→ {Path(jpg_path).name}" if jpg_path else "failed"
+            print(f"  [{done}/{len(raw_files)}] {Path(raw_path).name} {status} in {seconds:.1f}s")
+
+    elapsed = time.time() - started
+    converted = sum(1 for jpg_path in results.values() if jpg_path)
+    print(f"📊 Converted {converted}/{len(raw_files)} in {elapsed:.1f}s "
+          f"({len(raw_files) / max(elapsed, 1e-9):.2f} files/s, {total_mb / max(elapsed, 1e-9):.1f} MB/s)")
+    return results
+
+def convert_tree(root: str, max_workers: Optional[int] = None) -> Dict[Path, Optional[Path]]:
+    """Convert every RAW file under root whose _converted.jpg is missing or older than the source"""
+    from file_scanner import walk_files
+
+    raw_files = [Path(path) for path, _, _ in walk_files(root, RAW_EXTENSIONS)]
+    stale = [f for f in raw_files if not is_up_to_date(f)]
+    print(f"📸 Found {len(raw_files)} RAW files, {len(raw_files) - len(stale)} already converted")
+    return convert_raw_files(stale, max_workers)
+
 def simple_conversion_test():
     """Simple test for DNG/CR2 to JPG conversion"""
     
@@ -20,13 +160,6 @@ def simple_conversion_test():
     
     print(f"📂 Using: {NETWORK_PATH}")
     
-    # ImageMagick path
-    magick_path = r"C:\Program Files\ImageMagick-7.1.1-Q16-HDRI\magick.exe"
-    
-    if not os.path.exists(magick_path):
-        print("❌ ImageMagick not found!")
-        return False
-    
     # Look for DNG/CR2 files in main directory only
     network_dir = Path(NETWORK_PATH)
     raw_files = list(network_dir.glob('*.DNG')) + list(network_dir.glob('*.dng')) + \
@@ -45,29 +178,16 @@ def simple_conversion_test():
     total_count = len(raw_files)
     
     for test_file in raw_files:
-        jpg_path = test_file.with_suffix('.jpg').with_stem(f"{test_file.stem}_converted")
-        
-        print(f"\n🔄 Converting: {test_file.name} → {jpg_path.name}")
+        print(f"\n🔄 Converting: {test_file.name} → {converted_path(test_file).name}")
         
-        # Convert
-        cmd = [magick_path, str(test_file), '-quality', '95', str(jpg_path)]
-        
-        try:
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            
-            if result.returncode == 0 and jpg_path.exists():
-                print("✅ Conversion successful!")
-                
-                # Show file sizes
-                raw_size = test_file.stat().st_size / (1024*1024)
-                jpg_size = jpg_path.stat().st_size / (1024*1024)
-                print(f"📊 RAW: {raw_size:.1f}MB → JPG: {jpg_size:.1f}MB")
-                success_count += 1
-            else:
-                print(f"❌ Conversion failed: {result.stderr}")
-                
-        except Exception as e:
-            print(f"❌ Error: {e}")
+        # Embedded preview when available, full ImageMagick decode otherwise
+        jpg_path = convert_raw_file(test_file)
+        if jpg_path:
+            # Show file sizes
+            raw_size = test_file.stat().st_size / (1024*1024)
+            jpg_size = jpg_path.stat().st_size / (1024*1024)
+            print(f"📊 RAW: {raw_size:.1f}MB → JPG: {jpg_size:.1f}MB")
+            success_count += 1
     
     print(f"\n📊 Conversion Summary:")
     print(f"✅ Successfully converted: {success_count}/{total_count} files")
@@ -75,10 +195,25 @@ def simple_conversion_test():
     return success_count > 0
 
 if __name__ == "__main__":
-    print("🚀 Simple RAW to JPG Test")
-    print("-" * 30)
-    
-    if simple_conversion_test():
-        print("\n✅ Ready to convert all RAW files!")
+    parser = argparse.ArgumentParser(description="Convert RAW (CR2/DNG) files to JPEG")
+    parser.add_argument('--path', default=os.getenv("NETWORK_PATH"), help="Folder to convert recursively (default: NETWORK_PATH)")
+    parser.add_argument('--workers', type=int, default=None, help="Parallel conversions (default: number of cores)")
+    parser.add_argument('--test', action='store_true', help="Only convert RAW files in the top-level folder, one at a time")
+    args = parser.parse_args()
+
+    if args.test:
+        print("🚀 Simple RAW to JPG Test")
+        print("-" * 30)
+        
+        if simple_conversion_test():
+            print("\n✅ Ready to convert all RAW files!")
+        else:
+            print("\n❌ Fix issues before proceeding")
     else:
-        print("\n❌ Fix issues before proceeding")
\ No newline at end of file
+        if not args.path or not os.path.exists(args.path):
+            print(f"❌ Folder does not exist: {args.path}")
+            sys.exit(1)
+        print(f"📂 Using: {args.path}")
+        results = convert_tree(args.path, args.workers)
+        if any(jpg_path is None for jpg_path in results.values()):
+            sys.exit(1)
\ No newline at end of file
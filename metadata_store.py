@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+# 'sqlite' (default), 'mysql' (uses the MYSQL_* settings) or 'off'
+METADATA_STORE = os.getenv("METADATA_STORE", "sqlite").lower()
+METADATA_DB_PATH = os.getenv("METADATA_DB_PATH", "processed_images.sqlite")
+# Records are committed in one transaction per batch, or sooner once the oldest has waited this long
+METADATA_BATCH_SIZE = int(os.getenv("METADATA_BATCH_SIZE", "25"))
+METADATA_FLUSH_INTERVAL = float(os.getenv("METADATA_FLUSH_INTERVAL", "30"))
+# Rows from failed flushes kept for a retry; past this they are dropped into MetadataStore.failed
+METADATA_MAX_PENDING = int(os.getenv("METADATA_MAX_PENDING", "500"))
+
+COLUMNS = [
+    's3_key', 'local_file', 'content_sha256', 'description', 'category', 'location_folder',
+    'xmp_street', 'xmp_city', 'xmp_state', 'xmp_zipcode', 'xmp_location', 'category_matches',
+    'uploaded_at', 'metadata'
+]
+
+# MySQL column definitions, also used to add columns missing from tables made with the older README schema
+MYSQL_COLUMNS = {
+    's3_key': 'VARCHAR(500) NOT NULL',
+    'local_file': 'VARCHAR(500)',
+    'content_sha256': 'CHAR(64)',
+    'description': 'TEXT',
+    'category': 'VARCHAR(100)',
+    'location_folder': 'VARCHAR(200)',
+    'xmp_street': 'VARCHAR(200)',
+    'xmp_city': 'VARCHAR(100)',
+    'xmp_state': 'VARCHAR(50)',
+    'xmp_zipcode': 'VARCHAR(20)',
+    'xmp_location': 'VARCHAR(500)',
+    'category_matches': 'JSON',
+    'uploaded_at': 'DATETIME',
+    'metadata': 'JSON',
+}
+
+
+def record_row(result: Dict) -> tuple:
+    """Flatten a pipeline result (as written to s3_location_processed_images.json) into a table row"""
+    metadata = result.get('metadata', {})
+    xmp_data = metadata.get('xmp_data', {})
+    return (
+        result.get('s3_key'),
+        result.get('local_file'),
+        result.get('content_sha256'),
+        result.get('description'),
+        result.get('category'),
+        result.get('location_folder'),
+        xmp_data.get('Street', ''),
+        xmp_data.get('City', ''),
+        xmp_data.get('State', ''),
+        xmp_data.get('PostalCode', ''),
+        xmp_data.get('Location', ''),
+        json.dumps(metadata.get('category_matches', {})),
+        result.get('uploaded_at'),
+        json.dumps(metadata, ensure_ascii=False, default=str),
+    )
+
+
+def s3_style_metadata(row: Dict) -> Dict:
+    """A stored row in the shape of the S3 object metadata the dashboard reads"""
+    return {
+        'description': row.get('description') or '',
+        'category': row.get('category') or '',
+        'xmp-street': row.get('xmp_street') or '',
+        'xmp-city': row.get('xmp_city') or '',
+        'xmp-state': row.get('xmp_state') or '',
+        'xmp-zipcode': row.get('xmp_zipcode') or '',
+        'xmp-location': row.get('xmp_location') or '',
+        'content-sha256': row.get('content_sha256') or '',
+        'processing-timestamp': str(row.get('uploaded_at') or ''),
+    }
+
+
+class MetadataStore(ABC):
+    """
+    processed_images table written in batched transactions as images are processed.
+    Rows are upserted on s3_key, so re-processing an image updates its row.
+
+    Subclasses open self.conn (a DB-API connection with the processed_images table),
+    set placeholder to their driver's parameter marker and provide _upsert_sql.
+    """
+
+    placeholder = '?'
+    conn = None
+
+    def __init__(self, batch_size: int = METADATA_BATCH_SIZE, flush_interval: float = METADATA_FLUSH_INTERVAL,
+                 max_pending: int = METADATA_MAX_PENDING):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max(max_pending, batch_size)
+        self.written = 0
+        # Rows given up on after a failed flush
+        self.failed: List[tuple] = []
+        self._pending: List[tuple] = []
+        self._oldest_pending = None
+        self._retry_after = 0.0
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _upsert_sql(self) -> str:
+        """INSERT of one row of COLUMNS that updates the existing row on a duplicate s3_key"""
+
+    def add(self, result: Dict) -> None:
+        """Queue a processed image; commits when the batch is full or has waited long enough"""
+        with self._lock:
+            self._pending.append(record_row(result))
+            if self._oldest_pending is None:
+                self._oldest_pending = time.time()
+            now = time.time()
+            due = len(self._pending) >= self.max_pending or now >= self._retry_after and (
+                len(self._pending) >= self.batch_size or now - self._oldest_pending >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self) -> bool:
+        """Commit all queued rows in one transaction"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+            self._oldest_pending = None
+            if not rows:
+                return True
+            try:
+                cursor = self.conn.cursor()
+                cursor.executemany(self._upsert_sql(), rows)
+                self.conn.commit()
+                cursor.close()
+                self.written += len(rows)
+                return True
+            except Exception as e:
+                print(f"❌ Could not write {len(rows)} records to the metadata store: {e}")
+                try:
+                    self.conn.rollback()
+                except Exception:
+                    pass
+                # Keep them for a later flush (not before flush_interval), up to max_pending rows
+                rows = rows + self._pending
+                self._pending = rows[:self.max_pending]
+                dropped = rows[self.max_pending:]
+                if dropped:
+                    self.failed.extend(dropped)
+                    print(f"❌ Gave up on {len(dropped)} metadata store records ({len(self.failed)} in total); "
+                          f"they are still in the results file")
+                self._oldest_pending = time.time()
+                self._retry_after = self._oldest_pending + self.flush_interval
+                return False
+
+    @property
+    def unsaved(self) -> int:
+        """Rows not written: still queued after a failed flush, or given up on"""
+        return len(self._pending) + len(self.failed)
+
+    def rename(self, old_key: str, new_key: str, category: str) -> None:
+        """Move an image's row to its new S3 key and category (after a reorganization)"""
+        self.flush()
+        mark = self.placeholder
+        with self._lock:
+            cursor = self.conn.cursor()
+            # Nothing is stored at new_key any more, so a row there is stale
+            cursor.execute(f"DELETE FROM processed_images WHERE s3_key = {mark}", (new_key,))
+            cursor.execute(f"UPDATE processed_images SET s3_key = {mark}, category = {mark} WHERE s3_key = {mark}",
+                           (new_key, category, old_key))
+            self.conn.commit()
+            cursor.close()
+
+    def _query(self, sql: str, params: Iterable) -> List[Dict]:
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute(sql, tuple(params))
+            names = [column[0] for column in cursor.description]
+            rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+            cursor.close()
+        return rows
+
+    def get_by_keys(self, s3_keys: List[str], chunk_size: int = 500) -> Dict[str, Dict]:
+        """s3_key -> row for the stored keys among s3_keys"""
+        found = {}
+        for start in range(0, len(s3_keys), chunk_size):
+            chunk = s3_keys[start:start + chunk_size]
+            marks = ', '.join([self.placeholder] * len(chunk))
+            for row in self._query(f"SELECT * FROM processed_images WHERE s3_key IN ({marks})", chunk):
+                found[row['s3_key']] = row
+        return found
+
+    def list_location(self, location_folder: str, category: Optional[str] = None) -> List[Dict]:
+        sql = f"SELECT * FROM processed_images WHERE location_folder = {self.placeholder}"
+        params = [location_folder]
+        if category:
+            sql += f" AND category = {self.placeholder}"
+            params.append(category)
+        return self._query(sql + " ORDER BY s3_key", params)
+
+    def list_prefix(self, prefix: str, limit: int = 1000) -> List[Dict]:
+        """Rows whose S3 key starts with prefix, in key order like a LIST"""
+        mark = self.placeholder
+        sql = f"SELECT * FROM processed_images WHERE SUBSTR(s3_key, 1, {mark}) = {mark} ORDER BY s3_key LIMIT {mark}"
+        return self._query(sql, [len(prefix), prefix, limit])
+
+    def location_folders(self) -> List[str]:
+        rows = self._query("SELECT DISTINCT location_folder FROM processed_images WHERE location_folder IS NOT NULL", [])
+        return [row['location_folder'] for row in rows]
+
+    def categories(self, location_folder: str) -> List[str]:
+        sql = f"SELECT DISTINCT category FROM processed_images WHERE location_folder = {self.placeholder} AND category IS NOT NULL"
+        return sorted(row['category'] for row in self._query(sql, [location_folder]))
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self.conn.close()
+
+
+class SQLiteMetadataStore(MetadataStore):
+    placeholder = '?'
+
+    def __init__(self, path: str = METADATA_DB_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS processed_images (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                s3_key TEXT NOT NULL UNIQUE,
+                local_file TEXT,
+                content_sha256 TEXT,
+                description TEXT,
+                category TEXT,
+                location_folder TEXT,
+                xmp_street TEXT,
+                xmp_city TEXT,
+                xmp_state TEXT,
+                xmp_zipcode TEXT,
+                xmp_location TEXT,
+                category_matches TEXT,
+                uploaded_at TEXT,
+                metadata TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS processed_images_location ON processed_images (location_folder, category)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS processed_images_hash ON processed_images (content_sha256)")
+        self.conn.commit()
+
+    def _upsert_sql(self) -> str:
+        updates = ', '.join(f"{column}=excluded.{column}" for column in COLUMNS[1:])
+        return (f"INSERT INTO processed_images ({', '.join(COLUMNS)}) VALUES ({', '.join(['?'] * len(COLUMNS))}) "
+                f"ON CONFLICT(s3_key) DO UPDATE SET {updates}")
+
+
+class MySQLMetadataStore(MetadataStore):
+    placeholder = '%s'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        import mysql.connector
+
+        self.conn = mysql.connector.connect(
+            host=os.getenv("MYSQL_HOST", "localhost"),
+            user=os.getenv("MYSQL_USER"),
+            password=os.getenv("MYSQL_PASSWORD"),
+            database=os.getenv("MYSQL_DATABASE"),
+            autocommit=False
+        )
+        cursor = self.conn.cursor()
+        columns = ',\n'.join(f"                {column} {definition}" for column, definition in MYSQL_COLUMNS.items())
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS processed_images (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+{columns},
+                UNIQUE KEY processed_images_s3_key (s3_key),
+                KEY processed_images_location (location_folder, category),
+                KEY processed_images_hash (content_sha256)
+            )
+        """)
+        self._migrate(cursor)
+        self.conn.commit()
+        cursor.close()
+
+    def _migrate(self, cursor) -> None:
+        """Bring a processed_images table created from the older README schema up to date"""
+        cursor.execute("SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'processed_images'")
+        existing = {row[0].lower() for row in cursor.fetchall()}
+        for column, definition in MYSQL_COLUMNS.items():
+            if column not in existing:
+                print(f"🔧 Adding column {column} to processed_images")
+                cursor.execute(f"ALTER TABLE processed_images ADD COLUMN {column} {definition.replace(' NOT NULL', '')}")
+
+        cursor.execute("SELECT INDEX_NAME, NON_UNIQUE, COLUMN_NAME FROM information_schema.STATISTICS "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'processed_images'")
+        indexes = cursor.fetchall()
+        index_names = {row[0] for row in indexes}
+        s3_key_unique = any(int(row[1]) == 0 and row[2].lower() == 's3_key' and
+                            sum(1 for other in indexes if other[0] == row[0]) == 1 for row in indexes)
+        if not s3_key_unique:
+            # The upsert relies on s3_key being unique; adding the key fails (or is wrong) with duplicate rows
+            cursor.execute("SELECT s3_key, COUNT(*) FROM processed_images GROUP BY s3_key HAVING COUNT(*) > 1 LIMIT 5")
+            duplicates = cursor.fetchall()
+            if duplicates:
+                examples = ', '.join(f"{key} ({count} rows)" for key, count in duplicates)
+                raise RuntimeError(f"processed_images has several rows per s3_key (e.g. {examples}); "
+                                   f"remove the duplicates so a unique key on s3_key can be added")
+            print("🔧 Adding unique key on processed_images.s3_key")
+            cursor.execute("ALTER TABLE processed_images ADD UNIQUE KEY processed_images_s3_key (s3_key)")
+        if 'processed_images_location' not in index_names:
+            cursor.execute("ALTER TABLE processed_images ADD KEY processed_images_location (location_folder, category)")
+        if 'processed_images_hash' not in index_names:
+            cursor.execute("ALTER TABLE processed_images ADD KEY processed_images_hash (content_sha256)")
+
+    def _upsert_sql(self) -> str:
+        updates = ', '.join(f"{column}=VALUES({column})" for column in COLUMNS[1:])
+        return (f"INSERT INTO processed_images ({', '.join(COLUMNS)}) VALUES ({', '.join(['%s'] * len(COLUMNS))}) "
+                f"ON DUPLICATE KEY UPDATE {updates}")
+
+
+def open_metadata_store(kind: str = METADATA_STORE) -> Optional[MetadataStore]:
+    """The configured metadata store, or None when disabled or unavailable"""
+    try:
+        if kind == 'sqlite':
+            return SQLiteMetadataStore()
+        if kind == 'mysql':
+            return MySQLMetadataStore()
+    except Exception as e:
+        print(f"⚠️ Metadata store ({kind}) unavailable: {e}")
+    return None
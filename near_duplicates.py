@@ -0,0 +1,164 @@
+import os
+import sqlite3
+import datetime
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+from dotenv import load_dotenv
+
+from file_scanner import SCAN_MANIFEST_PATH
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+# Hamming distance (out of 64 bits) up to which two images count as near-duplicates
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("NEAR_DUPLICATE_DISTANCE", "4"))
+# What to do with a near-duplicate of an image at the same location:
+# 'reuse' its description (no LLaVA call), 'skip' it entirely, or 'off'
+NEAR_DUPLICATE_ACTION = os.getenv("NEAR_DUPLICATE_ACTION", "reuse").lower()
+
+
+def dhash(image_path: str, hash_size: int = 8) -> Optional[int]:
+    """
+    Difference hash: shrink to (hash_size + 1) x hash_size greyscale and record whether
+    each pixel is brighter than its right neighbour. Burst frames differ in a few bits.
+    """
+    try:
+        with Image.open(image_path) as img:
+            # Let the JPEG decoder downscale while decoding instead of decoding full size
+            img.draft('L', (hash_size * 16, hash_size * 16))
+            pixels = list(img.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    except Exception as e:
+        print(f"⚠️ Could not compute perceptual hash for {image_path}: {e}")
+        return None
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes for Hamming-radius queries"""
+
+    def __init__(self):
+        self._root = None  # [hash, items, {distance: child}]
+        self.size = 0
+
+    def add(self, value: int, item: Dict) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, Dict]]:
+        """All items within radius, closest first"""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.extend((distance, item) for item in node[1])
+            # Triangle inequality: only subtrees at distance-radius..distance+radius can match
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        found.sort(key=lambda match: match[0])
+        return found
+
+
+class NearDuplicateIndex:
+    """
+    Perceptual hashes of stored images, one BK-tree per location folder.
+
+    Stored images are kept in a SQLite table next to the scan manifest along with
+    their description and category, so a near-duplicate can reuse them. Images still
+    pending in the current run can be added too; their item dict is filled in once
+    they are stored.
+    """
+
+    def __init__(self, db_path: str = SCAN_MANIFEST_PATH, max_distance: int = NEAR_DUPLICATE_DISTANCE):
+        self.max_distance = max_distance
+        self._trees: Dict[str, BKTree] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS perceptual_hashes (
+                location TEXT NOT NULL,
+                dhash TEXT NOT NULL,
+                stored_as TEXT NOT NULL,
+                description TEXT,
+                category TEXT,
+                recorded_at TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS perceptual_hashes_location ON perceptual_hashes (location)")
+        self._conn.commit()
+
+    def _tree(self, location: str) -> BKTree:
+        tree = self._trees.get(location)
+        if tree is None:
+            tree = BKTree()
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT dhash, stored_as, description, category FROM perceptual_hashes WHERE location = ?",
+                    (location,)
+                ).fetchall()
+            for value, stored_as, description, category in rows:
+                tree.add(int(value, 16), {'stored_as': stored_as, 'description': description, 'category': category})
+            self._trees[location] = tree
+        return tree
+
+    def find(self, location: str, value: int) -> Optional[Tuple[int, Dict]]:
+        """Closest image at the location within the distance limit, as (distance, item)"""
+        matches = self._tree(location).search(value, self.max_distance)
+        return matches[0] if matches else None
+
+    def add(self, location: str, value: int, item: Dict) -> None:
+        """Make an image (stored or still pending) findable for later lookups"""
+        self._tree(location).add(value, item)
+
+    def record(self, location: str, value: int, stored_as: str, description: str, category: str) -> None:
+        """Persist a stored image's hash with its description and category"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO perceptual_hashes (location, dhash, stored_as, description, category, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (location, f"{value:016x}", stored_as, description, category, datetime.datetime.now().isoformat())
+            )
+            self._conn.commit()
+
+    def rename(self, old_stored_as: str, new_stored_as: str, category: str) -> None:
+        """Re-point entries at an image that was moved (e.g. to another category folder)"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE perceptual_hashes SET stored_as = ?, category = ? WHERE stored_as = ?",
+                (new_stored_as, category, old_stored_as)
+            )
+            self._conn.commit()
+            self._trees.clear()  # Reloaded from the table on next use
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
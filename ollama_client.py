@@ -0,0 +1,260 @@
+import os
+import json
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Set
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from dotenv import load_dotenv
+
+from adaptive_concurrency import AIMDLimiter
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+# Configuration: comma-separated list of Ollama servers, e.g. "http://gpu1:11434,http://gpu2:11434"
+OLLAMA_BACKENDS = [url.strip() for url in os.getenv("OLLAMA_BACKENDS", "http://localhost:11434").split(',') if url.strip()]
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "8"))  # Pooled connections kept open per backend
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "30"))  # Seconds before re-probing a down backend
+OLLAMA_STREAM = os.getenv("OLLAMA_STREAM", "true").lower() in ("1", "true", "yes")  # Stream and stop at the keyword limit
+
+
+def is_timeout(error: requests.exceptions.RequestException) -> bool:
+    """
+    True for timeouts, including a streamed response stalling between chunks, which
+    requests raises as a ConnectionError wrapping urllib3's ReadTimeoutError
+    """
+    if isinstance(error, requests.exceptions.Timeout):
+        return True
+    return isinstance(error, requests.exceptions.ConnectionError) and any(
+        isinstance(arg, ReadTimeoutError) for arg in error.args)
+
+
+class OllamaBackend:
+    """A single Ollama server with its in-flight request count and health state"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self.outstanding = 0
+        self.healthy = True
+        self.last_checked = 0.0
+        self.completed = 0
+        self.failures = 0
+
+    def __repr__(self) -> str:
+        return f"OllamaBackend({self.url}, outstanding={self.outstanding}, healthy={self.healthy})"
+
+
+class OllamaClient:
+    """
+    Pooled HTTP client for one or more Ollama servers.
+    Requests go to the healthy backend with the fewest outstanding requests;
+    a failed attempt fails over to a different backend before any backend is retried.
+    """
+
+    def __init__(self, backend_urls: Optional[List[str]] = None, pool_size: int = OLLAMA_POOL_SIZE,
+                 health_interval: float = OLLAMA_HEALTH_INTERVAL, limiter: Optional[AIMDLimiter] = None):
+        urls = backend_urls or OLLAMA_BACKENDS
+        self.backends = [OllamaBackend(url) for url in urls]
+        self.health_interval = health_interval
+        self.limiter = limiter  # Optional adaptive cap on requests in flight across all backends
+        self.ttft_samples = deque(maxlen=500)  # Recent time-to-first-token values from streamed requests
+        self._lock = threading.Lock()
+
+        # One session shared by all threads, with a connection pool sized for concurrent requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.backends), pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def check_backend(self, backend: OllamaBackend) -> bool:
+        """Probe a single backend via /api/tags and record the result"""
+        try:
+            response = self.session.get(f"{backend.url}/api/tags", timeout=5)
+            healthy = response.status_code == 200
+        except requests.exceptions.RequestException:
+            healthy = False
+        with self._lock:
+            backend.healthy = healthy
+            backend.last_checked = time.time()
+        return healthy
+
+    def check_health(self) -> bool:
+        """Probe every backend; returns True if at least one is usable"""
+        any_healthy = False
+        for backend in self.backends:
+            if self.check_backend(backend):
+                print(f"✅ Ollama backend is running: {backend.url}")
+                any_healthy = True
+            else:
+                print(f"❌ Ollama backend unavailable: {backend.url}")
+        return any_healthy
+
+    def _refresh_down_backends(self) -> None:
+        """Re-probe backends marked down once their health interval has elapsed"""
+        now = time.time()
+        for backend in self.backends:
+            if not backend.healthy and now - backend.last_checked >= self.health_interval:
+                if self.check_backend(backend):
+                    print(f"🔁 Ollama backend recovered: {backend.url}")
+
+    def _acquire(self, tried: Set[str]) -> Optional[OllamaBackend]:
+        """Pick the healthy backend with the fewest outstanding requests, preferring ones not yet tried"""
+        self._refresh_down_backends()
+        with self._lock:
+            # If every backend is marked down, try them anyway rather than failing outright
+            pool = [b for b in self.backends if b.healthy] or self.backends
+            candidates = [b for b in pool if b.url not in tried] or pool
+            if not candidates:
+                return None
+            backend = min(candidates, key=lambda b: b.outstanding)
+            backend.outstanding += 1
+            return backend
+
+    def _release(self, backend: OllamaBackend, ok: bool, mark_down: bool = False) -> None:
+        with self._lock:
+            backend.outstanding -= 1
+            if ok:
+                backend.completed += 1
+            else:
+                backend.failures += 1
+            if mark_down:
+                backend.healthy = False
+                backend.last_checked = time.time()
+
+    def _request(self, payload: Dict, timeout: float, max_attempts: int,
+                 read_response: Callable[[requests.Response, float], Dict], stream: bool = False) -> Optional[Dict]:
+        """
+        POST a payload to /api/generate with failover and decode it with read_response.
+        Returns None once max_attempts have failed across the available backends.
+        """
+        tried = set()
+        for attempt in range(max_attempts):
+            # Wait for a slot from the adaptive limiter (if any) before picking a backend
+            started_at = self.limiter.acquire() if self.limiter else None
+            backend = self._acquire(tried)
+            if backend is None:
+                if self.limiter:
+                    self.limiter.release(started_at, succeeded=False)
+                print("❌ No Ollama backends configured")
+                return None
+            tried.add(backend.url)
+
+            result = None
+            timed_out = False
+            try:
+                sent_at = time.time()
+                with self.session.post(f"{backend.url}/api/generate", json=payload, timeout=timeout, stream=stream) as response:
+                    if response.status_code == 200:
+                        result = read_response(response, sent_at)
+                        self._release(backend, ok=True)
+                    else:
+                        print(f"❌ Error from {backend.url}: HTTP {response.status_code} - {response.text}")
+                        self._release(backend, ok=False, mark_down=response.status_code >= 500)
+
+            except requests.exceptions.RequestException as e:
+                if is_timeout(e):
+                    # A timeout means the backend is busy, not down - just avoid it for this request
+                    print(f"⚠️ Timeout from {backend.url} on attempt {attempt + 1}/{max_attempts}")
+                    timed_out = True
+                    self._release(backend, ok=False)
+                else:
+                    print(f"❌ Connection error from {backend.url} on attempt {attempt + 1}/{max_attempts}: {str(e)}")
+                    self._release(backend, ok=False, mark_down=True)
+
+            except ValueError as e:
+                print(f"❌ Invalid response from {backend.url} on attempt {attempt + 1}/{max_attempts}: {str(e)}")
+                self._release(backend, ok=False)
+
+            finally:
+                if self.limiter:
+                    self.limiter.release(started_at, timed_out=timed_out, succeeded=result is not None)
+
+            if result is not None:
+                return result
+            if attempt < max_attempts - 1:
+                print("Retrying..." if len(self.backends) == 1 else "Retrying on another backend...")
+
+        return None
+
+    def generate(self, payload: Dict, timeout: float = 300, max_attempts: int = 3) -> Optional[Dict]:
+        """
+        POST a payload to /api/generate and return the decoded JSON response.
+        Returns None once max_attempts have failed across the available backends.
+        """
+        return self._request(dict(payload, stream=False), timeout, max_attempts, lambda response, sent_at: response.json())
+
+    def generate_stream(self, payload: Dict, timeout: float = 300, max_attempts: int = 3,
+                        max_keywords: Optional[int] = None) -> Optional[Dict]:
+        """
+        Stream a generation from /api/generate, accumulating tokens as they arrive.
+        If max_keywords is set, the connection is closed (which stops generation on the
+        server) as soon as that many comma-separated keywords are complete.
+        Returns {'response', 'time_to_first_token', 'stopped_early'} or None on failure.
+        """
+        def read_stream(response: requests.Response, sent_at: float) -> Dict:
+            time_to_first_token = None
+            chunks = []
+            complete_keywords = 0
+            segment = ''  # Text since the last comma
+            stopped_early = False
+
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                message = json.loads(line)
+                if message.get('error'):
+                    raise ValueError(message['error'])
+                token = message.get('response', '')
+                if token:
+                    if time_to_first_token is None:
+                        time_to_first_token = time.time() - sent_at
+                    chunks.append(token)
+
+                    if max_keywords:
+                        # Count keywords closed off by a comma in this token
+                        pieces = (segment + token).split(',')
+                        complete_keywords += sum(1 for piece in pieces[:-1] if piece.strip())
+                        segment = pieces[-1]
+                        if complete_keywords >= max_keywords:
+                            stopped_early = True
+                            break
+
+                if message.get('done'):
+                    break
+
+            if time_to_first_token is not None:
+                with self._lock:
+                    self.ttft_samples.append(time_to_first_token)
+
+            return {
+                'response': ''.join(chunks),
+                'time_to_first_token': time_to_first_token,
+                'stopped_early': stopped_early
+            }
+
+        return self._request(dict(payload, stream=True), timeout, max_attempts, read_stream, stream=True)
+
+    def average_time_to_first_token(self) -> Optional[float]:
+        """Mean time-to-first-token over streamed requests so far"""
+        with self._lock:
+            if not self.ttft_samples:
+                return None
+            return sum(self.ttft_samples) / len(self.ttft_samples)
+
+    def stats(self) -> List[Dict]:
+        """Snapshot of per-backend counters for progress output"""
+        with self._lock:
+            return [
+                {
+                    'url': b.url,
+                    'healthy': b.healthy,
+                    'outstanding': b.outstanding,
+                    'completed': b.completed,
+                    'failures': b.failures
+                }
+                for b in self.backends
+            ]
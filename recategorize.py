@@ -0,0 +1,321 @@
+import os
+import re
+import sys
+import json
+import argparse
+import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from dotenv import load_dotenv
+
+from categories import category_matcher_for
+from keyword_matcher import CategoryMatcher, extract_keywords
+from results_log import merge_results, results_path
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+DEFAULT_CATEGORY = "interior_warehouse"  # Same fallback as categorize_image
+DIFF_FILENAME = "recategorization_diff.json"
+S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
+
+
+class VectorizedCategoryScorer:
+    """
+    Scores many descriptions at once with sparse matrix products.
+
+    Reproduces CategoryMatcher.score: with E the document x keyword matrix
+    (2 = exact match, 1 = keyword inside a description keyword) and H = (E > 0),
+    a keyword in category c is covered when H @ C_c is non-zero, where C_c marks
+    which longer keywords of c contain it. The category score is the sum of E over
+    uncovered keywords plus bonus terms.
+    """
+
+    def __init__(self, matcher: CategoryMatcher):
+        self.matcher = matcher
+        self.category_names = matcher.category_names
+        n_keywords = len(matcher.keywords)
+
+        # Per category: the keyword columns it uses and a local containment matrix
+        self.category_columns: List[np.ndarray] = []
+        self.category_containment: List[sparse.csr_matrix] = []
+        for order, containers in zip(matcher.category_order, matcher.category_containers):
+            rows, cols = [], []
+            for position, container_positions in enumerate(containers):
+                for container in container_positions:
+                    rows.append(container)
+                    cols.append(position)
+            size = len(order)
+            self.category_columns.append(np.array(order, dtype=np.int64))
+            self.category_containment.append(
+                sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(size, size))
+            )
+
+        # Bonus terms become columns of a second matrix, weighted per category
+        self.bonus_terms: Dict[str, int] = {}
+        bonus_rows, bonus_cols, bonus_points = [], [], []
+        for category_index, rules in matcher.bonus_rules.items():
+            for terms, points, _label in rules:
+                for term in terms:
+                    term_id = self.bonus_terms.setdefault(term, len(self.bonus_terms))
+                    bonus_rows.append(term_id)
+                    bonus_cols.append(category_index)
+                    bonus_points.append(points)
+        self.bonus_weights = sparse.csr_matrix(
+            (np.array(bonus_points, dtype=np.int32), (bonus_rows, bonus_cols)),
+            shape=(len(self.bonus_terms), len(self.category_names))
+        )
+        self.n_keywords = n_keywords
+
+    def keyword_matrices(self, descriptions: List[str]) -> Tuple[sparse.csr_matrix, sparse.csr_matrix]:
+        """Build the document x keyword match matrix and the document x bonus term matrix"""
+        rows, cols, values = [], [], []
+        bonus_rows, bonus_cols = [], []
+
+        for doc, description in enumerate(descriptions):
+            if not description:
+                continue
+            description_keywords = extract_keywords(description)
+            hits, exact = self.matcher.find_keywords(description_keywords)
+            for keyword_id in hits:
+                rows.append(doc)
+                cols.append(keyword_id)
+                values.append(2 if keyword_id in exact else 1)
+            for term, term_id in self.bonus_terms.items():
+                if term in description_keywords:
+                    bonus_rows.append(doc)
+                    bonus_cols.append(term_id)
+
+        matches = sparse.csr_matrix(
+            (np.array(values, dtype=np.int32), (rows, cols)), shape=(len(descriptions), self.n_keywords)
+        )
+        bonuses = sparse.csr_matrix(
+            (np.ones(len(bonus_rows), dtype=np.int32), (bonus_rows, bonus_cols)),
+            shape=(len(descriptions), len(self.bonus_terms))
+        )
+        return matches, bonuses
+
+    def score(self, descriptions: List[str]) -> np.ndarray:
+        """Document x category score matrix"""
+        matches, bonuses = self.keyword_matrices(descriptions)
+        hit = (matches > 0).astype(np.int32)
+        scores = np.zeros((len(descriptions), len(self.category_names)), dtype=np.int64)
+
+        for category_index, (columns, containment) in enumerate(zip(self.category_columns, self.category_containment)):
+            if len(columns) == 0:
+                continue
+            category_matches = matches[:, columns]
+            covered = (hit[:, columns] @ containment) > 0
+            uncovered = category_matches - category_matches.multiply(covered)
+            scores[:, category_index] = np.asarray(uncovered.sum(axis=1)).ravel()
+
+        if self.bonus_weights.nnz:
+            scores += (bonuses @ self.bonus_weights).toarray()
+        return scores
+
+    def best_categories(self, scores: np.ndarray) -> List[str]:
+        """Highest scoring category per document, ties to the first listed, default when nothing matched"""
+        best = scores.argmax(axis=1)
+        has_match = scores.max(axis=1) > 0
+        return [self.category_names[index] if matched else DEFAULT_CATEGORY for index, matched in zip(best, has_match)]
+
+
+# Stored in place of a description when LLaVA failed (see s3.stored_description)
+PLACEHOLDER_DESCRIPTION = re.compile(r"Image from .+ category")
+
+
+def has_real_description(description: str) -> bool:
+    """False for empty and placeholder descriptions, which carry nothing to re-score"""
+    return bool(description) and not PLACEHOLDER_DESCRIPTION.fullmatch(description)
+
+
+def load_from_json(path: str) -> List[Dict]:
+    """Load records from s3_location_processed_images.ndjson (or processed_images.ndjson, or a .json from older runs)"""
+    records = []
+    for item in merge_results([path]):
+        processing_info = item.get('metadata', {}).get('processing_info', {})
+        records.append({
+            'key': item.get('s3_key') or item.get('image_file'),
+            'description': item.get('description', ''),
+            'category': item.get('category', ''),
+            # Locally classified images and failed LLaVA calls only have a placeholder description
+            'described': (not item.get('classified_by') and processing_info.get('has_description', True)
+                          and has_real_description(item.get('description', ''))),
+        })
+    print(f"📄 Loaded {len(records)} records from {path}")
+    return records
+
+
+def load_from_s3(prefix: str = "images/", max_workers: int = 16) -> List[Dict]:
+    """Load records from S3 object metadata (descriptions there are truncated to 150 characters)"""
+    from s3_access import create_s3_client
+
+    s3_client = create_s3_client(max_pool_connections=max_workers)
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=prefix):
+        keys.extend(obj['Key'] for obj in page.get('Contents', []))
+    print(f"☁️  Found {len(keys)} objects under {prefix}, reading metadata...")
+
+    def read_metadata(key: str) -> Optional[Dict]:
+        try:
+            metadata = s3_client.head_object(Bucket=S3_BUCKET_NAME, Key=key).get('Metadata', {})
+        except Exception as e:
+            print(f"⚠️ Could not read metadata for {key}: {e}")
+            return None
+        description = metadata.get('description', '')
+        return {
+            'key': key,
+            'description': description,
+            'category': metadata.get('category', '') or (key.split('/')[-2] if key.count('/') >= 3 else ''),
+            'described': has_real_description(description),
+        }
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        records = [r for r in executor.map(read_metadata, keys) if r]
+    print(f"☁️  Loaded {len(records)} records from S3 metadata")
+    return records
+
+
+def load_from_supabase(page_size: int = 1000) -> List[Dict]:
+    """Load records from the Supabase images table, one page at a time"""
+    from supabase import create_client
+
+    supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    records = []
+    start = 0
+    while True:
+        page = supabase.table('images').select('image_file, description, category').range(start, start + page_size - 1).execute()
+        for row in page.data:
+            description = row.get('description') or ''
+            records.append({
+                'key': row['image_file'],
+                'description': description,
+                'category': row.get('category') or '',
+                'described': has_real_description(description),
+            })
+        if len(page.data) < page_size:
+            break
+        start += page_size
+    print(f"🗄️ Loaded {len(records)} records from Supabase")
+    return records
+
+
+def plan_new_key(key: str, old_category: str, new_category: str) -> Optional[str]:
+    """
+    Map images/<location>/<old_category>/<old_category>_rest.ext to the new category.
+    Returns None for keys that don't follow the S3 layout.
+    """
+    parts = key.split('/')
+    if len(parts) != 4 or parts[0] != 'images':
+        return None
+    _, location_folder, _, filename = parts
+    if old_category and filename.startswith(f"{old_category}_"):
+        filename = new_category + filename[len(old_category):]
+    return f"images/{location_folder}/{new_category}/{filename}"
+
+
+def unique_key(candidate: str, taken: set) -> str:
+    """Add a _N suffix (as generate_unique_s3_key does) until the key is not taken"""
+    if candidate not in taken:
+        return candidate
+    path, filename = candidate.rsplit('/', 1)
+    base_name, dot, extension = filename.rpartition('.')
+    if not dot:
+        base_name, extension = filename, ''
+    counter = 1
+    while True:
+        new_key = f"{path}/{base_name}_{counter}{'.' + extension if extension else ''}"
+        if new_key not in taken:
+            return new_key
+        counter += 1
+
+
+def recategorize(records: List[Dict], matcher: CategoryMatcher) -> Dict:
+    """Score all records at once and return the category changes and S3 moves"""
+    scorer = VectorizedCategoryScorer(matcher)
+    descriptions = [r['description'] for r in records]
+
+    started = datetime.datetime.now()
+    scores = scorer.score(descriptions)
+    new_categories = scorer.best_categories(scores)
+    elapsed = (datetime.datetime.now() - started).total_seconds()
+    print(f"⚡ Scored {len(records)} descriptions x {len(scorer.category_names)} categories in {elapsed:.2f}s")
+
+    taken = {r['key'] for r in records if r['key']}
+    changes = []
+    moves = {}
+    for record, new_category, row in zip(records, new_categories, scores):
+        if not record['description'] or not record.get('described', True) or new_category == record['category']:
+            continue
+        change = {
+            'key': record['key'],
+            'old_category': record['category'],
+            'new_category': new_category,
+            'scores': {name: int(value) for name, value in zip(scorer.category_names, row) if value > 0}
+        }
+        new_key = plan_new_key(record['key'], record['category'], new_category) if record['key'] else None
+        if new_key:
+            new_key = unique_key(new_key, taken)
+            taken.add(new_key)
+            change['new_key'] = new_key
+            moves[record['key']] = new_key
+        changes.append(change)
+
+    return {
+        'generated_at': datetime.datetime.now().isoformat(),
+        'total_records': len(records),
+        'changed': len(changes),
+        'changes': changes,
+        'moves': moves
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-categorize stored descriptions without re-running LLaVA")
+    parser.add_argument('--source', choices=['json', 's3', 'supabase'], default='json')
+    parser.add_argument('--json-path', help="Results file (default: NETWORK_PATH/s3_location_processed_images.ndjson)")
+    parser.add_argument('--prefix', default="images/", help="S3 prefix to scan for --source s3")
+    parser.add_argument('--output', default=DIFF_FILENAME, help="Where to write the category diff")
+    args = parser.parse_args()
+
+    if args.source == 'json':
+        json_path = args.json_path or str(results_path(os.getenv("NETWORK_PATH", ".")))
+        if not Path(json_path).exists():
+            print(f"❌ Results file not found: {json_path}")
+            sys.exit(1)
+        records = load_from_json(json_path)
+    elif args.source == 's3':
+        if not S3_BUCKET_NAME:
+            print("❌ Missing required environment variable S3_BUCKET_NAME. Please set it in your environment or .env file.")
+            sys.exit(1)
+        records = load_from_s3(args.prefix)
+    else:
+        if not os.getenv("SUPABASE_URL") or not os.getenv("SUPABASE_KEY"):
+            print("❌ Missing required environment variables. Please set SUPABASE_URL and SUPABASE_KEY in your environment or .env file.")
+            sys.exit(1)
+        records = load_from_supabase()
+
+    matcher = category_matcher_for(args.source)
+    diff = recategorize(records, matcher)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(diff, f, indent=2, ensure_ascii=False)
+
+    print(f"\n🎯 Recategorization Results:")
+    print(f"Records: {diff['total_records']}")
+    print(f"Category changes: {diff['changed']}")
+    print(f"S3 moves planned: {len(diff['moves'])}")
+    for change in diff['changes'][:20]:
+        print(f"  - {change['key']}: {change['old_category']} → {change['new_category']}")
+    if diff['changed'] > 20:
+        print(f"  ... and {diff['changed'] - 20} more")
+    print(f"💾 Diff saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Set, Tuple
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from dotenv import load_dotenv
+
+from content_index import ContentHashIndex, HASH_METADATA_KEY
+from metadata_store import open_metadata_store
+from near_duplicates import NearDuplicateIndex
+from s3_access import create_s3_client, s3_metrics
+from s3_keys import suffixed_key
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
+AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
+AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+AWS_REGION = os.getenv("AWS_REGION", "us-west-1")
+
+JOURNAL_FILENAME = "reorganize_journal.jsonl"
+DELETE_BATCH_SIZE = 1000  # DeleteObjects accepts at most 1000 keys per call
+
+# Server-side copies switch to multipart (UploadPartCopy) above this size
+COPY_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=64 * 1024 * 1024,
+    multipart_chunksize=64 * 1024 * 1024,
+    max_concurrency=4
+)
+
+
+class MoveJournal:
+    """
+    Append-only record of completed copy/delete steps, so an interrupted
+    reorganization can be re-run and pick up where it stopped
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.copied: Dict[str, str] = {}  # old key -> key it was copied to (may be a _N variant of the planned key)
+        self.deleted: Set[str] = set()
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Torn last line from a crash
+                    if entry.get('stage') == 'copied':
+                        self.copied[entry['old']] = entry['new']
+                    elif entry.get('stage') == 'deleted':
+                        self.deleted.add(entry['old'])
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def record(self, stage: str, old_key: str, new_key: str) -> None:
+        entry = {'stage': stage, 'old': old_key, 'new': new_key, 'at': datetime.datetime.now().isoformat()}
+        with self._lock:
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+            if stage == 'copied':
+                self.copied[old_key] = new_key
+            else:
+                self.deleted.add(old_key)
+
+    def sync(self) -> None:
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self.sync()
+        self._file.close()
+
+
+def load_moves(path: str) -> Dict[str, str]:
+    """Read an old key -> new key mapping, either plain or the 'moves' section of a recategorization diff"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    moves = data.get('moves', data) if isinstance(data, dict) else {}
+    valid = {}
+    for old_key, new_key in moves.items():
+        parts = new_key.split('/')
+        if len(parts) != 4 or parts[0] != 'images':
+            print(f"⚠️ Skipping {old_key}: new key is not images/<location>/<category>/<file>: {new_key}")
+            continue
+        if old_key == new_key:
+            continue
+        valid[old_key] = new_key
+    return valid
+
+
+def same_content(source_head: Dict, head: Dict) -> bool:
+    """Whether two HEAD responses describe the same bytes (content hash metadata, else ETag and size)"""
+    source_hash = source_head.get('Metadata', {}).get(HASH_METADATA_KEY)
+    other_hash = head.get('Metadata', {}).get(HASH_METADATA_KEY)
+    if source_hash and other_hash:
+        return source_hash == other_hash
+    return (source_head.get('ETag') == head.get('ETag')
+            and source_head.get('ContentLength') == head.get('ContentLength'))
+
+
+def destination_key(s3_client, bucket: str, source_head: Dict, new_key: str,
+                    max_suffix: int = 1000) -> Tuple[str, bool]:
+    """
+    Where a move should copy to: new_key if a HEAD finds nothing there, else the first free
+    new_key_N. Returns (key, already_copied); already_copied is set when a candidate already
+    holds the same content (copied by a run that crashed before journaling it).
+    Only a 404 lets a copy go ahead, so an existing image is never overwritten.
+    """
+    for counter in range(max_suffix + 1):
+        candidate = suffixed_key(new_key, counter)
+        try:
+            head = s3_client.head_object(Bucket=bucket, Key=candidate)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return candidate, False
+            raise
+        if same_content(source_head, head):
+            return candidate, True
+    raise Exception(f"Could not find a free key after {max_suffix} attempts for: {new_key}")
+
+
+def copy_object(s3_client, bucket: str, old_key: str, new_key: str) -> Tuple[str, bool, str, str, Optional[str]]:
+    """
+    Server-side copy with the category metadata rewritten, to new_key or (if another image is
+    stored there) a free new_key_N; returns (old_key, ok, message, copied_to, content_hash)
+    """
+    try:
+        try:
+            head = s3_client.head_object(Bucket=bucket, Key=old_key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                # Source already gone: fine if the destination exists (copy + delete finished before a crash)
+                s3_client.head_object(Bucket=bucket, Key=new_key)
+                return old_key, True, "already moved", new_key, None
+            raise
+        content_hash = head.get('Metadata', {}).get(HASH_METADATA_KEY)
+
+        planned_key = new_key
+        new_key, already_copied = destination_key(s3_client, bucket, head, planned_key)
+        renamed = f", {planned_key} is taken" if new_key != planned_key else ""
+        if already_copied:
+            return old_key, True, f"already copied{renamed}", new_key, content_hash
+
+        new_category = new_key.split('/')[2]
+        metadata = dict(head.get('Metadata', {}))
+        if metadata.get('category') != new_category:
+            metadata['previous-category'] = metadata.get('category', '')
+        metadata['category'] = new_category
+        metadata['recategorized-timestamp'] = datetime.datetime.now().isoformat()
+
+        s3_client.copy(
+            CopySource={'Bucket': bucket, 'Key': old_key},
+            Bucket=bucket,
+            Key=new_key,
+            ExtraArgs={
+                'Metadata': metadata,
+                'MetadataDirective': 'REPLACE',
+                'ContentType': head.get('ContentType', 'image/jpeg')
+            },
+            Config=COPY_TRANSFER_CONFIG
+        )
+        return old_key, True, f"{head.get('ContentLength', 0) / (1024*1024):.1f} MB{renamed}", new_key, content_hash
+    except Exception as e:
+        return old_key, False, str(e), new_key, None
+
+
+def repoint_references(old_key: str, new_key: str, content_hash: Optional[str], content_index: ContentHashIndex,
+                      near_duplicate_index: NearDuplicateIndex, metadata_store) -> None:
+    """Point the content-index marker, perceptual-hash entries and metadata-store row at the moved image"""
+    new_category = new_key.split('/')[2]
+    try:
+        if content_hash:
+            content_index.record(content_hash, new_key)
+        near_duplicate_index.rename(old_key, new_key, new_category)
+        if metadata_store is not None:
+            metadata_store.rename(old_key, new_key, new_category)
+    except Exception as e:
+        print(f"⚠️ Could not update stored references to {old_key}: {e}")
+
+
+def delete_sources(s3_client, bucket: str, keys: List[str], journal: MoveJournal) -> int:
+    """Delete copied sources with batched DeleteObjects calls; returns the number of failures"""
+    failed = 0
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[start:start + DELETE_BATCH_SIZE]
+        try:
+            response = s3_client.delete_objects(
+                Bucket=bucket,
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+            )
+        except ClientError as e:
+            print(f"❌ Delete batch failed: {e}")
+            failed += len(batch)
+            continue
+
+        errors = {error['Key']: error.get('Message', '') for error in response.get('Errors', [])}
+        for key in batch:
+            if key in errors:
+                print(f"❌ Could not delete {key}: {errors[key]}")
+                failed += 1
+            else:
+                journal.record('deleted', key, journal.copied[key])
+        journal.sync()
+        print(f"🗑️  Deleted {min(start + DELETE_BATCH_SIZE, len(keys))}/{len(keys)} source objects")
+    return failed
+
+
+def reorganize(moves: Dict[str, str], journal_path: str = JOURNAL_FILENAME, max_workers: int = 32) -> bool:
+    """Apply an old key -> new key mapping with parallel server-side copies, then batched deletes"""
+    # Size the connection pool for the parallel copies (each large copy may use several connections)
+    s3_client = create_s3_client('transfer', max_pool_connections=max_workers * 2)
+
+    journal = MoveJournal(journal_path)
+    # Stores that refer to images by S3 key; moved images are re-pointed as soon as their copy exists
+    content_index = ContentHashIndex(s3_client=s3_client, bucket=S3_BUCKET_NAME)
+    near_duplicate_index = NearDuplicateIndex()
+    metadata_store = open_metadata_store()
+    started = time.time()
+    try:
+        pending_copies = [key for key in moves if key not in journal.copied and key not in journal.deleted]
+        print(f"📦 {len(moves)} moves: {len(pending_copies)} to copy, "
+              f"{len(moves) - len(pending_copies)} already copied according to {journal_path}")
+
+        copy_failed = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(copy_object, s3_client, S3_BUCKET_NAME, key, moves[key]) for key in pending_copies]
+            for done, future in enumerate(as_completed(futures), 1):
+                old_key, ok, message, copied_to, content_hash = future.result()
+                if ok:
+                    repoint_references(old_key, copied_to, content_hash, content_index, near_duplicate_index, metadata_store)
+                    journal.record('copied', old_key, copied_to)
+                    print(f"✅ [{done}/{len(pending_copies)}] {old_key} → {copied_to} ({message})")
+                else:
+                    copy_failed += 1
+                    print(f"❌ [{done}/{len(pending_copies)}] Copy failed for {old_key}: {message}")
+        journal.sync()
+
+        # Only delete sources whose copy is recorded in the journal
+        to_delete = [key for key in moves if key in journal.copied and key not in journal.deleted]
+        delete_failed = delete_sources(s3_client, S3_BUCKET_NAME, to_delete, journal)
+    finally:
+        journal.close()
+        content_index.close()
+        near_duplicate_index.close()
+        if metadata_store is not None:
+            metadata_store.close()
+
+    elapsed = time.time() - started
+    print(f"\n🎯 Reorganization Results:")
+    print(f"Moves: {len(moves)}")
+    print(f"Copy failures: {copy_failed}")
+    print(f"Delete failures: {delete_failed}")
+    print(f"Elapsed: {elapsed:.1f}s")
+    for line in s3_metrics.summary_lines():
+        print(f"  {line}")
+    if copy_failed or delete_failed:
+        print(f"Re-run the same command to retry; completed steps are skipped via {journal_path}")
+    return copy_failed == 0 and delete_failed == 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move S3 images to new category folders with server-side copies")
+    parser.add_argument('mapping', help="JSON file with old key -> new key moves (e.g. recategorization_diff.json)")
+    parser.add_argument('--journal', default=JOURNAL_FILENAME, help="Journal used to resume interrupted runs")
+    parser.add_argument('--workers', type=int, default=32, help="Parallel copy operations")
+    args = parser.parse_args()
+
+    if not S3_BUCKET_NAME or not AWS_ACCESS_KEY_ID or not AWS_SECRET_ACCESS_KEY:
+        print("❌ Missing required environment variables. Please set S3_BUCKET_NAME, AWS_ACCESS_KEY_ID, and AWS_SECRET_ACCESS_KEY in your environment or .env file.")
+        sys.exit(1)
+
+    moves = load_moves(args.mapping)
+    if not moves:
+        print("✅ Nothing to move")
+        return
+    if not reorganize(moves, args.journal, args.workers):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+# Results are fsynced every RESULTS_FSYNC_BATCH lines or RESULTS_FSYNC_INTERVAL seconds, whichever comes first
+RESULTS_FSYNC_BATCH = int(os.getenv("RESULTS_FSYNC_BATCH", "20"))
+RESULTS_FSYNC_INTERVAL = float(os.getenv("RESULTS_FSYNC_INTERVAL", "5"))
+
+
+def results_path(folder: str, stem: str = 's3_location_processed_images') -> Path:
+    """The folder's NDJSON results file, or the JSON file older runs wrote if there is no NDJSON yet"""
+    ndjson_path = Path(folder) / f"{stem}.ndjson"
+    json_path = Path(folder) / f"{stem}.json"
+    if not ndjson_path.exists() and json_path.exists():
+        return json_path
+    return ndjson_path
+
+
+class ResultsLog:
+    """
+    Append-only NDJSON results file: one result per line, written as each image completes.
+    Lines are flushed immediately and fsynced in batches, so a crash loses at most the
+    last unsynced batch instead of the whole run, and nothing accumulates in memory.
+    """
+
+    def __init__(self, path: str, fsync_batch: int = RESULTS_FSYNC_BATCH,
+                 fsync_interval: float = RESULTS_FSYNC_INTERVAL):
+        self.path = str(path)
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.written = 0
+        self._unsynced = 0
+        self._last_sync = time.time()
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        # Start on a fresh line if a crash left a torn last line
+        if self._file.tell() and not self._ends_with_newline():
+            self._file.write('\n')
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def append(self, result: Dict) -> None:
+        line = json.dumps(result, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            self.written += 1
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_batch or time.time() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self) -> None:
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+    def sync(self) -> None:
+        with self._lock:
+            if self._unsynced:
+                self._sync()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._unsynced:
+                self._sync()
+            self._file.close()
+
+
+def read_results(path: str) -> Iterator[Dict]:
+    """Results from an NDJSON log (a torn last line is skipped) or a JSON array from older runs"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if str(path).endswith('.json'):
+            yield from json.load(f)
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def merge_results(paths: List[str]) -> List[Dict]:
+    """Results from several files, one per S3 key (or image_file); later lines win"""
+    merged: Dict[str, Dict] = {}
+    for path in paths:
+        for result in read_results(path):
+            key = result.get('s3_key') or result.get('image_file')
+            if key:
+                merged[key] = result
+    return list(merged.values())
+
+
+def compact(paths: List[str], db_path: str, json_path: Optional[str] = None) -> int:
+    """
+    Merge NDJSON runs into the SQLite metadata store (indexed by S3 key, location and
+    category, and read by the dashboard) and optionally into one JSON array
+    """
+    from metadata_store import SQLiteMetadataStore
+
+    results = merge_results(paths)
+    print(f"📄 {len(results)} unique results in {len(paths)} files")
+
+    # Supabase-pipeline rows (image_file, no S3 key) already live in Supabase
+    store = SQLiteMetadataStore(db_path, batch_size=500)
+    for result in results:
+        if result.get('s3_key'):
+            store.add(result)
+    store.close()
+    print(f"🗄️ {store.written} records written to {db_path}")
+
+    if json_path:
+        results.sort(key=lambda result: result.get('s3_key') or result.get('image_file'))
+        temp_path = f"{json_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, json_path)
+        print(f"💾 Merged results saved to: {json_path}")
+    return len(results)
+
+
+def main() -> None:
+    from metadata_store import METADATA_DB_PATH
+
+    parser = argparse.ArgumentParser(description="Merge NDJSON results into the indexed metadata store")
+    parser.add_argument('command', choices=['compact'])
+    parser.add_argument('inputs', nargs='*', help="Results files (default: NETWORK_PATH/s3_location_processed_images.ndjson)")
+    parser.add_argument('--db', default=METADATA_DB_PATH, help="SQLite file to write")
+    parser.add_argument('--json', help="Also write the merged results as one JSON array")
+    args = parser.parse_args()
+
+    inputs = args.inputs or [str(results_path(os.getenv("NETWORK_PATH", ".")))]
+    missing = [path for path in inputs if not Path(path).exists()]
+    if missing:
+        print(f"❌ Results file not found: {', '.join(missing)}")
+        sys.exit(1)
+    compact(inputs, args.db, args.json)
+
+
+if __name__ == "__main__":
+    main()
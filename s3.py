@@ -1,6 +1,5 @@
 import os
 import json
-import requests
 import base64
 import logging
 from pathlib import Path
@@ -8,8 +7,24 @@ from typing import Optional, Dict, List, Tuple
 import datetime
 import traceback
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-import boto3
+from ollama_client import OllamaClient, OLLAMA_STREAM
+from keyword_matcher import extract_keywords
+from categories import CATEGORIES, category_matcher
+from s3_keys import S3KeyAllocator
+from file_scanner import FileManifest, IncrementalScanner
+from folder_watcher import FolderWatcher
+from content_index import ContentHashIndex, HASH_METADATA_KEY
+from near_duplicates import NearDuplicateIndex, dhash, NEAR_DUPLICATE_ACTION
+from tiered_classifier import KNNClassifier, image_features, LOCAL_CLASSIFIER_CONFIDENCE
+from magick_conversion import RAW_EXTENSIONS, convert_raw_files, is_up_to_date
+from metadata_store import open_metadata_store
+from ingest_journal import IngestJournal
+from results_log import ResultsLog
+from s3_uploads import UploadManager, UPLOAD_POOL_CONNECTIONS, S3_UPLOAD_WORKERS
+from s3_access import create_s3_client, s3_metrics
+from adaptive_concurrency import AIMDLimiter
 from botocore.exceptions import ClientError
 
 # Load environment variables from .env file if present
@@ -22,209 +37,129 @@ AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_REGION = os.getenv("AWS_REGION", "us-west-1")
 
+# Image files picked up from the network share (RAW files are converted to JPEG and the JPEG is processed)
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.cr2', '.dng'}
+
 # Ensure required configuration is provided
 if not NETWORK_PATH or not S3_BUCKET_NAME or not AWS_ACCESS_KEY_ID or not AWS_SECRET_ACCESS_KEY:
     print("❌ Missing required environment variables. Please set NETWORK_PATH, S3_BUCKET_NAME, AWS_ACCESS_KEY_ID, and AWS_SECRET_ACCESS_KEY in your environment or .env file.")
     sys.exit(1)
 
-# Initialize S3 client
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION
-)
+# Initialize pooled Ollama client (backends from OLLAMA_BACKENDS) with an adaptive cap on in-flight requests
+ollama_limiter = AIMDLimiter()
+ollama_client = OllamaClient(limiter=ollama_limiter)
 
-CATEGORIES = {
-    "exterior_warehouse": ["warehouse exterior", "trucks",  "car", "parking", "tree", "building",  "warehouse", "parking lot",  "building", "tree", "clear sky", "sidewalk", "space", "glass door", "car", "entrance", "outdoor",  "clear", "warehouse building", "solar panel", "sky", "roof", "exterior", "flat roof", "open space", "birds eye view", "outside", "commercial building", "eye", "open", "view", "large", "storage facility", "space", "flat", "concrete surface", "loading dock", "shipping area", "receiving area", "exterior", "concrete floors", "metal beams", "industrial exterior", "warehouse facade", "vehicles", "distribution center exterior", "logistics facility exterior", "truck loading", "delivery bay", "warehouse compound"],
-    
-    "interior_warehouse": ["warehouse interior", "empty space", "empty", "pallet racking", "yellow equipment", "industrial area", "metal", "sheets", "high ceiling", "metal sheets", "aisle", "concrete floor", "unit",  "units","shelving",  "lights", "shelving units", "metal walls", "warehouse",  "industrial interior", "pallet jack", "interior", "metal walls",  "logistics", "distribution", "supply chain", "shelves", "storage unit", "warehouse shelves", "storage", "forklift", "forklifts", "cardboard boxes", "inventory", "pallets", "boxes", "stockroom", "fulfillment", "distribution center", "high-bay racking", "ceiling", "conveyor system", "bulk storage", "cross-docking", "material handling", "shelving units", "pallet racks", "staging area", "warehouse aisles", "storage shelves", "storage", "warehouse floor", "fork lift"],
-    
-    "interior_office": ["office interior", "cafe" , "tables", "green wall", "white ceiling", "office space", "blinds", "room", "office", "workspace", "modern office", "basketball", "hoop", "stylish office", "elegant office", "sophisticated office", "chairs", "desk", "chair", "table", "office furniture", "office supplies", "office equipment", "cabinet","recreation room", "game room", "pool table", "billiard table", "recreation area", "storage", "shelving", "blind shade", "floor lamp", "glass window", "windows", "blinds", "lobby", "reception", "reception area", "waiting area", "dining table", "entrance", "brand", "interior", "carpet", "modern", "computer", "tv", "workspace", "stylish", "elegant", "white walls", "sophisticated", "staircase", "wood", "wood flooring", "stairs", "furniture"],
-    
-    # "conference_room": ["conference room", "meeting room", "boardroom", "video conference", "conference table", "office meeting", "presentation room", "projector", "screen", "TV", "whiteboard", "seating", "chairs", "desk", "long table", "glass walls", "interior office", "office meeting space", "corporate meeting", "roundtable", "monitor", "remote meeting", "speakerphone", "teleconference", "zoom meeting", "business meeting", "formal seating", "presentation screen", "conference setup", "office chairs", "team meeting"],
-    
-    "parking_lot": ["parking lot", "parking", "parking area", "parking space", "cars", "vehicles", "parking lines", "outdoor parking", "parking facility", "car park", "parking garage", "vehicle parking", "parking spots", "parking structure", "pavement"],
-    
-    # "unis": ["unis", "logistics solutions", "supply chain optimization", "global logistics", "transportation", "shipping", "truck", "trailer", "container", "cargo", "transport logistics", "logistics company", "freight", "delivery", "logistics services"],
-    
-    "breakroom": ["breakroom", "break room", "kitchen", "commercial kitchen", "office break room", "break", "refrigerator", "sink", "coffee area", "lunch room", "employee kitchen", "cafeteria", "dining area", "microwave", "coffee machine", "kitchen appliances", "eating area", "staff kitchen", "break area"],
-    
-    "office_gym": ["office gym", "gym","workout room",  "fitness facility", "gym equipment", "treadmill", "elliptical", "weight room", "strength training", "cardio equipment", "exercise machines", "fitness studio", "workout area","gymnasium", "athletic facility"],
-    
-    "bathroom": ["bathroom", "restroom", "washroom", "toilet", "lavatory", "public restroom", "employee restroom", "facilities", "WC", "powder room", "men's room", "women's room", "unisex bathroom"],
-    
-    "company": ["corporate", "business", "startup", "enterprise", "organization", "firm", "management", "industry experts"],
-    
-    "e-commerce": ["online shopping", "e-commerce", "retail", "dropshipping", "marketplace", "digital store", "checkout", "cart", "customer orders"],
-    
-    "support": ["customer service", "helpdesk", "technical support", "assistance", "troubleshooting", "service center"],
-    
-    "resources": ["training", "learning materials", "guides", "knowledge base", "industry insights", "best practices"],
-    
-    "tracking_technology_platform": ["tracking", "gps", "rfid", "iot sensors", "analytics", "real-time monitoring", "asset tracking"],
-    
-    "marketing": ["advertising", "two women", "fashionable attire",  "logo", "signage", "work", "blazer", "blonde", "blonde hair", "white jacket" , "woman", " black pants", "attire", "dress", "streetwear", "high heels", "red dress", "sunglasses", "cube work", "sign", "sticker" ,"toy fork lift", "toy", "model", "toy forklift", "toy model", " remote control toy car", "lego truck", "miniature", "scale model", "polo shirt", "branded apparel", "promotional item",  "branded", "shirt", "black polo shirt", "black shirt", "embroidered","embroidered text", "logo on shirt", "polo", "cube work shirt", "t-shirt", "promotion", "branding", "social media", "marketing campaign", "seo", "content marketing", "email marketing"],
-    
-    "warehousing": ["logistics hub", "inventory management"],
-    
-    "item_com": ["item.com", "e-commerce solutions", "supply chain automation", "digital commerce"],
-}
+# Initialize S3 clients: short timeouts for LIST/HEAD/marker calls (made from the upload workers too),
+# long ones for uploads; pools sized to the upload concurrency
+s3_client = create_s3_client('api', max_pool_connections=S3_UPLOAD_WORKERS + 4)
+transfer_client = create_s3_client('transfer', max_pool_connections=UPLOAD_POOL_CONNECTIONS)
+
+# Concurrent uploads through a shared transfer manager (multipart above S3_MULTIPART_THRESHOLD_MB)
+upload_manager = UploadManager(transfer_client, S3_BUCKET_NAME)
+
+# Unique key resolution from one cached LIST per location/category prefix
+key_allocator = S3KeyAllocator(s3_client, S3_BUCKET_NAME)
+
+# Content hash -> S3 key index (local SQLite plus content-index/ markers in the bucket)
+content_index = ContentHashIndex(s3_client=s3_client, bucket=S3_BUCKET_NAME)
+
+# Perceptual hashes per location folder, for spotting burst frames of the same scene
+near_duplicate_index = NearDuplicateIndex()
+
+# Optional CPU classifier: confident predictions skip LLaVA (None until a model is trained)
+local_classifier = KNNClassifier.load()
+
+# Per-image records in a local relational store (SQLite by default, MySQL optional, METADATA_STORE=off to disable)
+metadata_store = open_metadata_store()
+
+# Per-image stage completions, so an interrupted run resumes instead of redoing LLaVA and uploads
+ingest_journal = IngestJournal()
 
 def get_image_description(image_path: str) -> Optional[str]:
     """Get AI-generated description using llama3.2-vision with a focus on concise, comma-separated keywords"""
-    max_retries = 3
+    max_retries = 3  # Attempts are spread across backends by the client
     base_timeout = 300  # Increased timeout for larger images
+    max_keywords = 35
 
-    for attempt in range(max_retries):
-        try:
-            print(f"📤 Reading image file: {image_path}")
-            with open(image_path, "rb") as image_file:
-                image_data = image_file.read()
-                print(f"📊 Image size: {len(image_data) / (1024*1024):.2f} MB")
-                base64_image = base64.b64encode(image_data).decode('utf-8')
-            
-            payload = {
-                "model": "llava",
-                "prompt": """Provide a list of keywords from the image, formatted as: keyword1, keyword2, keyword3, etc.
+    try:
+        print(f"📤 Reading image file: {image_path}")
+        with open(image_path, "rb") as image_file:
+            image_data = image_file.read()
+            print(f"📊 Image size: {len(image_data) / (1024*1024):.2f} MB")
+            base64_image = base64.b64encode(image_data).decode('utf-8')
+        
+        payload = {
+            "model": "llava",
+            "prompt": """Provide a list of keywords from the image, formatted as: keyword1, keyword2, keyword3, etc.
     Focus on the most prominent elements, limiting to 35 words. No introductory text, bullet points, or narrative.
     Be specific about location type: specify if it's interior or exterior for warehouses and offices.
     Be specific about object size: if the forklift is miniature/toy or full-size.
     Include any visible text, logos, or branding.""",
-                "stream": False,
-                "images": [base64_image]
-            }
+            "stream": OLLAMA_STREAM,
+            "images": [base64_image]
+        }
 
-            print("🔄 Sending request to Ollama server...")
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json=payload,
-                timeout=base_timeout
-            )
-            
-            if response.status_code == 200:
-                description = response.json().get('response', '').strip()
-                print(f"🔎 Raw model output: {description}")
+        print("🔄 Sending request to Ollama server...")
+        if OLLAMA_STREAM:
+            # Stop the generation as soon as the keyword limit is reached
+            response = ollama_client.generate_stream(payload, timeout=base_timeout, max_attempts=max_retries, max_keywords=max_keywords)
+        else:
+            response = ollama_client.generate(payload, timeout=base_timeout, max_attempts=max_retries)
+        
+        if response is not None:
+            description = response.get('response', '').strip()
+            print(f"🔎 Raw model output: {description}")
+            if response.get('time_to_first_token') is not None:
+                print(f"⏱️  Time to first token: {response['time_to_first_token']:.2f}s")
+            if response.get('stopped_early'):
+                print(f"✂️  Stopped generation after {max_keywords} keywords")
 
-                # Post-process to ensure format and limit
-                keywords = [kw.strip() for kw in description.split(',') if kw.strip()]
-                
-                # Limit to 35 keywords as specified
-                keywords = keywords[:35]
-                
-                return ', '.join(keywords)
+            # Post-process to ensure format and limit
+            keywords = [kw.strip() for kw in description.split(',') if kw.strip()]
             
-            else:
-                print(f"❌ Error: HTTP {response.status_code} - {response.text}")
+            # Limit to 35 keywords as specified
+            keywords = keywords[:max_keywords]
+            
+            return ', '.join(keywords)
 
-        except requests.exceptions.Timeout:
-            print(f"⚠️ Timeout occurred on attempt {attempt + 1}/{max_retries}")
-            if attempt < max_retries - 1:
-                print("Retrying...")
-        
-        except Exception as e:
-            print(f"❌ Description error on attempt {attempt + 1}/{max_retries}: {str(e)}")
-            print(f"Error details: {traceback.format_exc()}")
-            if attempt < max_retries - 1:
-                print("Retrying...")
+    except Exception as e:
+        print(f"❌ Description error: {str(e)}")
+        print(f"Error details: {traceback.format_exc()}")
 
     print("❌ Failed to get description after multiple attempts")
     return None
 
-def categorize_image(description: str) -> Tuple[str, Dict[str, int]]:
+def categorize_image(description: str, verbose: bool = True) -> Tuple[str, Dict[str, int]]:
     """
     Categorize image based on description keywords
     Returns the category and a dictionary of match scores for debugging
     """
     if not description:
-        print("⚠️ Warning: Empty description provided to categorizer")
+        if verbose:
+            print("⚠️ Warning: Empty description provided to categorizer")
         return "interior_warehouse", {"empty_description": 1}
     
-    # Process description keywords - improved to handle various formats
-    description = description.lower()
     # Handle both comma-separated and space-separated keywords
-    description_keywords = set()
-    
-    # First try comma splitting
-    if ',' in description:
-        for kw in description.split(','):
-            kw = kw.strip()
-            if kw:
-                description_keywords.add(kw)
-                # Also add individual words for better matching
-                for word in kw.split():
-                    if len(word) > 2:  # Skip very short words
-                        description_keywords.add(word)
-    else:
-        # If no commas, just use word splitting
-        for word in description.split():
-            if len(word) > 2:  # Skip very short words
-                description_keywords.add(word)
-    
-    print(f"🔍 Extracted keywords: {', '.join(description_keywords)}")
+    description_keywords = extract_keywords(description)
+    if verbose:
+        print(f"🔍 Extracted keywords: {', '.join(description_keywords)}")
     
-    # Track match scores for each category
-    match_scores = {}
-    
-    for category, keywords in CATEGORIES.items():
-        # Process keywords in order, giving priority to longer/more specific keywords
-        sorted_keywords = sorted(keywords, key=len, reverse=True)
-        score = 0
-        matches = []
-        matched_keywords = set()  # Track what we've already matched
-        
-        for cat_keyword in sorted_keywords:
-            # Check if this keyword is already covered by a longer keyword we matched
-            already_covered = any(cat_keyword in longer_kw for longer_kw in matched_keywords)
-            
-            if not already_covered:
-                # Check if category keyword is a direct match
-                if cat_keyword in description_keywords:
-                    score += 2
-                    matches.append(cat_keyword)
-                    matched_keywords.add(cat_keyword)
-                else:
-                    # Check if category keyword appears within any description keyword
-                    for desc_keyword in description_keywords:
-                        if cat_keyword in desc_keyword:
-                            score += 1
-                            matches.append(f"{cat_keyword}(in {desc_keyword})")
-                            matched_keywords.add(cat_keyword)
-                            break
-        
-        # Special priority for UNIS category when "unis" is detected
-        if category == "unis" and "unis" in description_keywords:
-            score += 5  # Extra bonus for UNIS detection
-            matches.append("unis_priority_bonus")
-        
-        # Special bonus for toy/miniature terms in marketing category
-        if category == "marketing":
-            toy_miniature_terms = ['toy', 'miniature', 'model', 'scale model', 'toy model', 'miniature model', 'toy car', 'toy truck', 'toy forklift', 'remote control', 'lego']
-            for term in toy_miniature_terms:
-                if term in description_keywords:
-                    score += 4  # Add 4 points for each toy/miniature term
-                    matches.append(f"toy_miniature_bonus({term})")
-        
-        # Special bonus for refrigerator/fridge terms in breakroom category
-        if category == "breakroom":
-            fridge_terms = ['refrigerator', 'fridge', 'freezer', 'cooler', 'refrigerated']
-            for term in fridge_terms:
-                if term in description_keywords:
-                    score += 3  # Add 3 bonus points for each fridge term
-                    matches.append(f"fridge_bonus({term})")
-        
-        if score > 0:
-            match_scores[category] = score
-            print(f"  - Category '{category}' score: {score}, matches: {', '.join(matches)}")
+    # Score all categories in one pass over the compiled keyword table
+    match_scores, match_details = category_matcher.score(description_keywords, explain=verbose)
+    if verbose:
+        for category, score in match_scores.items():
+            print(f"  - Category '{category}' score: {score}, matches: {', '.join(match_details[category])}")
     
     # Find highest scoring category
     if match_scores:
-        best_category = max(match_scores.items(), key=lambda x: x[1])[0]
-        print(f"✅ Best category match: {best_category} with score {match_scores[best_category]}")
+        best_category = category_matcher.best_category(match_scores)
+        if verbose:
+            print(f"✅ Best category match: {best_category} with score {match_scores[best_category]}")
         return best_category, match_scores
     
     # Default category with explanation
-    print("⚠️ No category matches found in description")
+    if verbose:
+        print("⚠️ No category matches found in description")
     return "interior_warehouse", {"no_matches": 0}
 
 def get_xmp_data(image_path: str) -> dict:
@@ -353,9 +288,12 @@ def create_location_folder(xmp_data: dict) -> str:
     else:
         return "unknown_location"
 
-def upload_to_s3(local_file_path: str, s3_key: str, description: str, category: str, xmp_data: dict) -> bool:
+def upload_to_s3(local_file_path: str, s3_key: str, description: str, category: str, xmp_data: dict, if_none_match: bool = False,
+                 content_hash: Optional[str] = None) -> bool:
     """
-    Upload image to S3 with metadata
+    Upload image to S3 with metadata (including the SHA-256 content hash when given)
+    With if_none_match the write only succeeds if the key does not exist yet; losing that
+    race raises the ClientError (PreconditionFailed/ConditionalRequestConflict) to the caller.
     """
     try:
         # Clean and truncate description for S3 metadata
@@ -394,6 +332,8 @@ def upload_to_s3(local_file_path: str, s3_key: str, description: str, category:
             'processing-timestamp': str(datetime.datetime.now().isoformat()),
             'original-filename': os.path.basename(local_file_path)
         }
+        if content_hash:
+            metadata[HASH_METADATA_KEY] = content_hash
         
         # Get content type
         content_type = 'image/jpeg'  # Default
@@ -402,22 +342,24 @@ def upload_to_s3(local_file_path: str, s3_key: str, description: str, category:
         elif local_file_path.lower().endswith('.jpg') or local_file_path.lower().endswith('.jpeg'):
             content_type = 'image/jpeg'
         
-        # Upload file with metadata
-        with open(local_file_path, 'rb') as file:
-            s3_client.upload_fileobj(
-                file,
-                S3_BUCKET_NAME,
-                s3_key,
-                ExtraArgs={
-                    'Metadata': metadata,
-                    'ContentType': content_type
-                }
-            )
+        # Upload file with metadata (multipart with parallel parts for large files); with
+        # if_none_match S3 rejects the write if another uploader already created the key
+        upload_manager.upload(
+            local_file_path,
+            s3_key,
+            {
+                'Metadata': metadata,
+                'ContentType': content_type
+            },
+            if_none_match=if_none_match
+        )
         
         print(f"✅ Successfully uploaded to S3: {s3_key}")
         return True
         
     except ClientError as e:
+        if if_none_match and e.response['Error']['Code'] in ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409'):
+            raise
         print(f"❌ S3 upload error: {e}")
         return False
     except Exception as e:
@@ -439,57 +381,254 @@ def check_s3_file_exists(s3_key: str) -> bool:
 def generate_unique_s3_key(base_s3_key: str) -> str:
     """
     Generate a unique S3 key by adding a number suffix if the file already exists
-    Returns the first available unique key
+    Returns the first available unique key (resolved from one cached LIST per location/category)
     """
-    if not check_s3_file_exists(base_s3_key):
-        return base_s3_key
-    
-    # Split the key into path and filename with extension
-    key_parts = base_s3_key.rsplit('/', 1)
-    if len(key_parts) == 1:
-        # No path, just filename
-        path = ""
-        filename_with_ext = key_parts[0]
-    else:
-        path = key_parts[0]
-        filename_with_ext = key_parts[1]
-    
-    # Split filename and extension
-    name_parts = filename_with_ext.rsplit('.', 1)
-    if len(name_parts) == 1:
-        # No extension
-        base_name = name_parts[0]
-        extension = ""
-    else:
-        base_name = name_parts[0]
-        extension = "." + name_parts[1]
-    
-    # Try with number suffixes
-    counter = 1
-    while True:
-        new_filename = f"{base_name}_{counter}{extension}"
-        new_s3_key = f"{path}/{new_filename}" if path else new_filename
+    return key_allocator.claim(base_s3_key)
+
+def find_identical_object(local_file_path: str, base_s3_key: str) -> Optional[str]:
+    """
+    An object already stored at base_s3_key or one of its _N variants with exactly these bytes.
+    Sizes and ETags come from the cached prefix listing; a HEAD is only sent for same-size
+    keys whose ETag is not known yet. The local ETag is computed only if a size matches.
+    """
+    size = os.path.getsize(local_file_path)
+    candidates = {key: entry for key, entry in key_allocator.variants(base_s3_key).items()
+                  if entry.get('size') in (size, None)}
+    if not candidates:
+        return None
+
+    expected_etag = upload_manager.expected_etag(local_file_path)
+    for key, entry in candidates.items():
+        etag = entry.get('etag')
+        if not etag:
+            try:
+                head = s3_client.head_object(Bucket=S3_BUCKET_NAME, Key=key)
+            except ClientError:
+                continue
+            etag = head.get('ETag', '').strip('"')
+            key_allocator.mark_taken(key, etag, head.get('ContentLength'))
+            if head.get('ContentLength') != size:
+                continue
+        if etag == expected_etag:
+            return key
+    return None
+
+def stored_description(description: Optional[str], category: str, classified_by: Optional[str]) -> str:
+    """
+    Description to store with an image: LLaVA's, a placeholder when LLaVA failed, or nothing
+    for locally classified images (a placeholder would be re-scored as if LLaVA had written it)
+    """
+    if description:
+        return description
+    return "" if classified_by else f"Image from {category} category"
+
+def upload_with_unique_key(local_file_path: str, base_s3_key: str, description: str, category: str, xmp_data: dict,
+                           content_hash: Optional[str] = None) -> Optional[str]:
+    """
+    Claim a unique key for base_s3_key and upload with a conditional write.
+    If another uploader created the same key first, move on to the next free suffix.
+    If the same bytes are already stored at base_s3_key or one of its variants, nothing is
+    uploaded and that key is returned. Returns the key the file is stored under, or None if the upload failed.
+    """
+    identical_key = find_identical_object(local_file_path, base_s3_key)
+    if identical_key:
+        print(f"⏭️  Identical object already in S3 (same size and ETag), skipping upload: {identical_key}")
+        return identical_key
+
+    for _ in range(10):
+        s3_key = generate_unique_s3_key(base_s3_key)
+        if s3_key != base_s3_key:
+            print(f"🔄 Duplicate detected, using unique key: {s3_key}")
+        try:
+            if upload_to_s3(local_file_path, s3_key, description, category, xmp_data, if_none_match=True, content_hash=content_hash):
+                key_allocator.mark_taken(s3_key, size=os.path.getsize(local_file_path))
+                return s3_key
+            key_allocator.release(s3_key)
+            return None
+        except ClientError as e:
+            # Lost the race for this key to a concurrent uploader
+            print(f"⚠️ {s3_key} was created by another uploader ({e.response['Error']['Code']}), trying the next key")
+            key_allocator.mark_taken(s3_key)
+    print(f"❌ Could not claim a unique key for {base_s3_key}")
+    return None
+
+def is_already_processed(filename: str, show_debug: bool = True) -> bool:
+    """
+    Check if a file is already processed using its filename:
+    category_street_city_zipcode[_counter].ext with a street containing digits and a 5-digit zipcode
+    """
+    try:
+        name_without_ext = filename.rsplit('.', 1)[0]
+        
+        # Check if filename starts with any known category name
+        category_found = None
+        for category in CATEGORIES.keys():
+            if name_without_ext.startswith(category):
+                category_found = category
+                break
+        
+        if not category_found:
+            if show_debug:
+                print(f"🔍 Debug: No known category found - returning False (process)")
+            return False
+        
+        # Remove the category prefix and split the remaining parts
+        remaining = name_without_ext[len(category_found):].lstrip('_')
+        parts = remaining.split('_') if remaining else []
         
-        if not check_s3_file_exists(new_s3_key):
-            return new_s3_key
+        if show_debug:
+            print(f"🔍 Debug: Category '{category_found}', remaining parts: {parts}")
         
-        counter += 1
-        # Safety check to prevent infinite loop
-        if counter > 1000:
-            raise Exception(f"Could not generate unique filename after 1000 attempts for base key: {base_s3_key}")
+        # Check if we have at least 3 parts (street_city_zipcode minimum)
+        if len(parts) >= 3:
+            # Determine which part is the zipcode
+            zipcode_part = None
+            has_counter = False
+            
+            # Check if the last part is a numeric counter
+            if len(parts) >= 4:
+                try:
+                    int(parts[-1])
+                    has_counter = True
+                    zipcode_part = parts[-2]  # Second-to-last part is zipcode
+                    if show_debug:
+                        print(f"🔍 Debug: Last part '{parts[-1]}' is counter, zipcode is '{zipcode_part}'")
+                except ValueError:
+                    zipcode_part = parts[-1]  # Last part is zipcode
+                    if show_debug:
+                        print(f"🔍 Debug: Last part '{parts[-1]}' is zipcode")
+            else:
+                zipcode_part = parts[-1]  # Last part is zipcode
+                if show_debug:
+                    print(f"🔍 Debug: Last part '{parts[-1]}' is zipcode")
+            
+            # Check if the zipcode part looks like a zipcode (5 digits)
+            if zipcode_part and len(zipcode_part) == 5 and zipcode_part.isdigit():
+                if show_debug:
+                    print(f"🔍 Debug: Zipcode '{zipcode_part}' is valid")
+                
+                # Check if any of the earlier parts contain numbers (indicating street address)
+                has_street_address = False
+                # Skip the last part (zipcode) and the second-to-last if it's a counter
+                end_index = len(parts) - 2 if has_counter else len(parts) - 1
+                for i in range(end_index):
+                    if any(c.isdigit() for c in parts[i]):
+                        has_street_address = True
+                        break
+                
+                if has_street_address:
+                    if show_debug:
+                        print(f"🔍 Debug: Has street address and valid zipcode - returning True (skip)")
+                    # This is already processed (has street address and valid zipcode)
+                    return True
+                else:
+                    if show_debug:
+                        print(f"🔍 Debug: No street address found - returning False (process)")
+                    # No street address, so this might be old format
+                    return False
+            else:
+                if show_debug:
+                    print(f"🔍 Debug: Zipcode part '{zipcode_part}' is not a 5-digit zipcode - returning False (process)")
+                return False
+        
+        if show_debug:
+            print(f"🔍 Debug: Filename has {len(parts)} remaining parts (not enough for new format) - returning False (process)")
+        # Old format files or insufficient parts will return False to allow reprocessing
+        return False
+    except Exception as e:
+        if show_debug:
+            print(f"🔍 Debug: Exception in is_already_processed: {e}")
+        return False
+
+def location_key(filename: str) -> Optional[Tuple[str, ...]]:
+    """
+    Location parts of a processed filename, without category prefix or numeric counter:
+    'breakroom_120n83rdave_tolleson_85353_2.jpg' -> ('120n83rdave', 'tolleson', '85353')
+    Returns None for files that are not in the processed naming format.
+    """
+    if not is_already_processed(filename, show_debug=False):
+        return None
+    name_without_ext = filename.rsplit('.', 1)[0]
+    category_found = next(category for category in CATEGORIES.keys() if name_without_ext.startswith(category))
+    parts = name_without_ext[len(category_found):].lstrip('_').split('_')
+    if len(parts) >= 4 and parts[-1].isdigit():
+        parts = parts[:-1]  # Drop the uniqueness counter
+    return tuple(parts)
+
+def location_filename_parts(xmp_data: dict) -> Tuple[str, ...]:
+    """Location parts the new filename would get from XMP data (street, city, zipcode)"""
+    street = xmp_data.get('Street', '').lower()
+    city = xmp_data.get('City', '').lower()
+    zipcode = xmp_data.get('PostalCode', '').lower()
+    
+    # Clean location data
+    street = ''.join(c for c in street if c.isalnum()).replace(' ', '')
+    city = ''.join(c for c in city if c.isalnum() or c.isspace()).replace(' ', '_')
+    zipcode = ''.join(c for c in zipcode if c.isalnum())
+    
+    filename_parts = [part for part in (street, city, zipcode) if part]
+    return tuple('_'.join(filename_parts).split('_')) if filename_parts else ()
+
+class DirectoryIndex:
+    """
+    Processed filenames per directory, keyed by their location parts.
+    Each directory is listed once (on first lookup) and kept current as files are renamed,
+    so checking for an existing file at the same location is a dictionary lookup.
+    """
+
+    def __init__(self):
+        self._directories: Dict[Path, Dict[Tuple[str, ...], set]] = {}
+
+    def _index(self, directory: Path) -> Dict[Tuple[str, ...], set]:
+        index = self._directories.get(directory)
+        if index is None:
+            index = {}
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        key = location_key(entry.name)
+                        if key:
+                            index.setdefault(key, set()).add(entry.name)
+            self._directories[directory] = index
+        return index
 
-def process_images_in_folder(folder_path: str):
-    """Process all images in the folder and upload to S3 with detailed monitoring"""
+    def find(self, directory: Path, location_parts: Tuple[str, ...], exclude: str = None) -> Optional[str]:
+        """Name of a processed file in directory with the same location parts, if any"""
+        if not location_parts:
+            return None
+        for name in self._index(directory).get(location_parts, ()):
+            if name != exclude:
+                return name
+        return None
+
+    def add(self, path: Path) -> None:
+        key = location_key(path.name)
+        if key:
+            self._index(path.parent).setdefault(key, set()).add(path.name)
+
+    def remove(self, path: Path) -> None:
+        key = location_key(path.name)
+        if key and path.parent in self._directories:
+            self._directories[path.parent].get(key, set()).discard(path.name)
+
+    def rename(self, old_path: Path, new_path: Path) -> None:
+        self.remove(old_path)
+        self.add(new_path)
+
+def process_images_in_folder(folder_path: str, image_files: Optional[List[Path]] = None):
+    """
+    Process all images in the folder and upload to S3 with detailed monitoring.
+    image_files limits the run to the given files (watch mode) instead of scanning the folder.
+    """
     try:
         folder = Path(folder_path)
         print(f"\n📂 Processing folder: {folder}")
         
-        # Collect all image files (only JPG, JPEG, PNG - LLaVA supported formats)
-        image_extensions = {'.jpg', '.jpeg', '.png', '.cr2', '.dng'}
-        image_files = [
-            f for f in folder.rglob('*')
-            if f.is_file() and f.suffix.lower() in image_extensions
-        ]
+        # Collect new or changed image files (only JPG, JPEG, PNG - LLaVA supported formats);
+        # files recorded in the scan manifest as processed or skipped are not listed again
+        manifest = FileManifest()
+        if image_files is None:
+            image_files = IncrementalScanner(manifest, IMAGE_EXTENSIONS).scan(str(folder))
         
         total_files = len(image_files)
         processed_count = 0
@@ -500,220 +639,163 @@ def process_images_in_folder(folder_path: str):
         print(f"Total images found: {total_files}")
         print(f"Starting processing...\n")
         
-        results = []
+        # Results are streamed to NDJSON as each image completes (watch-mode batches append to the same file)
+        output_file = folder / 's3_location_processed_images.ndjson'
+        results_log = ResultsLog(output_file)
+        pending_images = []  # Images that passed the skip checks and still need LLaVA
+        xmp_cache = {}  # XMP data read during the skip checks, reused when processing
+        content_hashes = {}  # SHA-256 per pending image
+        perceptual_hashes = {}  # (location folder, dHash) per pending image
+        near_duplicates = {}  # Pending image -> index item of the image whose description it reuses
+        near_duplicate_items = {}  # Pending image -> its own index item, filled in once stored
+        classified = {}  # Pending image -> (category, confidence) from the local classifier
+        resumed = {}  # Pending image -> journal entry of an earlier, interrupted run
+        resumed_hashes = set()
+        directory_index = DirectoryIndex()
 
-        for image_path in image_files:
-            processed_count += 1
-            print(f"\n🖼️  Processing image {processed_count}/{total_files}")
+        # Images an interrupted run stored and renamed but never wrote to the results file
+        for result_data in ingest_journal.unrecorded_results():
+            print(f"↩️  Recovered result from journal: {result_data['s3_key']}")
+            results_log.append(result_data)
+            if metadata_store is not None:
+                metadata_store.add(result_data)
+
+        # Convert new or changed RAW files up front, in parallel (embedded preview or full decode)
+        converted_raw_files = convert_raw_files([
+            f for f in image_files if f.suffix.lower() in RAW_EXTENSIONS and not is_up_to_date(f)
+        ])
+
+        for index, image_path in enumerate(image_files, 1):
+            print(f"\n🔍 Checking image {index}/{total_files}")
             print(f"File: {image_path.name}")
             
-            # Skip DNG and CR2 files
-            if image_path.suffix.lower() in ['.dng', '.cr2']:
-                print(f"⏭️  Skipping RAW file: {image_path.name}")
-                skipped_count += 1
+            # DNG and CR2 files: process the JPEG converted from them instead
+            if image_path.suffix.lower() in RAW_EXTENSIONS:
+                if image_path not in converted_raw_files:
+                    print(f"⏭️  Skipping RAW file, already converted: {image_path.name}")
+                    manifest.mark(str(image_path), 'converted')
+                    skipped_count += 1
+                    continue
+                jpg_path = converted_raw_files[image_path]
+                if jpg_path is None:
+                    print(f"⏭️  Skipping RAW file that could not be converted: {image_path.name}")
+                    manifest.mark(str(image_path), 'failed')
+                    skipped_count += 1
+                    continue
+                manifest.mark(str(image_path), 'converted')
+                image_path = jpg_path
+                print(f"File: {image_path.name}")
+            
+            # Resume images an interrupted run got part way through (described, categorized or uploaded)
+            content_hash = content_index.hash(str(image_path))
+            journal_entry = ingest_journal.resume(content_hash) if content_hash else None
+            if journal_entry and content_hash not in resumed_hashes:
+                print(f"↩️  Resuming interrupted image (last completed stage: {journal_entry['stage']})")
+                content_index.claim(content_hash, str(image_path))
+                content_hashes[image_path] = content_hash
+                resumed[image_path] = journal_entry
+                resumed_hashes.add(content_hash)
+                pending_images.append(image_path)
                 continue
             
-            # Check if file is already processed using sophisticated logic
-            def is_already_processed(filename, show_debug=True):
-                try:
-                    name_without_ext = filename.rsplit('.', 1)[0]
-                    
-                    # Check if filename starts with any known category name
-                    category_found = None
-                    for category in CATEGORIES.keys():
-                        if name_without_ext.startswith(category):
-                            category_found = category
-                            break
-                    
-                    if not category_found:
-                        if show_debug:
-                            print(f"🔍 Debug: No known category found - returning False (process)")
-                        return False
-                    
-                    # Remove the category prefix and split the remaining parts
-                    remaining = name_without_ext[len(category_found):].lstrip('_')
-                    parts = remaining.split('_') if remaining else []
-                    
-                    if show_debug:
-                        print(f"🔍 Debug: Category '{category_found}', remaining parts: {parts}")
-                    
-                    # Check if we have at least 3 parts (street_city_zipcode minimum)
-                    if len(parts) >= 3:
-                        # Determine which part is the zipcode
-                        zipcode_part = None
-                        has_counter = False
-                        
-                        # Check if the last part is a numeric counter
-                        if len(parts) >= 4:
-                            try:
-                                int(parts[-1])
-                                has_counter = True
-                                zipcode_part = parts[-2]  # Second-to-last part is zipcode
-                                if show_debug:
-                                    print(f"🔍 Debug: Last part '{parts[-1]}' is counter, zipcode is '{zipcode_part}'")
-                            except ValueError:
-                                zipcode_part = parts[-1]  # Last part is zipcode
-                                if show_debug:
-                                    print(f"🔍 Debug: Last part '{parts[-1]}' is zipcode")
-                        else:
-                            zipcode_part = parts[-1]  # Last part is zipcode
-                            if show_debug:
-                                print(f"🔍 Debug: Last part '{parts[-1]}' is zipcode")
-                        
-                        # Check if the zipcode part looks like a zipcode (5 digits)
-                        if zipcode_part and len(zipcode_part) == 5 and zipcode_part.isdigit():
-                            if show_debug:
-                                print(f"🔍 Debug: Zipcode '{zipcode_part}' is valid")
-                            
-                            # Check if any of the earlier parts contain numbers (indicating street address)
-                            has_street_address = False
-                            # Skip the last part (zipcode) and the second-to-last if it's a counter
-                            end_index = len(parts) - 2 if has_counter else len(parts) - 1
-                            for i in range(end_index):
-                                if any(c.isdigit() for c in parts[i]):
-                                    has_street_address = True
-                                    break
-                            
-                            if has_street_address:
-                                if show_debug:
-                                    print(f"🔍 Debug: Has street address and valid zipcode - returning True (skip)")
-                                # This is already processed (has street address and valid zipcode)
-                                return True
-                            else:
-                                if show_debug:
-                                    print(f"🔍 Debug: No street address found - returning False (process)")
-                                # No street address, so this might be old format
-                                return False
-                        else:
-                            if show_debug:
-                                print(f"🔍 Debug: Zipcode part '{zipcode_part}' is not a 5-digit zipcode - returning False (process)")
-                            return False
-                    
-                    if show_debug:
-                        print(f"🔍 Debug: Filename has {len(parts)} remaining parts (not enough for new format) - returning False (process)")
-                    # Old format files or insufficient parts will return False to allow reprocessing
-                    return False
-                except Exception as e:
-                    if show_debug:
-                        print(f"🔍 Debug: Exception in is_already_processed: {e}")
-                    return False
+            # Skip byte-identical copies of images that are already stored (or queued in this run)
+            if content_hash:
+                existing = content_index.claim(content_hash, str(image_path))
+                if existing:
+                    print(f"⏭️  Skipping duplicate content (same SHA-256 as {existing})")
+                    manifest.mark(str(image_path), 'skipped', content_hash)
+                    skipped_count += 1
+                    continue
+                content_hashes[image_path] = content_hash
             
-            # Check if current filename is already processed
+            # Legacy fallback for files processed before content hashes were recorded
             if is_already_processed(image_path.name):
                 print(f"⏭️  Skipping already processed file: {image_path.name}")
+                manifest.mark(str(image_path), 'skipped', content_hash)
                 skipped_count += 1
                 continue
             
-            # Also check if a file with the new naming pattern already exists in the directory
-            # This prevents processing files that would create duplicates
+            # Also check if a processed file for the same location already exists in the directory
             try:
-                # Get XMP data first to check for existing files
+                # Get XMP data first to check for existing files (kept for the processing phase)
                 xmp_data = get_xmp_data(str(image_path))
+                xmp_cache[image_path] = xmp_data
                 
-                # Generate what the new filename would be
-                street = xmp_data.get('Street', '').lower()
-                city = xmp_data.get('City', '').lower()
-                zipcode = xmp_data.get('PostalCode', '').lower()
-                
-                # Clean location data
-                street = ''.join(c for c in street if c.isalnum()).replace(' ', '')
-                city = ''.join(c for c in city if c.isalnum() or c.isspace()).replace(' ', '_')
-                zipcode = ''.join(c for c in zipcode if c.isalnum())
-                
-                # Build filename parts
-                filename_parts = []
-                if street:
-                    filename_parts.append(street)
-                if city:
-                    filename_parts.append(city)
-                if zipcode:
-                    filename_parts.append(zipcode)
-                
-                # Check if any file with the new pattern already exists
-                for existing_file in image_path.parent.glob('*'):
-                    if existing_file.is_file() and existing_file != image_path:
-                        if is_already_processed(existing_file.name, show_debug=False):  # No debug for directory check
-                            # This existing file already has the new naming pattern
-                            # Check if it would have the same location-based name
-                            existing_name = existing_file.stem
-                            if '_' in existing_name:
-                                existing_parts = existing_name.split('_')
-                                if len(existing_parts) >= 4:
-                                    # Check if the location parts match
-                                    existing_location_parts = existing_parts[1:4]  # Skip category
-                                    if existing_location_parts == filename_parts:
-                                        print(f"⏭️  Skipping - would create duplicate with existing file: {existing_file.name}")
-                                        skipped_count += 1
-                                        continue
+                # O(1) lookup in the per-directory index instead of scanning every sibling
+                existing_name = directory_index.find(image_path.parent, location_filename_parts(xmp_data), exclude=image_path.name)
+                if existing_name:
+                    # Same location is not a duplicate by itself - the upload gets a unique suffix
+                    print(f"ℹ️  Directory already has a processed file for this location: {existing_name}")
             except Exception as e:
                 print(f"⚠️  Warning: Could not check for duplicates: {e}")
                 # Continue processing anyway
+            
+            # Near-duplicate check: burst frames of the same scene at the same location
+            if NEAR_DUPLICATE_ACTION != 'off' and image_path in xmp_cache:
+                image_dhash = dhash(str(image_path))
+                if image_dhash is not None:
+                    location_folder = create_location_folder(xmp_cache[image_path])
+                    perceptual_hashes[image_path] = (location_folder, image_dhash)
+                    near_match = near_duplicate_index.find(location_folder, image_dhash)
+                    if near_match:
+                        distance, item = near_match
+                        reference = item.get('stored_as') or Path(item['path']).name
+                        if NEAR_DUPLICATE_ACTION == 'skip':
+                            print(f"⏭️  Skipping near-duplicate of {reference} (distance {distance})")
+                            manifest.mark(str(image_path), 'skipped', content_hash)
+                            if content_hash:
+                                content_index.release(content_hash)
+                            skipped_count += 1
+                            continue
+                        print(f"♻️  Near-duplicate of {reference} (distance {distance}), will reuse its description")
+                        near_duplicates[image_path] = item
+                    else:
+                        # Later frames in this run can match this image before it is stored
+                        item = {'path': str(image_path)}
+                        near_duplicate_index.add(location_folder, image_dhash, item)
+                        near_duplicate_items[image_path] = item
+            
+            # Tier 1: cheap colour/texture classifier; only uncertain images go to LLaVA
+            if local_classifier is not None and image_path not in near_duplicates:
+                features = image_features(str(image_path))
+                if features is not None:
+                    predicted_category, confidence = local_classifier.predict(features)
+                    if confidence >= LOCAL_CLASSIFIER_CONFIDENCE:
+                        print(f"🧮 Local classifier: {predicted_category} ({confidence:.0%} of neighbours agree), skipping LLaVA")
+                        classified[image_path] = (predicted_category, confidence)
                 
+            pending_images.append(image_path)
+
+        # Describe the remaining images concurrently; the AIMD limiter on the Ollama client
+        # decides how many requests are actually in flight at any moment
+        print(f"\n🤖 Describing {len(pending_images) - len(near_duplicates) - len(classified) - len(resumed)} images (up to {ollama_limiter.max_limit} requests in flight), "
+              f"reusing descriptions for {len(near_duplicates)} near-duplicates, {len(classified)} classified locally, {len(resumed)} resumed...")
+        processed_count = skipped_count
+        upload_futures = {}  # Upload future -> what finish_upload needs once it is done
+
+        def finish_upload(job: Dict, uploaded_key: Optional[str]) -> None:
+            """Record and rename an image once its upload has finished (runs on the main thread)"""
+            nonlocal failed_count
+            image_path, content_hash = job['image_path'], job['content_hash']
+            description, category, match_scores = job['description'], job['category'], job['match_scores']
+            xmp_data, location_folder = job['xmp_data'], job['location_folder']
+            near_duplicate_of, classified_by = job['near_duplicate_of'], job['classified_by']
+            success = uploaded_key is not None
             try:
-                # Get image description
-                print("🤖 Getting description...")
-                description = get_image_description(str(image_path))
-                if description:
-                    print(f"📝 Description: {description}")
-                else:
-                    print("⚠️ No description generated")
-                
-                # Get category with improved categorization
-                category, match_scores = categorize_image(description if description else "")
-                print(f"🏷️  Category: {category}")
-                
-                # Get XMP data
-                xmp_data = get_xmp_data(str(image_path))
-                
-                # Generate new filename with full location: category_street_city_zipcode
-                street = xmp_data.get('Street', '').lower()
-                city = xmp_data.get('City', '').lower()
-                zipcode = xmp_data.get('PostalCode', '').lower()
-                
-                # Clean location data
-                street = ''.join(c for c in street if c.isalnum()).replace(' ', '')  # Remove all non-alphanumeric chars and spaces
-                city = ''.join(c for c in city if c.isalnum() or c.isspace()).replace(' ', '_')
-                zipcode = ''.join(c for c in zipcode if c.isalnum())  # Clean zip code
-                
-                # Build filename parts
-                filename_parts = [category]
-                if street:
-                    filename_parts.append(street)
-                if city:
-                    filename_parts.append(city)
-                if zipcode:
-                    filename_parts.append(zipcode)
-                
-                # Join parts with underscores and add extension
-                base_filename = '_'.join(filename_parts)
-                new_filename = f"{base_filename}{image_path.suffix}"
-                print(f"📝 New filename: {new_filename}")
-                
-                # Create location-based folder
-                location_folder = create_location_folder(xmp_data)
-                print(f"📍 Location folder: {location_folder}")
-                
-                # Create S3 key (path in S3) - organized by images/location/category/filename
-                s3_key = f"images/{location_folder}/{category}/{new_filename}"
-                print(f"📍 S3 key: {s3_key}")
-                
-                # Generate unique S3 key to prevent duplicates
-                unique_s3_key = generate_unique_s3_key(s3_key)
-                if unique_s3_key != s3_key:
-                    print(f"🔄 Duplicate detected, using unique key: {unique_s3_key}")
-                    s3_key = unique_s3_key
-                    # Extract the unique suffix from S3 key to use for local rename
-                    s3_filename = unique_s3_key.split('/')[-1]
-                    local_filename = s3_filename
-                else:
-                    local_filename = new_filename
-                
-                # Upload to S3 with metadata
-                print("☁️  Uploading to S3...")
-                success = upload_to_s3(str(image_path), s3_key, description, category, xmp_data)
-                
                 if success:
+                    # Use the unique S3 filename (including any suffix) for the local rename
+                    s3_key = uploaded_key
+                    if content_hash:
+                        content_index.record(content_hash, s3_key)
+                    if image_path in perceptual_hashes:
+                        hash_location, image_dhash = perceptual_hashes[image_path]
+                        near_duplicate_index.record(hash_location, image_dhash, s3_key, description, category)
+                        if image_path in near_duplicate_items:
+                            near_duplicate_items[image_path].update(stored_as=s3_key, description=description, category=category)
+                    local_filename = uploaded_key.split('/')[-1]
+
                     # Rename the original local file to match the S3 filename
+                    original_path = image_path
                     try:
                         # Check if local filename already exists and generate unique name if needed
                         local_filename_final = local_filename
@@ -734,21 +816,25 @@ def process_images_in_folder(folder_path: str):
                             counter += 1
                             if counter > 1000:  # Safety check
                                 raise Exception(f"Could not generate unique local filename after 1000 attempts")
-                        
+
                         image_path.rename(new_file_path)
+                        directory_index.rename(image_path, new_file_path)
                         print(f"✅ Renamed local file to: {local_filename_final}")
                         # Update the image_path reference for the result data
                         image_path = new_file_path
                     except Exception as e:
                         print(f"⚠️ Could not rename local file: {str(e)}")
-                    
+
                     # Prepare result data
                     result_data = {
                         's3_key': s3_key,
                         'local_file': str(image_path),
-                        'description': description if description else f"Image from {category} category",
+                        'description': stored_description(description, category, classified_by),
                         'category': category,
                         'location_folder': location_folder,
+                        'content_sha256': content_hash,
+                        'near_duplicate_of': near_duplicate_of,
+                        'classified_by': classified_by,
                         'uploaded_at': datetime.datetime.now().isoformat(),
                         'metadata': {
                             'xmp_data': xmp_data,
@@ -760,61 +846,255 @@ def process_images_in_folder(folder_path: str):
                             'category_matches': match_scores
                         }
                     }
-                    results.append(result_data)
-                    print("✅ Successfully processed and uploaded to S3")
+                    if content_hash:
+                        ingest_journal.complete(content_hash, 'renamed', result=result_data)
+
+                    # Remember the file (under its new name) so later scans skip it
+                    manifest.rename(str(original_path), str(image_path), 'processed', content_hash, hash_content=True)
+
+                    results_log.append(result_data)
+                    if metadata_store is not None:
+                        metadata_store.add(result_data)
+                    print(f"✅ Successfully processed and uploaded to S3: {s3_key}")
                 else:
-                    print("❌ Failed to upload to S3")
+                    print(f"❌ Failed to upload to S3: {image_path.name}")
+                    if content_hash:
+                        content_index.release(content_hash)
+                    manifest.mark(str(image_path), 'failed')
                     failed_count += 1
-
             except Exception as e:
                 print(f"❌ Error: {str(e)}")
                 logging.error(traceback.format_exc())
+                manifest.mark(str(image_path), 'failed')
                 failed_count += 1
-                continue
+
+        def upload_job(job: Dict, base_s3_key: str) -> Optional[str]:
+            """Runs on the upload pool; journals the upload as soon as it has landed"""
+            description = stored_description(job['description'], job['category'], job['classified_by'])
+            uploaded_key = upload_with_unique_key(str(job['image_path']), base_s3_key, description,
+                                                  job['category'], job['xmp_data'], job['content_hash'])
+            if uploaded_key and job['content_hash']:
+                ingest_journal.complete(job['content_hash'], 'uploaded', s3_key=uploaded_key)
+            return uploaded_key
+
+        def drain_uploads(wait: bool = False) -> None:
+            """Finish uploads that are done (all of them, waiting, with wait=True)"""
+            done = as_completed(list(upload_futures)) if wait else [f for f in list(upload_futures) if f.done()]
+            for future in done:
+                job = upload_futures.pop(future)
+                try:
+                    uploaded_key = future.result()
+                except Exception as e:
+                    print(f"❌ S3 upload error for {job['image_path'].name}: {e}")
+                    uploaded_key = None
+                finish_upload(job, uploaded_key)
+
+        with ThreadPoolExecutor(max_workers=ollama_limiter.max_limit) as describe_executor:
+            description_futures = {
+                p: describe_executor.submit(get_image_description, str(p))
+                for p in pending_images if p not in near_duplicates and p not in classified and p not in resumed
+            }
+
+            for image_path in pending_images:
+                # Rename and record uploads that finished while the previous image was prepared
+                drain_uploads()
+                processed_count += 1
+                print(f"\n🖼️  Processing image {processed_count}/{total_files}")
+                print(f"File: {image_path.name}")
+
+                try:
+                    content_hash = content_hashes.get(image_path)
+                    journal_entry = resumed.get(image_path)
+                    near_match = near_duplicates.get(image_path)
+                    local_prediction = classified.get(image_path)
+                    near_duplicate_of = (near_match.get('stored_as') or near_match['path']) if near_match else None
+                    if journal_entry:
+                        description = journal_entry.get('description')
+                        near_duplicate_of = journal_entry.get('near_duplicate_of')
+                    elif local_prediction:
+                        description = None
+                    elif near_match:
+                        # Reuse the closest match's description (stored, or described earlier in this run)
+                        if near_match.get('description'):
+                            description = near_match['description']
+                        else:
+                            match_future = description_futures.get(Path(near_match['path']))
+                            description = match_future.result() if match_future else None
+                        if not description:
+                            description = get_image_description(str(image_path))
+                    else:
+                        # Wait for this image's description
+                        description = description_futures[image_path].result()
+                    if description:
+                        print(f"📝 Description: {description}")
+                    elif not local_prediction and not journal_entry:
+                        print("⚠️ No description generated")
+                    if content_hash and not journal_entry:
+                        ingest_journal.complete(content_hash, 'described', description=description, near_duplicate_of=near_duplicate_of)
+                
+                    # Get category with improved categorization (or take the confident local prediction)
+                    if journal_entry and ingest_journal.has(content_hash, 'categorized'):
+                        category, match_scores = journal_entry['category'], journal_entry.get('match_scores', {})
+                        classified_by = journal_entry.get('classified_by')
+                    else:
+                        if local_prediction:
+                            category, match_scores = local_prediction[0], {}
+                        else:
+                            category, match_scores = categorize_image(description if description else "")
+                        classified_by = 'local_classifier' if local_prediction else None
+                        if content_hash:
+                            ingest_journal.complete(content_hash, 'categorized', category=category, match_scores=match_scores, classified_by=classified_by)
+                    print(f"🏷️  Category: {category}")
+                
+                    # Get XMP data (already read during the skip checks)
+                    xmp_data = xmp_cache.pop(image_path, None)
+                    if xmp_data is None:
+                        xmp_data = get_xmp_data(str(image_path))
+                
+                    # Generate new filename with full location: category_street_city_zipcode
+                    street = xmp_data.get('Street', '').lower()
+                    city = xmp_data.get('City', '').lower()
+                    zipcode = xmp_data.get('PostalCode', '').lower()
+                
+                    # Clean location data
+                    street = ''.join(c for c in street if c.isalnum()).replace(' ', '')  # Remove all non-alphanumeric chars and spaces
+                    city = ''.join(c for c in city if c.isalnum() or c.isspace()).replace(' ', '_')
+                    zipcode = ''.join(c for c in zipcode if c.isalnum())  # Clean zip code
+                
+                    # Build filename parts
+                    filename_parts = [category]
+                    if street:
+                        filename_parts.append(street)
+                    if city:
+                        filename_parts.append(city)
+                    if zipcode:
+                        filename_parts.append(zipcode)
+                
+                    # Join parts with underscores and add extension
+                    base_filename = '_'.join(filename_parts)
+                    new_filename = f"{base_filename}{image_path.suffix}"
+                    print(f"📝 New filename: {new_filename}")
+                
+                    # Create location-based folder
+                    location_folder = create_location_folder(xmp_data)
+                    print(f"📍 Location folder: {location_folder}")
+                
+                    # Create S3 key (path in S3) - organized by images/location/category/filename
+                    s3_key = f"images/{location_folder}/{category}/{new_filename}"
+                    print(f"📍 S3 key: {s3_key}")
+                
+                    # Upload on the shared upload pool (conditional write guards against races);
+                    # the rename and bookkeeping run here once it finishes
+                    job = {
+                        'image_path': image_path, 'content_hash': content_hash, 'description': description,
+                        'category': category, 'match_scores': match_scores, 'xmp_data': xmp_data,
+                        'location_folder': location_folder, 'near_duplicate_of': near_duplicate_of,
+                        'classified_by': classified_by
+                    }
+                    if journal_entry and ingest_journal.has(content_hash, 'uploaded'):
+                        print(f"☁️  Already uploaded before the interruption: {journal_entry['s3_key']}")
+                        finish_upload(job, journal_entry['s3_key'])
+                    else:
+                        print("☁️  Queued for upload to S3...")
+                        upload_futures[upload_manager.submit(upload_job, job, s3_key)] = job
+
+                except Exception as e:
+                    print(f"❌ Error: {str(e)}")
+                    logging.error(traceback.format_exc())
+                    manifest.mark(str(image_path), 'failed')
+                    failed_count += 1
+                    continue
             
-            # Show progress summary
-            success_count = processed_count - failed_count - skipped_count
-            print(f"\n📊 Progress Summary:")
-            print(f"Processed: {processed_count}/{total_files}")
-            print(f"Successful: {success_count}")
-            print(f"Skipped: {skipped_count}")
-            print(f"Failed: {failed_count}")
-            print(f"Success Rate: {(success_count/processed_count)*100:.1f}%" if processed_count > 0 else "N/A")
-            print("-" * 50)
-
-        # Save results to JSON
-        if results:
-            output_file = folder / 's3_location_processed_images.json'
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
-            print(f"\n💾 Results saved to: {output_file}")
+                # Show progress summary
+                success_count = processed_count - failed_count - skipped_count - len(upload_futures)
+                print(f"\n📊 Progress Summary:")
+                print(f"Processed: {processed_count}/{total_files}")
+                print(f"Successful: {success_count}")
+                print(f"Uploading: {len(upload_futures)}")
+                print(f"Skipped: {skipped_count}")
+                print(f"Failed: {failed_count}")
+                print(f"Success Rate: {(success_count/processed_count)*100:.1f}%" if processed_count > 0 else "N/A")
+                limiter_stats = ollama_limiter.stats()
+                print(f"LLaVA Concurrency Limit: {limiter_stats['limit']:.1f} (in flight: {limiter_stats['in_flight']}, timeouts: {limiter_stats['timeouts']})")
+                print(f"LLaVA Throughput: {limiter_stats['throughput_per_min']:.1f} images/min")
+                average_ttft = ollama_client.average_time_to_first_token()
+                if average_ttft is not None:
+                    print(f"LLaVA Avg Time to First Token: {average_ttft:.2f}s")
+                upload_stats = upload_manager.stats()
+                print(f"S3 Upload Throughput: {upload_stats['mb_per_s']:.1f} MB/s ({upload_stats['files']} files, {upload_stats['mb']:.0f} MB)")
+                print("-" * 50)
+
+            # Wait for the remaining uploads
+            if upload_futures:
+                print(f"\n☁️  Waiting for {len(upload_futures)} uploads to finish...")
+            drain_uploads(wait=True)
+            upload_stats = upload_manager.stats()
+            if upload_stats['files']:
+                print(f"📊 Uploaded {upload_stats['files']} files ({upload_stats['mb']:.0f} MB) in {upload_stats['seconds']:.1f}s "
+                      f"of upload time: {upload_stats['mb_per_s']:.1f} MB/s")
+            print("📊 S3 calls:")
+            for line in s3_metrics.summary_lines():
+                print(f"  {line}")
+
+        # Commit any records still queued for the metadata store
+        if metadata_store is not None:
+            if metadata_store.flush():
+                print(f"🗄️ Metadata store: {metadata_store.written} records written")
+            if metadata_store.unsaved:
+                print(f"⚠️ Metadata store: {metadata_store.unsaved} records not written (still in the results file)")
+
+        results_log.close()
+        stored_count = results_log.written
+        if stored_count:
+            print(f"\n💾 {stored_count} results appended to: {output_file}")
+            # Results are synced to disk now, so their journal entries are finished
+            for content_hash in ingest_journal.renamed_hashes():
+                ingest_journal.complete(content_hash, 'recorded')
+            ingest_journal.compact()
+        manifest.close()
             
         # Final summary
         print(f"\n🎯 Final Results:")
         print(f"Total Images: {total_files}")
-        print(f"Successfully Processed: {len(results)}")
+        print(f"Successfully Processed: {stored_count}")
         print(f"Skipped: {skipped_count}")
         print(f"Failed: {failed_count}")
         if total_files > 0:
-            print(f"Overall Success Rate: {(len(results)/total_files)*100:.1f}%")
+            print(f"Overall Success Rate: {(stored_count/total_files)*100:.1f}%")
 
     except Exception as e:
         print(f"❌ Error during processing: {str(e)}")
         logging.error(traceback.format_exc())
 
-def test_ollama_connection() -> bool:
-    """Check if the Ollama server is running and accessible"""
+def watch_folder(folder_path: str) -> None:
+    """
+    Keep running and process new images as they arrive on the share.
+    Files are processed once they have stopped changing for WATCH_DEBOUNCE seconds.
+    """
+    # Index the tree before the catch-up run so files arriving during it are seen by the watcher
+    watcher = FolderWatcher(folder_path, IMAGE_EXTENSIONS)
+    print("🔄 Catching up on images added since the last run...")
+    process_images_in_folder(folder_path)
+
+    manifest = FileManifest()
+    scanner = IncrementalScanner(manifest, IMAGE_EXTENSIONS)
+
+    def process_batch(files):
+        # Drop files the manifest already has as processed/skipped (e.g. our own renames)
+        new_files = scanner.filter(files)
+        if new_files:
+            print(f"\n📥 {len(new_files)} new image(s) ready at {datetime.datetime.now().strftime('%H:%M:%S')}")
+            process_images_in_folder(folder_path, image_files=new_files)
+
+    print(f"\n👀 Watching {folder_path} for new images (Ctrl+C to stop)...")
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
-        if response.status_code == 200:
-            print("✅ Ollama server is running")
-            return True
-        else:
-            print(f"❌ Unexpected response status: {response.status_code}")
-            return False
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Ollama server connection error: {str(e)}")
-        return False
+        watcher.run(process_batch)
+    finally:
+        manifest.close()
+
+def test_ollama_connection() -> bool:
+    """Check that at least one configured Ollama backend is running and accessible"""
+    return ollama_client.check_health()
 
 def test_s3_connection() -> bool:
     """Test S3 connection and bucket access"""
@@ -867,7 +1147,10 @@ if __name__ == "__main__":
             exit(1)
             
         print("✅ Network connection successful")
-        process_images_in_folder(NETWORK_PATH)
+        if '--watch' in sys.argv[1:]:
+            watch_folder(NETWORK_PATH)
+        else:
+            process_images_in_folder(NETWORK_PATH)
         print("\n✨ S3 Location-Based Processing completed!")
         
     except Exception as e:
@@ -0,0 +1,418 @@
+import os
+import copy
+import json
+import time
+import bisect
+import threading
+from typing import Dict, List, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as S3ConnectionError, HTTPClientError
+from dotenv import load_dotenv
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
+AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+AWS_REGION = os.getenv("AWS_REGION", "us-west-1")
+
+# Attempts per call in adaptive retry mode, which also rate-limits the client after SlowDown/503 throttling
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "5"))
+S3_CONNECT_TIMEOUT = float(os.getenv("S3_CONNECT_TIMEOUT", "5"))
+# Read timeouts per kind of operation: metadata calls (LIST/HEAD/small PUTs) should fail
+# fast, transfers (uploads, multipart parts, server-side copies) need longer
+S3_API_READ_TIMEOUT = float(os.getenv("S3_API_READ_TIMEOUT", "15"))
+S3_TRANSFER_READ_TIMEOUT = float(os.getenv("S3_TRANSFER_READ_TIMEOUT", "120"))
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "10"))
+# The dashboard answers web requests under gunicorn's 30 s worker timeout, so its calls give
+# up quickly (S3_DASHBOARD_MAX_ATTEMPTS retries) and leave the rest to the circuit breaker
+S3_DASHBOARD_CONNECT_TIMEOUT = float(os.getenv("S3_DASHBOARD_CONNECT_TIMEOUT", "2"))
+S3_DASHBOARD_READ_TIMEOUT = float(os.getenv("S3_DASHBOARD_READ_TIMEOUT", "5"))
+S3_DASHBOARD_MAX_ATTEMPTS = int(os.getenv("S3_DASHBOARD_MAX_ATTEMPTS", "1"))
+
+# Connect/read timeouts and retries per kind of client
+CLIENT_KINDS = {
+    'api': {'connect_timeout': S3_CONNECT_TIMEOUT, 'read_timeout': S3_API_READ_TIMEOUT,
+            'retries': {'max_attempts': S3_MAX_ATTEMPTS, 'mode': 'adaptive'}},
+    'transfer': {'connect_timeout': S3_CONNECT_TIMEOUT, 'read_timeout': S3_TRANSFER_READ_TIMEOUT,
+                 'retries': {'max_attempts': S3_MAX_ATTEMPTS, 'mode': 'adaptive'}},
+    # Standard mode: adaptive mode's client-side rate limiter can make calls wait
+    'dashboard': {'connect_timeout': S3_DASHBOARD_CONNECT_TIMEOUT, 'read_timeout': S3_DASHBOARD_READ_TIMEOUT,
+                  'retries': {'max_attempts': S3_DASHBOARD_MAX_ATTEMPTS, 'mode': 'standard'}},
+}
+
+# Client-side token buckets (requests/second, 0 disables): each operation type (HeadObject,
+# PutObject, ...) and each key prefix gets its own bucket. S3 itself allows about 5,500
+# reads and 3,500 writes per second per prefix, shared by every machine using the bucket.
+S3_READ_RATE = float(os.getenv("S3_READ_RATE", "2000"))
+S3_WRITE_RATE = float(os.getenv("S3_WRITE_RATE", "1000"))
+S3_PREFIX_READ_RATE = float(os.getenv("S3_PREFIX_READ_RATE", "500"))
+S3_PREFIX_WRITE_RATE = float(os.getenv("S3_PREFIX_WRITE_RATE", "200"))
+# Identical HEAD/LIST calls already in flight share the first call's response instead of being sent again
+S3_COALESCE = os.getenv("S3_COALESCE", "true").lower() == "true"
+
+# Circuit breaker: after this many consecutive failed calls, or once calls have been failing for
+# S3_BREAKER_FAILURE_SECONDS (one hung call can be enough), S3 is treated as down and calls fail
+# immediately; a background probe retries every S3_BREAKER_PROBE_INTERVAL seconds until one succeeds
+S3_BREAKER_FAILURES = int(os.getenv("S3_BREAKER_FAILURES", "3"))
+S3_BREAKER_FAILURE_SECONDS = float(os.getenv("S3_BREAKER_FAILURE_SECONDS", "10"))
+S3_BREAKER_PROBE_INTERVAL = float(os.getenv("S3_BREAKER_PROBE_INTERVAL", "15"))
+
+READ_OPERATIONS = {'HeadObject', 'GetObject', 'ListObjects', 'ListObjectsV2', 'HeadBucket', 'GetObjectTagging'}
+COALESCED_OPERATIONS = {'HeadObject', 'ListObjects', 'ListObjectsV2', 'HeadBucket'}
+# Request headers that change the response, so calls only coalesce when these match too
+COALESCE_KEY_HEADERS = {
+    'if-match', 'if-none-match', 'if-modified-since', 'if-unmodified-since', 'range',
+    'x-amz-request-payer', 'x-amz-expected-bucket-owner', 'x-amz-checksum-mode',
+}
+COALESCE_KEY_HEADER_PREFIX = 'x-amz-server-side-encryption-customer-'
+
+# Latency histogram bucket upper bounds in milliseconds (the last bucket is everything slower)
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+THROTTLING_CODES = {'SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequests', '503'}
+
+
+class S3Metrics:
+    """
+    Per-operation call counts, errors, retries, throttling and latency histograms,
+    fed by botocore events from every client made by create_s3_client
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations: Dict[str, Dict] = {}
+
+    def _operation(self, name: str) -> Dict:
+        entry = self._operations.get(name)
+        if entry is None:
+            entry = {'calls': 0, 'errors': 0, 'retries': 0, 'throttled': 0, 'coalesced': 0,
+                     'rate_limited': 0, 'rate_limited_seconds': 0.0, 'seconds': 0.0,
+                     'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+            self._operations[name] = entry
+        return entry
+
+    def attach(self, client) -> None:
+        events = client.meta.events
+        events.register('before-call.s3', self._before_call)
+        events.register('after-call.s3', self._after_call)
+        events.register('after-call-error.s3', self._after_call_error)
+        events.register('needs-retry.s3', self._needs_retry)
+
+    def _before_call(self, model=None, context=None, **kwargs) -> None:
+        if context is not None:
+            context['metrics_started'] = time.perf_counter()
+            # after-call-error does not receive the operation model
+            context['metrics_operation'] = model.name if model else 'Unknown'
+
+    def _after_call(self, model=None, parsed=None, context=None, **kwargs) -> None:
+        parsed = parsed or {}
+        error_code = parsed.get('Error', {}).get('Code')
+        retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        self._record(model.name if model else 'Unknown', context, bool(error_code), retries)
+
+    def _after_call_error(self, context=None, **kwargs) -> None:
+        operation = (context or {}).get('metrics_operation', 'Unknown')
+        self._record(operation, context, True, 0)
+
+    def _needs_retry(self, response=None, operation=None, **kwargs) -> None:
+        # Every attempt's response passes through here, so throttled attempts that were retried count too.
+        # Returns None so the retry handler still decides whether to retry.
+        if not response or operation is None:
+            return None
+        error_code = response[1].get('Error', {}).get('Code')
+        if error_code in THROTTLING_CODES:
+            with self._lock:
+                self._operation(operation.name)['throttled'] += 1
+        return None
+
+    def _record(self, operation: str, context: Optional[Dict], error: bool, retries: int) -> None:
+        started = (context or {}).get('metrics_started')
+        seconds = time.perf_counter() - started if started is not None else 0.0
+        with self._lock:
+            entry = self._operation(operation)
+            entry['calls'] += 1
+            entry['errors'] += error
+            entry['retries'] += retries
+            entry['seconds'] += seconds
+            entry['buckets'][bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+
+    def count(self, operation: str, field: str, amount: float = 1) -> None:
+        with self._lock:
+            self._operation(operation)[field] += amount
+
+    @staticmethod
+    def _percentile(buckets: List[int], fraction: float) -> Optional[float]:
+        """Upper bound (ms) of the bucket holding the given fraction of calls"""
+        total = sum(buckets)
+        if not total:
+            return None
+        running = 0
+        for index, count in enumerate(buckets):
+            running += count
+            if running >= fraction * total:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else float('inf')
+        return None
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """operation -> counters, average latency, p50/p95 bucket bounds and the histogram"""
+        with self._lock:
+            operations = {name: dict(entry, buckets=list(entry['buckets'])) for name, entry in self._operations.items()}
+        for entry in operations.values():
+            entry['avg_ms'] = entry['seconds'] * 1000 / entry['calls'] if entry['calls'] else 0.0
+            entry['p50_ms'] = self._percentile(entry['buckets'], 0.5)
+            entry['p95_ms'] = self._percentile(entry['buckets'], 0.95)
+            entry['histogram'] = dict(zip([f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"],
+                                          entry.pop('buckets')))
+        return operations
+
+    def summary_lines(self) -> List[str]:
+        lines = []
+        for name, entry in sorted(self.snapshot().items(), key=lambda item: -item[1]['calls']):
+            lines.append(f"{name}: {entry['calls']} calls, {entry['errors']} errors, {entry['retries']} retries, "
+                         f"{entry['throttled']} throttled, {entry['coalesced']} coalesced, "
+                         f"{entry['rate_limited_seconds']:.1f}s rate-limited, avg {entry['avg_ms']:.0f}ms, p95 <= {entry['p95_ms']}ms")
+        return lines
+
+
+# Shared by every client, so the dashboard and the pipeline each see all of their S3 traffic
+s3_metrics = S3Metrics()
+
+
+class TokenBucket:
+    """Refills at rate tokens/second up to burst; callers that find it empty sleep for their turn"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token; returns the seconds slept waiting for it"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve the token now (going negative queues callers in order)
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+def request_prefix(params: Dict) -> str:
+    """Key prefix a request targets: the key's folder, or the Prefix of a LIST"""
+    if 'Key' in params:
+        key = params['Key']
+        return key.rsplit('/', 1)[0] + '/' if '/' in key else ''
+    return params.get('Prefix', '')
+
+
+class RequestGate:
+    """
+    Runs before every S3 call: identical HEAD/LIST calls already in flight wait for that
+    call's response (singleflight) instead of being sent; everything else takes a token from
+    its operation's bucket and from its (read/write, bucket, prefix) bucket first.
+    """
+
+    def __init__(self, metrics: S3Metrics, coalesce: bool = S3_COALESCE):
+        self.metrics = metrics
+        self.coalesce = coalesce
+        self._lock = threading.Lock()
+        self._buckets: Dict[tuple, TokenBucket] = {}
+        self._in_flight: Dict[tuple, Dict] = {}
+
+    def attach(self, client) -> None:
+        events = client.meta.events
+        events.register('before-parameter-build.s3', self._remember_prefix)
+        events.register('before-call.s3', self._before_call)
+        events.register('after-call.s3', self._after_call)
+        events.register('after-call-error.s3', self._after_call_error)
+
+    def _bucket(self, key: tuple, rate: float) -> Optional[TokenBucket]:
+        if rate <= 0:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate)
+            return bucket
+
+    def _remember_prefix(self, params=None, context=None, **kwargs) -> None:
+        if context is not None and params is not None:
+            context['gate_scope'] = (params.get('Bucket', ''), request_prefix(params))
+
+    def _before_call(self, model=None, params=None, context=None, **kwargs):
+        operation = model.name
+        if self.coalesce and operation in COALESCED_OPERATIONS:
+            headers = tuple(sorted(
+                (name.lower(), str(value)) for name, value in (params.get('headers') or {}).items()
+                if name.lower() in COALESCE_KEY_HEADERS or name.lower().startswith(COALESCE_KEY_HEADER_PREFIX)))
+            key = (operation, params.get('method'), params.get('url'),
+                   json.dumps(params.get('query_string') or {}, sort_keys=True, default=str), headers)
+            with self._lock:
+                leader = self._in_flight.get(key)
+                if leader is None:
+                    self._in_flight[key] = {'done': threading.Event(), 'response': None}
+                    context['gate_leader_of'] = key
+            if leader is not None:
+                leader['done'].wait(timeout=S3_API_READ_TIMEOUT * S3_MAX_ATTEMPTS)
+                if leader['response'] is not None:
+                    self.metrics.count(operation, 'coalesced')
+                    http, parsed = leader['response']
+                    return http, copy.deepcopy(parsed)
+                # The shared call failed without a response: make our own
+
+        is_read = operation in READ_OPERATIONS
+        bucket_name, prefix = context.get('gate_scope', ('', ''))
+        waited = 0.0
+        for bucket in (self._bucket(('operation', operation), S3_READ_RATE if is_read else S3_WRITE_RATE),
+                       self._bucket(('prefix', is_read, bucket_name, prefix), S3_PREFIX_READ_RATE if is_read else S3_PREFIX_WRITE_RATE)):
+            if bucket is not None:
+                waited += bucket.acquire()
+        if waited:
+            self.metrics.count(operation, 'rate_limited')
+            self.metrics.count(operation, 'rate_limited_seconds', waited)
+        return None
+
+    def _finish(self, context: Optional[Dict], response) -> None:
+        key = (context or {}).pop('gate_leader_of', None)
+        if key is None:
+            return
+        with self._lock:
+            leader = self._in_flight.pop(key, None)
+        if leader is not None:
+            leader['response'] = response
+            leader['done'].set()
+
+    def _after_call(self, http_response=None, parsed=None, context=None, **kwargs) -> None:
+        self._finish(context, (http_response, copy.deepcopy(parsed)))
+
+    def _after_call_error(self, context=None, **kwargs) -> None:
+        self._finish(context, None)
+
+
+# Shared by every client, so limits apply to all of the process's S3 traffic
+s3_gate = RequestGate(s3_metrics)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling S3 while the circuit breaker is open"""
+
+
+def is_outage(error: Exception) -> bool:
+    """Whether an error means S3 is unreachable or failing (not e.g. a missing key or denied access)"""
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        return status >= 500 or code in THROTTLING_CODES
+    return isinstance(error, (S3ConnectionError, HTTPClientError))
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through and consecutive outage errors are counted. Open (after
+    failure_threshold of them, or once they have gone on for failure_seconds counted from the
+    start of the first failed call): calls raise CircuitOpenError at once instead of waiting
+    out timeouts and retries, and a background thread runs probe every probe_interval seconds.
+    The first probe that succeeds closes the breaker again.
+    """
+
+    def __init__(self, probe, failure_threshold: int = S3_BREAKER_FAILURES,
+                 failure_seconds: float = S3_BREAKER_FAILURE_SECONDS,
+                 probe_interval: float = S3_BREAKER_PROBE_INTERVAL):
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.failure_seconds = failure_seconds
+        self.probe_interval = probe_interval
+        self.state = 'closed'
+        self.failures = 0
+        self.failing_since = None
+        self.opened_at = None
+        self.last_error = None
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def call(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.state == 'open':
+                self.rejected += 1
+                raise CircuitOpenError(f"S3 unavailable, retrying in the background: {self.last_error}")
+        started = time.time()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if is_outage(e):
+                self._failed(e, started)
+            raise
+        with self._lock:
+            self.failures = 0
+            self.failing_since = None
+        return result
+
+    def _failed(self, error: Exception, started: float) -> None:
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if self.failing_since is None:
+                self.failing_since = started
+            failing_for = time.time() - self.failing_since
+            if self.state == 'open' or (self.failures < self.failure_threshold and failing_for < self.failure_seconds):
+                return
+            self.state = 'open'
+            self.opened_at = time.time()
+        print(f"⚠️ S3 circuit breaker open after {self.failures} failures in {failing_for:.0f}s: {error}")
+        threading.Thread(target=self._probe_until_recovered, name='s3-breaker-probe', daemon=True).start()
+
+    def _probe_until_recovered(self) -> None:
+        while True:
+            time.sleep(self.probe_interval)
+            try:
+                self.probe()
+            except Exception as e:
+                with self._lock:
+                    self.last_error = str(e)
+                continue
+            with self._lock:
+                self.state = 'closed'
+                self.failures = 0
+                self.failing_since = None
+                outage = time.time() - self.opened_at
+            print(f"✅ S3 reachable again after {outage:.0f}s, circuit breaker closed")
+            return
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'open_seconds': time.time() - self.opened_at if self.state == 'open' else 0.0,
+                'rejected_calls': self.rejected,
+                'last_error': self.last_error,
+            }
+
+
+def create_s3_client(kind: str = 'api', max_pool_connections: int = S3_MAX_POOL_CONNECTIONS):
+    """
+    S3 client with a connection pool sized for the caller's concurrency and the timeouts and
+    retries for its kind of operations ('api', 'transfer', or 'dashboard' for web requests).
+    Calls go through the shared rate limits and request coalescing and are counted in s3_metrics.
+    """
+    client = boto3.client(
+        's3',
+        aws_access_key_id=AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+        region_name=AWS_REGION,
+        config=Config(
+            max_pool_connections=max_pool_connections,
+            **CLIENT_KINDS[kind]
+        )
+    )
+    s3_metrics.attach(client)
+    s3_gate.attach(client)
+    return client
@@ -0,0 +1,106 @@
+import re
+import threading
+from typing import Dict, Tuple
+
+
+def split_key(s3_key: str) -> Tuple[str, str, str]:
+    """Split 'path/name.ext' into ('path', 'name', '.ext'); path and extension may be empty"""
+    key_parts = s3_key.rsplit('/', 1)
+    if len(key_parts) == 1:
+        path, filename_with_ext = "", key_parts[0]
+    else:
+        path, filename_with_ext = key_parts
+
+    name_parts = filename_with_ext.rsplit('.', 1)
+    if len(name_parts) == 1:
+        return path, name_parts[0], ""
+    return path, name_parts[0], "." + name_parts[1]
+
+
+def suffixed_key(s3_key: str, counter: int) -> str:
+    """'path/name.ext' -> 'path/name_<counter>.ext' (counter 0 returns the key unchanged)"""
+    if counter == 0:
+        return s3_key
+    path, base_name, extension = split_key(s3_key)
+    new_filename = f"{base_name}_{counter}{extension}"
+    return f"{path}/{new_filename}" if path else new_filename
+
+
+class S3KeyAllocator:
+    """
+    Hands out unique S3 keys without probing each candidate with head_object.
+
+    The first claim under a prefix (images/<location>/<category>/) lists that prefix once;
+    the listing is cached for the rest of the run and every claimed key is added to it,
+    so later claims are resolved in memory. Listed ETags and sizes are kept for callers
+    that want to compare content.
+    """
+
+    def __init__(self, s3_client, bucket: str, max_suffix: int = 1000):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.max_suffix = max_suffix
+        self._prefixes: Dict[str, Dict[str, Dict]] = {}  # prefix -> {key: {'etag', 'size', 'reserved'}}
+        self._lock = threading.Lock()
+        self._prefix_locks: Dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def prefix_of(s3_key: str) -> str:
+        return s3_key.rsplit('/', 1)[0] + '/' if '/' in s3_key else ''
+
+    def _prefix_lock(self, prefix: str) -> threading.Lock:
+        with self._lock:
+            return self._prefix_locks.setdefault(prefix, threading.Lock())
+
+    def _list_prefix(self, prefix: str) -> Dict[str, Dict]:
+        objects = {}
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                objects[obj['Key']] = {'etag': obj.get('ETag', '').strip('"'), 'size': obj.get('Size', 0), 'reserved': False}
+        return objects
+
+    def existing(self, prefix: str) -> Dict[str, Dict]:
+        """Known keys under a prefix, listing it on first use"""
+        with self._prefix_lock(prefix):
+            if prefix not in self._prefixes:
+                self._prefixes[prefix] = self._list_prefix(prefix)
+                print(f"📋 Listed {len(self._prefixes[prefix])} existing objects under {prefix}")
+            return self._prefixes[prefix]
+
+    def claim(self, base_s3_key: str) -> str:
+        """Reserve and return base_s3_key, or the first free base_N variant"""
+        prefix = self.prefix_of(base_s3_key)
+        known = self.existing(prefix)
+        with self._prefix_lock(prefix):
+            for counter in range(self.max_suffix + 1):
+                candidate = suffixed_key(base_s3_key, counter)
+                if candidate not in known:
+                    known[candidate] = {'etag': None, 'size': None, 'reserved': True}
+                    return candidate
+        raise Exception(f"Could not generate unique filename after {self.max_suffix} attempts for base key: {base_s3_key}")
+
+    def variants(self, base_s3_key: str) -> Dict[str, Dict]:
+        """Known objects stored at base_s3_key or one of its base_N variants (excluding reservations)"""
+        prefix = self.prefix_of(base_s3_key)
+        known = self.existing(prefix)
+        _, base_name, extension = split_key(base_s3_key)
+        pattern = re.compile(re.escape(base_name) + r'(_\d+)?' + re.escape(extension))
+        with self._prefix_lock(prefix):
+            return {key: dict(entry) for key, entry in known.items()
+                    if not entry.get('reserved') and pattern.fullmatch(key[len(prefix):])}
+
+    def mark_taken(self, s3_key: str, etag: str = None, size: int = None) -> None:
+        """Record a key as occupied - uploaded by us, or created first by another uploader"""
+        prefix = self.prefix_of(s3_key)
+        known = self.existing(prefix)
+        with self._prefix_lock(prefix):
+            known[s3_key] = {'etag': etag, 'size': size, 'reserved': False}
+
+    def release(self, s3_key: str) -> None:
+        """Give back a reserved key whose upload did not happen"""
+        prefix = self.prefix_of(s3_key)
+        with self._prefix_lock(prefix):
+            entry = self._prefixes.get(prefix, {}).get(s3_key)
+            if entry is not None and entry.get('reserved'):
+                del self._prefixes[prefix][s3_key]
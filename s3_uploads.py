@@ -0,0 +1,173 @@
+import os
+import math
+import hashlib
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict
+
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from dotenv import load_dotenv
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+MB = 1024 * 1024
+
+# Files at least this large are split into parts uploaded in parallel
+S3_MULTIPART_THRESHOLD_MB = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "16"))
+S3_MULTIPART_CHUNKSIZE_MB = int(os.getenv("S3_MULTIPART_CHUNKSIZE_MB", "8"))
+# Parts in flight across all multipart uploads, and whole files uploaded at once
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "10"))
+S3_UPLOAD_WORKERS = int(os.getenv("S3_UPLOAD_WORKERS", "8"))
+
+# Connections the transfer client needs so uploads never wait for a pooled connection
+# (file workers + part workers, plus a few spare)
+UPLOAD_POOL_CONNECTIONS = S3_UPLOAD_WORKERS + S3_MAX_CONCURRENCY + 4
+
+transfer_config = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD_MB * MB,
+    multipart_chunksize=S3_MULTIPART_CHUNKSIZE_MB * MB,
+    max_concurrency=S3_MAX_CONCURRENCY,
+    use_threads=True
+)
+
+
+def part_size(size: int, chunk_size: int) -> int:
+    """Part size for a multipart upload of size bytes (S3 allows at most 10,000 parts)"""
+    return max(chunk_size, math.ceil(size / 10000))
+
+
+def local_etag(path: str, multipart_threshold: int, chunk_size: int) -> str:
+    """
+    The ETag S3 reports for this file uploaded with these settings: the MD5 for a single PUT,
+    or the MD5 of the part MD5s followed by -<parts> for a multipart upload
+    """
+    size = os.path.getsize(path)
+    chunk_size = part_size(size, chunk_size) if size >= multipart_threshold else 1024 * 1024
+    part_digests = []
+    whole = hashlib.md5()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            if size >= multipart_threshold:
+                part_digests.append(hashlib.md5(chunk).digest())
+            else:
+                whole.update(chunk)
+    if size < multipart_threshold:
+        return whole.hexdigest()
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+class UploadManager:
+    """
+    Shared upload subsystem: whole files are uploaded concurrently on a worker pool, and
+    files above the multipart threshold are split into parts that share one part pool.
+
+    Conditional writes (IfNoneMatch) are not supported by the boto3 transfer manager, so
+    those uploads run the multipart steps directly and send the condition with
+    CompleteMultipartUpload; unconditional uploads go through the shared transfer manager.
+    Bytes and busy time are tracked for aggregate MB/s.
+    """
+
+    def __init__(self, s3_client, bucket: str, config: TransferConfig = transfer_config,
+                 max_workers: int = S3_UPLOAD_WORKERS):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.config = config
+        self.max_workers = max_workers
+        self.transfer_manager = create_transfer_manager(s3_client, config)
+        self._files = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='s3-upload')
+        self._parts = ThreadPoolExecutor(max_workers=config.max_concurrency, thread_name_prefix='s3-part')
+        self._lock = threading.Lock()
+        self._active = 0
+        self._busy_since = None
+        self._busy_seconds = 0.0
+        self.files = 0
+        self.bytes = 0
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Run an upload job (e.g. upload_with_unique_key) on the file worker pool"""
+        return self._files.submit(fn, *args, **kwargs)
+
+    def upload(self, local_path: str, s3_key: str, extra_args: Dict, if_none_match: bool = False) -> None:
+        """Upload one file; raises ClientError on failure (PreconditionFailed if the key exists and if_none_match)"""
+        size = os.path.getsize(local_path)
+        uploaded = 0
+        self._started()
+        try:
+            if if_none_match and size >= self.config.multipart_threshold:
+                self._conditional_multipart(local_path, s3_key, extra_args, size)
+            elif if_none_match:
+                with open(local_path, 'rb') as file:
+                    self.s3_client.put_object(Body=file, Bucket=self.bucket, Key=s3_key, IfNoneMatch='*', **extra_args)
+            else:
+                self.transfer_manager.upload(local_path, self.bucket, s3_key, extra_args=extra_args).result()
+            uploaded = size
+        finally:
+            self._finished(uploaded)
+
+    def expected_etag(self, local_path: str) -> str:
+        """ETag the file would get when uploaded by this manager"""
+        return local_etag(local_path, self.config.multipart_threshold, self.config.multipart_chunksize)
+
+    def _conditional_multipart(self, local_path: str, s3_key: str, extra_args: Dict, size: int) -> None:
+        chunk_size = part_size(size, self.config.multipart_chunksize)
+        upload_id = self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=s3_key, **extra_args)['UploadId']
+
+        def upload_part(part_number: int) -> Dict:
+            with open(local_path, 'rb') as file:
+                file.seek((part_number - 1) * chunk_size)
+                body = file.read(chunk_size)
+            response = self.s3_client.upload_part(
+                Bucket=self.bucket, Key=s3_key, UploadId=upload_id, PartNumber=part_number, Body=body
+            )
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+        try:
+            part_count = math.ceil(size / chunk_size)
+            futures = [self._parts.submit(upload_part, number) for number in range(1, part_count + 1)]
+            parts = [future.result() for future in futures]
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket, Key=s3_key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts}, IfNoneMatch='*'
+            )
+        except Exception:
+            try:
+                self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=s3_key, UploadId=upload_id)
+            except Exception as e:
+                print(f"⚠️ Could not abort multipart upload of {s3_key}: {e}")
+            raise
+
+    def _started(self) -> None:
+        with self._lock:
+            if self._active == 0:
+                self._busy_since = time.time()
+            self._active += 1
+
+    def _finished(self, size: int) -> None:
+        with self._lock:
+            self._active -= 1
+            if size:
+                self.files += 1
+                self.bytes += size
+            if self._active == 0:
+                self._busy_seconds += time.time() - self._busy_since
+
+    def stats(self) -> Dict:
+        """Files and bytes uploaded, seconds with at least one upload running, and aggregate MB/s"""
+        with self._lock:
+            seconds = self._busy_seconds + (time.time() - self._busy_since if self._active else 0)
+            return {
+                'files': self.files,
+                'mb': self.bytes / MB,
+                'seconds': seconds,
+                'mb_per_s': self.bytes / MB / seconds if seconds > 0 else 0.0,
+            }
+
+    def close(self, wait: bool = True) -> None:
+        self._files.shutdown(wait=wait)
+        self._parts.shutdown(wait=wait)
+        self.transfer_manager.shutdown()
@@ -0,0 +1,142 @@
+import os
+import time
+import threading
+from typing import Dict, Iterable, List, Set
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+# Rows are written once this many are buffered, or after this many seconds, whichever comes first
+SUPABASE_BATCH_SIZE = int(os.getenv("SUPABASE_BATCH_SIZE", "50"))
+SUPABASE_FLUSH_INTERVAL = float(os.getenv("SUPABASE_FLUSH_INTERVAL", "10"))
+
+
+class BufferedUpsertWriter:
+    """
+    Buffers rows and writes them with batched upserts instead of one insert per image.
+
+    A background thread flushes on time, so rows do not sit in memory while LLaVA
+    works on a slow image. Upserts on the conflict column (image_file) make a retried
+    batch idempotent: rows that already made it in are updated, not duplicated.
+    Ids returned by Supabase are written back into the buffered row dicts.
+    """
+
+    def __init__(self, client, table: str = 'images', on_conflict: str = 'image_file',
+                 batch_size: int = SUPABASE_BATCH_SIZE, flush_interval: float = SUPABASE_FLUSH_INTERVAL,
+                 max_retries: int = 3):
+        self.client = client
+        self.table = table
+        self.on_conflict = on_conflict
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+
+        self.written = 0
+        self.failed: List[Dict] = []
+        self._buffer: List[Dict] = []
+        self._last_flush = time.time()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # One batch in flight at a time
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+
+    def add(self, row: Dict) -> None:
+        """Queue a row; writes a batch when the buffer is full"""
+        with self._cond:
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def _flush_periodically(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait(timeout=self.flush_interval)
+                if self._closed:
+                    return
+                due = bool(self._buffer) and time.time() - self._last_flush >= self.flush_interval
+            if due:
+                self.flush()
+
+    def flush(self) -> bool:
+        """Write everything buffered; returns False if a batch failed after all retries"""
+        with self._write_lock:
+            with self._cond:
+                batch, self._buffer = self._buffer, []
+                self._last_flush = time.time()
+            if not batch:
+                return True
+
+            for attempt in range(1, self.max_retries + 1):
+                try:
+                    result = self.client.table(self.table).upsert(batch, on_conflict=self.on_conflict).execute()
+                    returned = {row.get(self.on_conflict): row for row in (result.data or [])}
+                    for row in batch:
+                        stored = returned.get(row.get(self.on_conflict))
+                        if stored and 'id' in stored:
+                            row['id'] = stored['id']
+                    self.written += len(batch)
+                    print(f"🗄️ Wrote {len(batch)} rows to Supabase ({self.written} this run)")
+                    return True
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        print(f"❌ Supabase batch of {len(batch)} rows failed after {attempt} attempts: {e}")
+                        self.failed.extend(batch)
+                        return False
+                    delay = 2 ** attempt
+                    print(f"⚠️ Supabase batch failed ({e}), retrying in {delay}s...")
+                    time.sleep(delay)
+        return False
+
+    def close(self) -> bool:
+        """Stop the background flusher and write whatever is left"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._flusher.join()
+        return self.flush()
+
+
+class ArchiveIndex:
+    """
+    Answers "is this image_file already in the table?" with targeted `in` queries
+    for the candidate names only, instead of downloading every image_file up front.
+    Answers are cached, and names written during the run are added as they are used.
+    """
+
+    def __init__(self, client, table: str = 'images', column: str = 'image_file', chunk_size: int = 100):
+        self.client = client
+        self.table = table
+        self.column = column
+        self.chunk_size = chunk_size
+        self.queries = 0
+        self._present: Set[str] = set()
+        self._absent: Set[str] = set()
+
+    def prefetch(self, names: Iterable[str]) -> None:
+        """Look up all unknown names, chunk_size per query"""
+        unknown = [name for name in dict.fromkeys(names) if name not in self._present and name not in self._absent]
+        for start in range(0, len(unknown), self.chunk_size):
+            chunk = unknown[start:start + self.chunk_size]
+            result = self.client.table(self.table).select(self.column).in_(self.column, chunk).execute()
+            self.queries += 1
+            found = {row[self.column] for row in result.data}
+            self._present.update(found)
+            self._absent.update(name for name in chunk if name not in found)
+
+    def __contains__(self, name: str) -> bool:
+        if name not in self._present and name not in self._absent:
+            self.prefetch([name])
+        return name in self._present
+
+    def add(self, name: str) -> None:
+        self._absent.discard(name)
+        self._present.add(name)
+
+    def discard(self, name: str) -> None:
+        """Forget a name that was used but never written (looked up again if asked)"""
+        self._present.discard(name)
+        self._absent.discard(name)
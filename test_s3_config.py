@@ -24,21 +24,19 @@ print("\n✅ All variables loaded successfully!" if all([network_path, s3_bucket
 
 # Test S3 connection
 try:
-    import boto3
     from botocore.exceptions import ClientError
+    from s3_access import create_s3_client, s3_metrics
     
     print("\n🔗 Testing S3 Connection...")
     
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=aws_key,
-        aws_secret_access_key=aws_secret,
-        region_name=aws_region
-    )
+    # Same client settings as the dashboard and the pipeline
+    s3_client = create_s3_client()
     
     # Test bucket access
     s3_client.head_bucket(Bucket=s3_bucket)
     print(f"✅ Successfully connected to S3 bucket: {s3_bucket}")
+    for line in s3_metrics.summary_lines():
+        print(f"📊 {line}")
     
 except ImportError:
     print("❌ boto3 not installed. Run: pip install boto3")
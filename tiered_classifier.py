@@ -0,0 +1,178 @@
+import os
+import sys
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+
+from results_log import merge_results, results_path as default_results_path
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+# Trained model (created with `python tiered_classifier.py train`); without it every image goes to LLaVA
+LOCAL_CLASSIFIER_MODEL = os.getenv("LOCAL_CLASSIFIER_MODEL", "classifier_model.npz")
+# Share of the k nearest neighbours that must agree before LLaVA is skipped
+LOCAL_CLASSIFIER_CONFIDENCE = float(os.getenv("LOCAL_CLASSIFIER_CONFIDENCE", "0.85"))
+LOCAL_CLASSIFIER_K = int(os.getenv("LOCAL_CLASSIFIER_K", "9"))
+
+FEATURE_SIZE = 64  # Images are reduced to FEATURE_SIZE x FEATURE_SIZE before feature extraction
+
+
+def image_features(image_path: str) -> Optional[np.ndarray]:
+    """
+    Colour and texture features from a small thumbnail:
+    an HSV colour histogram, gradient magnitude and orientation histograms,
+    and overall brightness/contrast/saturation
+    """
+    try:
+        with Image.open(image_path) as img:
+            img.draft('RGB', (FEATURE_SIZE * 4, FEATURE_SIZE * 4))
+            img = img.convert('RGB').resize((FEATURE_SIZE, FEATURE_SIZE), Image.BILINEAR)
+            hsv = np.asarray(img.convert('HSV'), dtype=np.float32) / 255.0
+            grey = np.asarray(img.convert('L'), dtype=np.float32) / 255.0
+    except Exception as e:
+        print(f"⚠️ Could not extract features from {image_path}: {e}")
+        return None
+
+    # Colour: 8 hue x 3 saturation x 3 value bins
+    colour, _ = np.histogramdd(hsv.reshape(-1, 3), bins=(8, 3, 3), range=((0, 1), (0, 1), (0, 1)))
+    colour = colour.ravel() / colour.sum()
+
+    # Texture: how much edge there is, how strong, and in which directions
+    gx = np.diff(grey, axis=1)[:-1, :]
+    gy = np.diff(grey, axis=0)[:, :-1]
+    magnitude = np.hypot(gx, gy)
+    orientation = np.mod(np.arctan2(gy, gx), np.pi)
+    magnitude_hist, _ = np.histogram(magnitude, bins=8, range=(0, 0.5))
+    orientation_hist, _ = np.histogram(orientation, bins=8, range=(0, np.pi), weights=magnitude)
+    magnitude_hist = magnitude_hist / magnitude_hist.sum()
+    orientation_hist = orientation_hist / max(orientation_hist.sum(), 1e-9)
+
+    summary = np.array([grey.mean(), grey.std(), hsv[..., 1].mean(), magnitude.mean()])
+    return np.concatenate([colour, magnitude_hist, orientation_hist, summary]).astype(np.float32)
+
+
+class KNNClassifier:
+    """
+    k-nearest-neighbours over standardized image features.
+    Confidence is the share of the k neighbours voting for the predicted category.
+    """
+
+    def __init__(self, k: int = LOCAL_CLASSIFIER_K):
+        self.k = k
+        self.features: Optional[np.ndarray] = None
+        self.labels: Optional[np.ndarray] = None
+        self.categories: List[str] = []
+        self.mean: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+
+    def fit(self, features: np.ndarray, categories: List[str]) -> 'KNNClassifier':
+        self.categories = sorted(set(categories))
+        category_ids = {category: index for index, category in enumerate(self.categories)}
+        self.labels = np.array([category_ids[category] for category in categories], dtype=np.int32)
+        self.mean = features.mean(axis=0)
+        self.scale = features.std(axis=0) + 1e-6
+        self.features = (features - self.mean) / self.scale
+        return self
+
+    def predict(self, features: np.ndarray) -> Tuple[str, float]:
+        """(category, confidence) for one feature vector"""
+        x = (features - self.mean) / self.scale
+        distances = np.sum((self.features - x) ** 2, axis=1)
+        k = min(self.k, len(distances))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        votes = np.bincount(self.labels[nearest], minlength=len(self.categories))
+        best = int(votes.argmax())
+        return self.categories[best], float(votes[best]) / k
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, features=self.features, labels=self.labels, categories=np.array(self.categories),
+                            mean=self.mean, scale=self.scale, k=np.array([self.k]))
+
+    @classmethod
+    def load(cls, path: str = LOCAL_CLASSIFIER_MODEL) -> Optional['KNNClassifier']:
+        """Load a trained model, or None if there is none yet"""
+        if not Path(path).exists():
+            return None
+        try:
+            data = np.load(path)
+            model = cls(int(data['k'][0]))
+            model.features, model.labels = data['features'], data['labels']
+            model.categories = [str(category) for category in data['categories']]
+            model.mean, model.scale = data['mean'], data['scale']
+        except Exception as e:
+            print(f"⚠️ Could not load local classifier {path}: {e}")
+            return None
+        print(f"🧮 Local classifier loaded: {len(model.labels)} examples, {len(model.categories)} categories")
+        return model
+
+
+def load_training_examples(results_path: str) -> List[Tuple[str, str]]:
+    """(local image path, category) pairs for images LLaVA described in earlier runs"""
+    examples = []
+    for item in merge_results([results_path]):
+        processing_info = item.get('metadata', {}).get('processing_info', {})
+        # Learn only from LLaVA-labelled images, not from earlier classifier guesses
+        if item.get('classified_by') or not processing_info.get('has_description'):
+            continue
+        local_file = item.get('local_file')
+        if local_file and item.get('category') and Path(local_file).exists():
+            examples.append((local_file, item['category']))
+    return examples
+
+
+def train(results_path: str, output_path: str = LOCAL_CLASSIFIER_MODEL, k: int = LOCAL_CLASSIFIER_K,
+          confidence: float = LOCAL_CLASSIFIER_CONFIDENCE, max_workers: int = 8) -> bool:
+    examples = load_training_examples(results_path)
+    print(f"📄 {len(examples)} labelled images found in {results_path}")
+    if len(examples) < k * 2:
+        print(f"❌ Need at least {k * 2} labelled images to train")
+        return False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        features = list(executor.map(image_features, [path for path, _ in examples]))
+    kept = [(vector, category) for vector, (_, category) in zip(features, examples) if vector is not None]
+    X = np.stack([vector for vector, _ in kept])
+    y = [category for _, category in kept]
+
+    # Hold out every fifth image to estimate how often confident predictions are right
+    holdout = np.arange(len(y)) % 5 == 0
+    model = KNNClassifier(k).fit(X[~holdout], [c for c, h in zip(y, holdout) if not h])
+    confident = correct = 0
+    for vector, category in zip(X[holdout], [c for c, h in zip(y, holdout) if h]):
+        predicted, score = model.predict(vector)
+        if score >= confidence:
+            confident += 1
+            correct += predicted == category
+    evaluated = int(holdout.sum())
+    print(f"📊 Held-out images: {evaluated}, confident: {confident} ({confident / max(evaluated, 1) * 100:.1f}% would skip LLaVA), "
+          f"accuracy when confident: {correct / max(confident, 1) * 100:.1f}%")
+
+    KNNClassifier(k).fit(X, y).save(output_path)
+    print(f"💾 Model with {len(y)} examples saved to: {output_path}")
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the local classifier that lets confident images skip LLaVA")
+    parser.add_argument('command', choices=['train'])
+    parser.add_argument('--results', help="Results file (default: NETWORK_PATH/s3_location_processed_images.ndjson)")
+    parser.add_argument('--output', default=LOCAL_CLASSIFIER_MODEL)
+    parser.add_argument('--k', type=int, default=LOCAL_CLASSIFIER_K)
+    args = parser.parse_args()
+
+    results_path = args.results or str(default_results_path(os.getenv("NETWORK_PATH", ".")))
+    if not Path(results_path).exists():
+        print(f"❌ Results file not found: {results_path}")
+        sys.exit(1)
+    if not train(results_path, args.output, args.k):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()